@@ -1,31 +1,100 @@
 import os
 import tempfile
 import shutil
-import pandas as pd
 from fastapi import FastAPI, Request, File, UploadFile, Form
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, RedirectResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 import io
-from typing import List
-from weasyprint import HTML, CSS
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 # Import your processing functions and config
-from src.utils import extract_text_from_pdf, calculate_similarities, create_dataframe
-from src.summarizer import summarize_cv
-from src.gemini_embedding import embed_multiple_documents
-from src.config import ALLOWED_EXTENSIONS, DATA_COLUMNS, MAX_FILE_SIZE_MB
+from src.utils import parse_summaries, summary_html, summary_text
+from src.pipeline import RANKING_MODES, build_result_set, cv_id_from_hash, rank_uploaded_cvs, summarize_first_page, summarize_rows, summarize_shown_rows
+from src.result_store import RESULT_SORTS, RankedResults, RankedRow, SummaryPlaceholders, result_store
+from src.render import iter_csv, iter_ndjson, json_records, rows_from_records
+from src.reports import render_pdf_report_async, shutdown_report_pool
+from src.jobs import job_manager, JobFailedError, QueueFullError, DONE, FAILED
+from src.extraction import extract_texts_from_pdfs, shutdown_extraction_pool
+from src.summarizer import summarize_cvs, is_failed_summary
+from src.gemini_embedding import embed_multiple_documents, shutdown_embedding_pool
+from src.cache import get_cache
+from src.talent_pool import get_talent_pool
+from src.rate_limit import gemini_limiter
+from src.metrics import observe_stage, render_metrics, install_trace_id_logging, new_trace_id, trace_id_var
+from src.providers import get_summary_provider, get_embedding_provider
+from src.uploads import ByteBudget, UploadTooLargeError, save_upload
+from src.archives import ArchiveError, list_pdf_members
+from src.config import ALLOWED_EXTENSIONS, ARCHIVE_EXTENSIONS, MAX_FILE_SIZE_MB, MAX_REQUEST_SIZE_MB, PREFILTER_ENABLED, PREFILTER_TOP_K, RANKING_MODE, RESULTS_PAGE_SIZE, RESULTS_PAGE_MAX, WARM_UP_CLIENTS_ON_STARTUP
 
 import logging
 
 # --- Logging Configuration ---
-LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+# Every record carries the trace id of the request (or background job) that produced it
+install_trace_id_logging()
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s"
+# force=True: src.config has already called basicConfig while being imported
+logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, force=True)
 logging.getLogger('pdfminer').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 logger.info("Logging configured. Root level set to INFO. Noisy libraries set to WARNING.")
 
+# --- Readiness State ---
+# Set once the Gemini clients have been built; reported by /ready (not /health).
+_clients_ready = False
+_clients_error: Optional[str] = None
+
+
+def _warm_up_clients() -> None:
+    """Builds the Gemini clients ahead of the first upload. Runs in a thread after startup."""
+    global _clients_ready, _clients_error
+    try:
+        get_summary_provider().warm_up()
+        get_embedding_provider().warm_up()
+        _clients_ready = True
+        logger.info("Gemini clients warmed up; application is ready.")
+    except Exception as e:
+        _clients_error = str(e)
+        logger.error(f"Could not initialize the Gemini clients: {e}", exc_info=True)
+
+
+# --- Application Lifespan ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts the background job workers and releases shared worker resources when the server stops."""
+    await job_manager.start()
+    # Open the disk cache (SQLite) now, in a thread, rather than on the first request's event loop
+    await asyncio.to_thread(get_cache)
+    # Client setup is slow (LangChain imports), so it runs in the background: the server
+    # accepts connections straight away and /ready turns healthy once it is done.
+    warm_up = asyncio.create_task(asyncio.to_thread(_warm_up_clients)) if WARM_UP_CLIENTS_ON_STARTUP else None
+    yield
+    if warm_up is not None:
+        await warm_up
+    await job_manager.stop()
+    shutdown_extraction_pool()
+    shutdown_report_pool()
+    shutdown_embedding_pool()
+
 # --- FastAPI App Initialization ---
-app = FastAPI(title="CV Ranker API")
+app = FastAPI(title="CV Ranker API", lifespan=lifespan)
+
+@app.middleware("http")
+async def assign_trace_id(request: Request, call_next):
+    """
+    Tags each request with a trace id (the client's X-Request-ID if sent, else a new one),
+    included in every log line for the request and its background job, and echoed back.
+    """
+    trace_id = request.headers.get("x-request-id") or new_trace_id()
+    token = trace_id_var.set(trace_id)
+    try:
+        response = await call_next(request)
+    finally:
+        trace_id_var.reset(token)
+    response.headers["X-Request-ID"] = trace_id
+    return response
 
 # --- Template Configuration ---
 # Point to the 'templates' directory
@@ -36,230 +105,598 @@ def allowed_file(filename: str) -> bool:
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def is_archive(filename: str) -> bool:
+    """Checks if a file is a ZIP archive of CVs."""
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ARCHIVE_EXTENSIONS
+
+def _default_prefilter_top_k() -> int:
+    """Pre-filter K used when a request does not choose one (0 = pre-filter off)."""
+    return PREFILTER_TOP_K if PREFILTER_ENABLED else 0
+
+
+def _render_results(
+    request: Request, result_id: str, results: RankedResults, min_score: float, max_results: int,
+    placeholders: Optional[SummaryPlaceholders] = None,
+):
+    """
+    Renders the results page for stored results, with one ranked table per Job Description.
+    Only the first page of each table is rendered; the page fetches the rest from
+    /results/{result_id}/rows. Tables are memoized per result id and filter combination,
+    except when they show placeholders for failed summaries (those are retried on the next load).
+    """
+    if placeholders:
+        result_sets = [
+            build_result_set(results, jd_index, min_score, max_results, placeholders)
+            for jd_index in range(len(results.jd_names))
+        ]
+    else:
+        result_sets = [
+            result_store.artifact(
+                result_id, ("table", jd_index, min_score, max_results),
+                lambda stored, jd_index=jd_index: build_result_set(stored, jd_index, min_score, max_results)
+            )
+            for jd_index in range(len(results.jd_names))
+        ]
+    # Step 10: Render the results page
+    return templates.TemplateResponse(
+        "results.html",
+        {
+            "request": request,
+            "result_id": result_id,
+            "result_sets": result_sets,
+            "min_score": min_score,
+            "max_results": max_results,
+            "page_size": RESULTS_PAGE_SIZE,
+            "stats": results.stats,
+            "not_processed": results.not_processed
+        }
+    )
+
+
+def _csv_response(rows: List[RankedRow]) -> StreamingResponse:
+    """Streams result rows as a CSV download, a chunk of rows at a time."""
+    return StreamingResponse(
+        iter_csv(rows),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=cv_ranking_results.csv"}
+    )
+
+
+def _pdf_response(pdf_bytes: bytes) -> StreamingResponse:
+    return StreamingResponse(
+        io.BytesIO(pdf_bytes),
+        media_type="application/pdf",
+        headers={"Content-Disposition": "attachment; filename=cv_ranking_results.pdf"}
+    )
+
+
+MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024 # Convert MB to bytes
+MAX_REQUEST_SIZE_BYTES = MAX_REQUEST_SIZE_MB * 1024 * 1024
+# Room for multipart boundaries and form fields on top of the file bytes
+_MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+
+
+@app.middleware("http")
+async def reject_oversized_requests(request: Request, call_next):
+    """
+    Rejects a request whose declared Content-Length is over the per-request upload budget
+    before its body is read. Requests without a length are limited while files are saved.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_REQUEST_SIZE_BYTES + _MULTIPART_OVERHEAD_BYTES:
+        logger.warning(f"Rejecting request of {content_length} bytes (limit {MAX_REQUEST_SIZE_MB}MB).")
+        return HTMLResponse(content=f"<h2>Error: The upload exceeds the {MAX_REQUEST_SIZE_MB}MB total size limit.</h2>", status_code=413)
+    return await call_next(request)
+
+
+async def _save_upload(upload: UploadFile, directory: str, budget: Optional[ByteBudget] = None) -> tuple[str, str]:
+    """
+    Streams an uploaded file into `directory` and closes it, enforcing the per-file limit
+    (and the request's byte budget, if given). Returns the saved path and the SHA-256 of
+    the content (used as a cache key). Raises UploadTooLargeError when over a limit.
+    """
+    return await save_upload(upload, directory, MAX_FILE_SIZE_BYTES, budget)
+
 # --- API Endpoints ---
 
 @app.get("/", response_class=HTMLResponse)
 async def get_upload_form(request: Request):
     """Serves the main upload page."""
-    return templates.TemplateResponse("upload.html", {"request": request})
+    return templates.TemplateResponse("upload.html", {"request": request, "prefilter_top_k": _default_prefilter_top_k(), "ranking_mode": RANKING_MODE})
 
 @app.post("/upload", response_class=HTMLResponse)
 async def upload_and_process(
     request: Request,
     cv_files: List[UploadFile] = File(...),
-    jd_file: UploadFile = File(...),
+    jd_files: List[UploadFile] = File(..., alias="jd_file"), # One or more JDs; CVs are ranked against each
     min_score: int = Form(70), # Note: This is still 70, but upload.html has been updated to 50
-    max_results: int = Form(10) # Note: This is still 10, but upload.html has been updated to 3
+    max_results: int = Form(10), # Note: This is still 10, but upload.html has been updated to 3
+    prefilter_top_k: Optional[int] = Form(None), # Lexical pre-filter K; 0 = summarize every CV
+    ranking_mode: Optional[str] = Form(None) # "summary" or "fast" (no LLM before ranking)
 ):
     """
-    Handles file upload, processing, filtering, and renders the results page.
+    Handles file upload and queues the processing as a background job.
+    Returns at once with the job id: a progress page for browsers, or JSON when
+    the client asks for application/json. Once done, /jobs/{job_id}/results
+    redirects to the stored results.
     """
+    if prefilter_top_k is None:
+        prefilter_top_k = _default_prefilter_top_k()
+    ranking_mode = (ranking_mode or RANKING_MODE).lower()
+    if ranking_mode not in RANKING_MODES:
+        return HTMLResponse(content=f"<h2>Error: Unknown ranking mode. Choose one of: {', '.join(RANKING_MODES)}.</h2>", status_code=400)
+
     # --- File Validation section ---
-    if not jd_file or not jd_file.filename:
+    jd_files = [jd for jd in jd_files if jd and jd.filename]
+    if not jd_files:
         return HTMLResponse(content="<h2>Error: No Job Description file selected.</h2>", status_code=400)
-    if not allowed_file(jd_file.filename):
+    if not all(allowed_file(jd.filename) for jd in jd_files):
         return HTMLResponse(content="<h2>Error: Invalid file type for Job Description. Only PDFs are allowed.</h2>", status_code=400)
     
-    valid_cv_files = [cv for cv in cv_files if cv.filename and allowed_file(cv.filename)]
+    # ZIP archives of PDFs are accepted alongside loose PDFs, for large batches
+    valid_cv_files = [cv for cv in cv_files if cv.filename and (allowed_file(cv.filename) or is_archive(cv.filename))]
     if not valid_cv_files:
-        return HTMLResponse(content="<h2>Error: No valid CV files were uploaded. Please upload PDF files.</h2>", status_code=400)
-
-    # --- File Size Validation ---
-    max_file_size_bytes = MAX_FILE_SIZE_MB * 1024 * 1024 # Convert MB to bytes
-
-    if jd_file.size is None or jd_file.size > max_file_size_bytes:
-        logger.warning(f"Job Description file size exceeds limit: {jd_file.filename} ({jd_file.size} bytes)")
-        return HTMLResponse(content=f"<h2>Error: Job Description file ({jd_file.filename}) exceeds {MAX_FILE_SIZE_MB}MB limit.</h2>", status_code=413) # 413 Payload Too Large
-    
-    for cv in valid_cv_files:
-        if cv.size is None or cv.size > max_file_size_bytes:
-            logger.warning(f"CV file size exceeds limit: {cv.filename} ({cv.size} bytes)")
-            return HTMLResponse(content=f"<h2>Error: One or more CV files exceed {MAX_FILE_SIZE_MB}MB limit. Please upload smaller files.</h2>", status_code=413)
+        return HTMLResponse(content="<h2>Error: No valid CV files were uploaded. Please upload PDF files or ZIP archives of PDFs.</h2>", status_code=400)
 
     # --- Temporary File Handling ---
+    # The uploads must be saved before responding; the job owns the directory afterwards.
+    # File sizes are enforced while streaming each file to disk (see src/uploads.py).
     temp_dir = None # Initialize temp_dir to None
+    budget = ByteBudget(MAX_REQUEST_SIZE_BYTES)
     try:
         # Create a temporary directory
         temp_dir = tempfile.mkdtemp()
         logger.info(f"Created temporary directory for uploads: {temp_dir}")
 
-        # Save JD file to temp directory
-        jd_filepath = os.path.join(temp_dir, jd_file.filename)
-        with open(jd_filepath, "wb") as buffer:
-            buffer.write(await jd_file.read())
-        await jd_file.close() # Close the UploadFile object
+        with observe_stage("upload_save"):
+            # Save JD files to temp directory
+            jd_filepaths = []
+            jd_hashes = []
+            jd_names = [jd_file.filename for jd_file in jd_files]
+            for jd_file in jd_files:
+                jd_filepath, jd_hash = await _save_upload(jd_file, temp_dir, budget)
+                jd_filepaths.append(jd_filepath)
+                jd_hashes.append(jd_hash)
+
+            # Save CV files to temp directory
+            saved_cv_files = [] # Store paths for processing
+            original_filenames = []
+            cv_hashes = [] # Content hashes, used as extraction cache keys
+            seen_hashes = set() # The same hashes, for duplicate checks
+            duplicate_filenames = []
+            cv_archives = [] # Saved ZIP archives; their members are decompressed by the job, one at a time
+            archived_cv_count = 0
+            for cv in valid_cv_files:
+                if is_archive(cv.filename):
+                    # An archive is only bounded by the request budget; its members get the per-file limit
+                    archive_path, _ = await save_upload(cv, temp_dir, MAX_REQUEST_SIZE_BYTES, budget)
+                    # Reading the central directory is cheap and rejects non-ZIP files before queueing
+                    try:
+                        archived_cv_count += len(await asyncio.to_thread(list_pdf_members, archive_path))
+                    except ArchiveError as e:
+                        raise ArchiveError(f"{cv.filename}: {e}") from e
+                    cv_archives.append(archive_path)
+                    continue
+                cv_filepath, cv_hash = await _save_upload(cv, temp_dir, budget)
+                # The same file uploaded twice is processed (and ranked) only once
+                if cv_hash in seen_hashes:
+                    os.remove(cv_filepath)
+                    duplicate_filenames.append(cv.filename)
+                    continue
+                seen_hashes.add(cv_hash)
+                saved_cv_files.append(cv_filepath)
+                cv_hashes.append(cv_hash)
+                original_filenames.append(cv.filename)
+        
+        logger.info(
+            f"Saved {len(saved_cv_files)} CVs and {len(jd_filepaths)} JDs to temporary directory "
+            f"({budget.used / (1024 * 1024):.1f}MB, {len(duplicate_filenames)} duplicate CVs skipped), "
+            f"plus {len(cv_archives)} archive(s) holding {archived_cv_count} PDFs."
+        )
+        if not saved_cv_files and not archived_cv_count:
+            shutil.rmtree(temp_dir)
+            return HTMLResponse(content="<h2>Error: The uploaded archives contain no PDF files.</h2>", status_code=400)
+
+    except UploadTooLargeError as e:
+        logger.warning(f"Rejecting upload: {e}")
+        shutil.rmtree(temp_dir)
+        if e.per_request:
+            message = f"The upload exceeds the {MAX_REQUEST_SIZE_MB}MB total size limit. Please upload fewer or smaller files."
+        else:
+            message = f"File ({e.filename}) exceeds {MAX_FILE_SIZE_MB}MB limit. Please upload smaller files."
+        return HTMLResponse(content=f"<h2>Error: {message}</h2>", status_code=413) # 413 Payload Too Large
+
+    except ArchiveError as e:
+        logger.warning(f"Rejecting upload: {e}")
+        shutil.rmtree(temp_dir)
+        return HTMLResponse(content=f"<h2>Error: {e}</h2>", status_code=400)
+
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while saving uploads: {e}", exc_info=True)
+        if temp_dir and os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+        return HTMLResponse(content="<h2>Error: An unexpected error occurred during processing.</h2>", status_code=500)
+
+    def cleanup_temp_dir():
+        # Ensure the temporary directory is removed once the job is over, even if it failed
+        if os.path.exists(temp_dir):
+            logger.info(f"Cleaning up temporary directory: {temp_dir}")
+            shutil.rmtree(temp_dir)
+            logger.info("Temporary directory cleaned up.")
+
+    async def process(job):
+        try:
+            results = await rank_uploaded_cvs(
+                jd_filepaths, jd_hashes, jd_names,
+                saved_cv_files, cv_hashes, original_filenames,
+                min_score, max_results, progress=job.report,
+                prefilter_top_k=prefilter_top_k, duplicates_skipped=len(duplicate_filenames),
+                cv_archives=cv_archives, ranking_mode=ranking_mode,
+            )
+        except ArchiveError as e:
+            # Guards tripped while decompressing (e.g. a zip bomb with misleading headers)
+            raise JobFailedError(f"The archive was rejected: {e}") from e
+        # The job's result is the id of the stored ranking
+        return result_store.put(results)
+
+    try:
+        job = job_manager.submit(process, cleanup=cleanup_temp_dir)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting upload: {e}")
+        cleanup_temp_dir()
+        return HTMLResponse(content="<h2>Error: The server is busy processing other batches. Please try again shortly.</h2>", status_code=503)
+
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse(job.snapshot(), status_code=202)
+    return templates.TemplateResponse(
+        "progress.html",
+        {"request": request, "job_id": job.id, "cv_count": len(saved_cv_files) + archived_cv_count, "jd_count": len(jd_filepaths)},
+        status_code=202
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Reports the status and per-stage progress of a background job.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found or expired."}, status_code=404)
+    job.touch() # Polling keeps the job from being treated as abandoned
+    return job.snapshot()
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Streams a job's progress as Server-Sent Events (extracted n/N, summarized n/N,
+    embedded, ranked), ending with a 'done' or 'failed' event. Once every stream for a
+    running job has disconnected for JOB_ABANDON_SECONDS, the job is cancelled.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found or expired."}, status_code=404)
+    return StreamingResponse(
+        job.stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # Disable proxy buffering
+    )
+
+
+@app.get("/jobs/{job_id}/results", response_class=HTMLResponse)
+async def get_job_results(job_id: str):
+    """
+    Redirects to the stored results of a finished job.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return HTMLResponse(content="<h2>Error: Job not found or its results have expired.</h2>", status_code=404)
+    if job.status == FAILED:
+        return HTMLResponse(content=f"<h2>Error: {job.error}</h2>", status_code=500)
+    if job.status != DONE:
+        return HTMLResponse(content="<h2>Results are not ready yet. Please wait for processing to finish.</h2>", status_code=202)
+    return RedirectResponse(url=f"/results/{job.result}", status_code=303)
+
+
+@app.get("/results/{result_id}", response_class=HTMLResponse)
+async def view_results(request: Request, result_id: str, min_score: Optional[float] = None, max_results: Optional[int] = None):
+    """
+    Renders stored results, re-filtered and re-sliced without recomputation.
+    Filters default to the ones chosen at upload time.
+    """
+    results = result_store.get(result_id)
+    if results is None:
+        return HTMLResponse(content="<h2>Error: These results were not found or have expired. Please analyze the batch again.</h2>", status_code=404)
+    min_score = results.min_score if min_score is None else min_score
+    max_results = results.max_results if max_results is None else max_results
+    # Fast ranking mode: the rows about to be shown get their summaries now
+    placeholders = {}
+    for jd_index in range(len(results.jd_names)):
+        placeholders.update(await summarize_first_page(results, jd_index, min_score, max_results))
+    return _render_results(request, result_id, results, min_score, max_results, placeholders)
+
+
+@app.get("/results/{result_id}/rows")
+async def get_result_rows(
+    result_id: str,
+    jd: int = 0,
+    min_score: Optional[float] = None,
+    max_results: Optional[int] = None,
+    sort: str = "score",
+    offset: int = 0,
+    limit: int = RESULTS_PAGE_SIZE,
+):
+    """
+    Returns one page of one JD's stored results as JSON, filtered server-side by
+    min_score/max_results (defaults: the upload's filters) and sorted by `sort`
+    ("score", "score_asc" or "filename"). `next_offset` is the offset of the following
+    page, or null after the last one. HTML summaries are built only for the rows returned.
+    """
+    if sort not in RESULT_SORTS:
+        return JSONResponse({"error": f"Unknown sort. Choose one of: {', '.join(RESULT_SORTS)}."}, status_code=400)
+    if offset < 0 or not 1 <= limit <= RESULTS_PAGE_MAX:
+        return JSONResponse({"error": f"offset must be 0 or more and limit between 1 and {RESULTS_PAGE_MAX}."}, status_code=400)
+    results = result_store.get(result_id)
+    if results is None or not 0 <= jd < len(results.jd_names):
+        return JSONResponse({"error": "These results were not found or have expired."}, status_code=404)
+    min_score = results.min_score if min_score is None else min_score
+    max_results = results.max_results if max_results is None else max_results
+
+    with observe_stage("select"):
+        indices, ranks, total = results.page(jd, min_score, max_results, sort, offset, limit)
+    placeholders = await summarize_rows(results, indices.tolist()) # Fast ranking mode: only this page is summarized
+    rows = results.rows_at(jd, indices, ranks, placeholders)
+    next_offset = offset + len(rows)
+    return {
+        "jd": results.jd_names[jd],
+        "min_score": min_score,
+        "max_results": max_results,
+        "sort": sort,
+        "offset": offset,
+        "limit": limit,
+        "total": total,
+        "next_offset": next_offset if next_offset < total else None,
+        "rows": json_records(rows, html_summaries=True),
+    }
+
+
+async def _stored_results_filters(result_id: str, jd: int, min_score: Optional[float], max_results: Optional[int]):
+    """
+    Resolves the filters for a stored-results download, summarizing the selected rows
+    first if they were ranked in fast mode.
+    Returns (results, min_score, max_results, placeholders for failed summaries), or None
+    if the result or JD does not exist.
+    """
+    results = result_store.get(result_id)
+    if results is None or not 0 <= jd < len(results.jd_names):
+        return None
+    min_score = results.min_score if min_score is None else min_score
+    max_results = results.max_results if max_results is None else max_results
+    placeholders = await summarize_shown_rows(results, jd, min_score, max_results)
+    return results, min_score, max_results, placeholders
+
+
+@app.get("/results/{result_id}/download-csv")
+async def download_stored_csv(result_id: str, jd: int = 0, min_score: Optional[float] = None, max_results: Optional[int] = None):
+    """
+    Streams one JD's stored results as CSV, written chunk by chunk as it is sent.
+    """
+    resolved = await _stored_results_filters(result_id, jd, min_score, max_results)
+    if resolved is None:
+        return HTMLResponse(content="<h2>Error: These results were not found or have expired.</h2>", status_code=404)
+    results, min_score, max_results, placeholders = resolved
+    return _csv_response(results.rows(jd, min_score, max_results, placeholders))
+
+
+@app.get("/results/{result_id}/download-ndjson")
+async def download_stored_ndjson(result_id: str, jd: int = 0, min_score: Optional[float] = None, max_results: Optional[int] = None):
+    """
+    Streams one JD's stored results as newline-delimited JSON, one record per CV.
+    """
+    resolved = await _stored_results_filters(result_id, jd, min_score, max_results)
+    if resolved is None:
+        return JSONResponse({"error": "These results were not found or have expired."}, status_code=404)
+    results, min_score, max_results, placeholders = resolved
+    return StreamingResponse(
+        iter_ndjson(results.rows(jd, min_score, max_results, placeholders)),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=cv_ranking_results.ndjson"}
+    )
+
+
+@app.get("/results/{result_id}/download-pdf")
+async def download_stored_pdf(result_id: str, jd: int = 0, min_score: Optional[float] = None, max_results: Optional[int] = None):
+    """
+    Returns one JD's stored results as a PDF report, rendered off the event loop and
+    cached by content (see src/reports.py).
+    """
+    resolved = await _stored_results_filters(result_id, jd, min_score, max_results)
+    if resolved is None:
+        return HTMLResponse(content="<h2>Error: These results were not found or have expired.</h2>", status_code=404)
+    results, min_score, max_results, placeholders = resolved
+    try:
+        return _pdf_response(await render_pdf_report_async(results.rows(jd, min_score, max_results, placeholders)))
+    except Exception as e:
+        logger.error(f"Error during PDF download: {e}", exc_info=True)
+        return HTMLResponse(content="<h2>Error: Could not generate PDF file.</h2>", status_code=500)
+
+
+@app.get("/results/{result_id}/download-json")
+async def download_stored_json(result_id: str, jd: int = 0, min_score: Optional[float] = None, max_results: Optional[int] = None):
+    """
+    Returns one JD's stored results as JSON records with numeric scores and stable CV ids.
+    """
+    resolved = await _stored_results_filters(result_id, jd, min_score, max_results)
+    if resolved is None:
+        return JSONResponse({"error": "These results were not found or have expired."}, status_code=404)
+    results, min_score, max_results, placeholders = resolved
+    return {
+        "jd": results.jd_names[jd],
+        "min_score": min_score,
+        "max_results": max_results,
+        "results": json_records(results.rows(jd, min_score, max_results, placeholders)),
+    }
+
+
+@app.post("/pool/ingest")
+async def ingest_into_pool(cv_files: List[UploadFile] = File(...)):
+    """
+    Adds CVs to the persistent talent pool: extracts, summarizes and embeds each new CV
+    and stores its summary, name and embedding. CVs already in the pool are skipped.
+    """
+    valid_cv_files = [cv for cv in cv_files if cv.filename and allowed_file(cv.filename)]
+    if not valid_cv_files:
+        return JSONResponse({"error": "No valid CV files were uploaded. Please upload PDF files."}, status_code=400)
 
-        # Save CV files to temp directory
-        saved_cv_files = [] # Store paths for processing
-        original_filenames = []
+    pool = get_talent_pool()
+    temp_dir = None
+    try:
+        temp_dir = tempfile.mkdtemp()
+        saved_cv_files, cv_hashes, filenames = [], [], []
+        seen_hashes = set() # The same hashes as cv_hashes, for duplicate checks
+        skipped_duplicates = 0
+        budget = ByteBudget(MAX_REQUEST_SIZE_BYTES)
         for cv in valid_cv_files:
-            cv_filepath = os.path.join(temp_dir, cv.filename)
-            with open(cv_filepath, "wb") as buffer:
-                buffer.write(await cv.read())
+            cv_filepath, cv_hash = await _save_upload(cv, temp_dir, budget)
+            # Skip CVs already pooled (or repeated within this upload) before paying for the LLM
+            if cv_hash in seen_hashes or pool.contains(cv_hash):
+                skipped_duplicates += 1
+                continue
+            seen_hashes.add(cv_hash)
             saved_cv_files.append(cv_filepath)
-            original_filenames.append(cv.filename)
-            await cv.close() # Close the UploadFile object
-        
-        logger.info(f"Saved {len(saved_cv_files)} CVs and 1 JD to temporary directory.")
-
-        # --- Processing Steps ---
-        logger.info("Starting PDF text extraction for JD.")
-        # Now extract text from the saved file paths
-        jd_text = extract_text_from_pdf(jd_filepath)
-        logger.info("JD text extracted.")
-
-        cv_texts = []
-        for cv_filepath in saved_cv_files:
-            logger.info(f"Extracting text from CV: {os.path.basename(cv_filepath)}")
-            cv_texts.append(extract_text_from_pdf(cv_filepath))
-        logger.info(f"Extracted text from {len(cv_texts)} CVs.")
-
-        # Step 3: Get raw summaries from the AI
-        logger.info("Generating raw summaries from AI.")
-        raw_summaries = [summarize_cv(cv) for cv in cv_texts]
-        logger.info("Raw summaries generated.")
-
-        # --- Step 4: Process Summaries ---
-
-        # Step 4a: Extract names and create clean summaries simultaneously
-        names = []
-        clean_summaries = []
-        for summary in raw_summaries:
-            parts = summary.split('\n', 1)
-            name_part = parts[0]
-            # Removing potential markdown characters from the name line for cleaner display
-            names.append(name_part.replace('*', '').replace('#', '').strip())
-            
-            if len(parts) > 1:
-                summary_part = parts[1]
-                # Clean up whitespace in the summary part
-                clean_summaries.append(" ".join(summary_part.split()).strip())
-            else:
-                clean_summaries.append("") # Handle cases where there's no summary text after name
-        logger.info("Names and clean summaries extracted.")
-
-        # Step 4b: Prepare data for HTML display (replace \n with <br />)
-        html_display_summaries = []
-        for summary_text in raw_summaries:
-            # The LLM output is expected to have the name on the first line, followed by summary text.
-            # Split at the first newline to separate the name from the summary content.
-            parts = summary_text.split('\n', 1)
-            
-            if len(parts) > 1:
-                # parts[1] contains the actual summary text, which might have internal newlines.
-                summary_content = parts[1]
-                # Replace all newline characters with HTML <br /> tags for display.
-                html_summary = summary_content.replace('\n', '<br />')
-            else:
-                # If there's no newline after the name, just take the whole text and replace newlines
-                html_summary = summary_text.replace('\n', '<br />')
-                
-            html_display_summaries.append(html_summary)
-        logger.info("HTML display summaries prepared.")
-
-        # Step 5: Embed documents (using the raw summaries is fine here)
-        documents_to_embed = raw_summaries + [jd_text]
-        logger.info("Generating embeddings for documents.")
-        embeddings = embed_multiple_documents(documents_to_embed)
-        logger.info("Embeddings generated.")
-
-        # Step 6: Calculate similarities
-        logger.info("Calculating similarities.")
-        similarities = calculate_similarities(embeddings)
-        logger.info("Similarities calculated.")
-
-        # Step 7: Create the DataFrame with CLEAN summaries for the CSV/JSON
-        logger.info("Creating DataFrame.")
-        df = create_dataframe(names, original_filenames, clean_summaries, similarities)
-        logger.info("DataFrame created.")
-
-        # Step 8: Filter and slice the DataFrame
-        logger.info("Filtering and slicing DataFrame.")
-        df_filtered = df.copy()
-        if not df_filtered.empty:
-            score_column_name = DATA_COLUMNS["SCORE"]
-            # Ensure the score column is numeric for comparison
-            df_filtered[score_column_name] = pd.to_numeric(df_filtered[score_column_name], errors='coerce')
-            # Remove any rows where score conversion failed
-            df_filtered.dropna(subset=[score_column_name], inplace=True)
-            
-            df_filtered = df_filtered[df_filtered[score_column_name] >= min_score]
-            df_filtered = df_filtered.head(max_results)
-            
-            # Format score for display after filtering and slicing
-            df_filtered[score_column_name] = df_filtered[score_column_name].apply(lambda x: f"{x:.1f}")
-        logger.info("DataFrame filtered and sliced.")
-
-        # Step 9: Prepare data for each output format
-        results_json = df_filtered.to_json(orient='records')
-
-        df_display = df_filtered.copy()
-        
-        # Create a mapping from filename to the HTML-ready summary string
-        filename_to_html_display_summary = dict(zip(original_filenames, html_display_summaries)) 
-        
-        summary_col_name = DATA_COLUMNS["SUMMARY"]
-        filename_col_name = DATA_COLUMNS["FILENAME"]
-        
-        if filename_col_name in df_display.columns:
-            # Map the generated HTML display summaries into the DataFrame's summary column
-            df_display[summary_col_name] = df_display[filename_col_name].map(filename_to_html_display_summary)
-        else:
-            logger.warning(f"Column '{filename_col_name}' not found in df_display for HTML summary mapping. HTML summaries might not be displayed.")
-            # Fallback if the filename column is missing
-            df_display[summary_col_name] = ""
-
-        # Convert the DataFrame with proper HTML summaries to an HTML table string.
-        # escape=False is crucial here to ensure the <br /> tags are rendered.
-        results_html = df_display.to_html(classes='table table-striped', index=False, table_id='results-table', escape=False)
-        logger.info("Results prepared for display.")
-
-        # Step 10: Render the results page
-        return templates.TemplateResponse(
-            "results.html",
-            {
-                "request": request,
-                "results_data": results_html,
-                "results_json": results_json
-            }
+            cv_hashes.append(cv_hash)
+            filenames.append(cv.filename)
+        logger.info(f"Ingesting {len(saved_cv_files)} new CVs into the talent pool ({skipped_duplicates} already pooled).")
+
+        with observe_stage("extraction"):
+            cv_texts = await extract_texts_from_pdfs(saved_cv_files, cv_hashes)
+        with observe_stage("summarization"):
+            raw_summaries = await summarize_cvs(cv_texts)
+
+        # Only CVs with a real summary are pooled; failures can be retried with a later ingest
+        keep = [i for i, summary in enumerate(raw_summaries) if not is_failed_summary(summary)]
+        failed = [filenames[i] for i in sorted(set(range(len(filenames))) - set(keep))]
+        added = 0
+        if keep:
+            kept_summaries = [raw_summaries[i] for i in keep]
+            names, clean_summaries, display_summaries = parse_summaries(kept_summaries)
+            with observe_stage("embedding"):
+                embeddings = await asyncio.to_thread(embed_multiple_documents, [summary_text(summary) for summary in kept_summaries])
+            records = [
+                {
+                    "name": name,
+                    "filename": filenames[i],
+                    "summary": clean_summary,
+                    "html_summary": summary_html(display_summary),
+                    "content_hash": cv_hashes[i],
+                }
+                for i, name, clean_summary, display_summary in zip(keep, names, clean_summaries, display_summaries)
+            ]
+            added = await asyncio.to_thread(pool.add, records, embeddings)
+
+        return {"added": added, "skipped_duplicates": skipped_duplicates, "failed": failed, "pool_size": pool.size}
+
+    except UploadTooLargeError as e:
+        logger.warning(f"Rejecting talent pool upload: {e}")
+        return JSONResponse({"error": str(e)}, status_code=413)
+
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during talent pool ingestion: {e}", exc_info=True)
+        return JSONResponse({"error": "An unexpected error occurred during ingestion."}, status_code=500)
+
+    finally:
+        if temp_dir and os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+
+
+@app.post("/pool/rank", response_class=HTMLResponse)
+async def rank_pool(
+    request: Request,
+    jd_file: UploadFile = File(...),
+    top_k: int = Form(10),
+    min_score: int = Form(0),
+    approximate: Optional[bool] = Form(None) # None = use the partitioned index only for large pools
+):
+    """
+    Ranks the stored talent pool against a Job Description and renders the top-k candidates.
+    """
+    if not jd_file or not jd_file.filename or not allowed_file(jd_file.filename):
+        return HTMLResponse(content="<h2>Error: Please upload a Job Description PDF.</h2>", status_code=400)
+
+    temp_dir = None
+    try:
+        temp_dir = tempfile.mkdtemp()
+        jd_filepath, jd_hash = await _save_upload(jd_file, temp_dir)
+        jd_text = (await extract_texts_from_pdfs([jd_filepath], [jd_hash]))[0]
+        jd_embedding = (await asyncio.to_thread(embed_multiple_documents, [jd_text]))[0]
+
+        pool = get_talent_pool()
+        with observe_stage("pool_search"):
+            matches = await asyncio.to_thread(pool.search, jd_embedding, top_k, approximate)
+        logger.info(f"Ranked talent pool of {pool.size} CVs; returning top {len(matches)}.")
+
+        results = RankedResults(
+            [jd_file.filename],
+            [m["name"] for m in matches],
+            [m["filename"] for m in matches],
+            [m["summary"] for m in matches],
+            [m["html_summary"] for m in matches],
+            [[m["score"]] for m in matches],
+            min_score=min_score, max_results=top_k,
+            cv_ids=[cv_id_from_hash(m["content_hash"]) for m in matches],
         )
+        result_id = result_store.put(results)
+        return _render_results(request, result_id, results, min_score, top_k)
+
+    except UploadTooLargeError as e:
+        logger.warning(f"Rejecting Job Description upload: {e}")
+        return HTMLResponse(content=f"<h2>Error: Job Description file ({jd_file.filename}) exceeds {MAX_FILE_SIZE_MB}MB limit.</h2>", status_code=413)
 
     except Exception as e:
-        logger.error(f"An unexpected error occurred during upload and processing: {e}", exc_info=True)
-        # Return an error response. Consider using the error.html template here.
-        # For simplicity, we'll return an HTMLResponse, but ideally it would be a proper template.
+        logger.error(f"An unexpected error occurred while ranking the talent pool: {e}", exc_info=True)
         return HTMLResponse(content="<h2>Error: An unexpected error occurred during processing.</h2>", status_code=500)
 
     finally:
-        # Ensure the temporary directory is removed, even if errors occur
         if temp_dir and os.path.exists(temp_dir):
-            logger.info(f"Cleaning up temporary directory: {temp_dir}")
             shutil.rmtree(temp_dir)
-            logger.info("Temporary directory cleaned up.")
-    
+
+
+@app.post("/pool/index")
+async def build_pool_index(n_lists: Optional[int] = Form(None)):
+    """
+    Builds (or rebuilds) the approximate partitioned index over the talent pool.
+    """
+    pool = get_talent_pool()
+    try:
+        partitions = await asyncio.to_thread(pool.build_index, n_lists)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return {"partitions": partitions, "pool_size": pool.size}
+
+
+@app.get("/pool/stats")
+async def pool_stats():
+    """
+    Reports the size of the talent pool.
+    """
+    return {"pool_size": get_talent_pool().size}
+
 
 @app.post("/download-csv")
 async def download_csv(results_json: str = Form(...)):
     """
     Receives results data as a JSON string from a form, converts it to a CSV,
     and streams it back to the user as a file download.
+    Kept for API clients; the results page downloads from /results/{result_id}/download-csv.
     """
     try:
-        # Use pandas to easily convert the JSON string back into a DataFrame
-        # The 'orient="records"' must match the format we used to create the JSON
-        df = pd.read_json(io.StringIO(results_json), orient='records')
+        # Rebuild the rows from the JSON records (keyed by the output column names)
+        rows = rows_from_records(json.loads(results_json))
 
-        # Use an in-memory text stream to hold the CSV data
-        stream = io.StringIO()
-        df.to_csv(stream, index=False)
-        
         # Create a response that the browser will interpret as a file download
-        response = StreamingResponse(
-            iter([stream.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=cv_ranking_results.csv"}
-        )
-        return response
+        return _csv_response(rows)
 
     except Exception as e:
         logger.error(f"Error during CSV download: {e}", exc_info=True)
@@ -271,55 +708,70 @@ async def download_pdf(results_json: str = Form(...)):
     """
     Receives results data as a JSON string, converts it to a styled HTML report,
     renders it as a PDF, and streams it back for download.
+    Kept for API clients; the results page downloads from /results/{result_id}/download-pdf.
     """
     try:
-        # Convert the JSON back into a DataFrame
-        df = pd.read_json(io.StringIO(results_json), orient='records')
-
-        # Convert the DataFrame to an HTML table
-        html_table = df.to_html(index=False, table_id="results-table", escape=False)
-
-        # Create CSS for a professional-looking report
-        pdf_css = """
-            @page { size: A4 landscape; margin: 1.5cm; }
-            body { font-family: sans-serif; }
-            h1 { text-align: center; color: #333; }
-            #results-table { border-collapse: collapse; width: 100%; font-size: 10px; }
-            #results-table th, #results-table td { border: 1px solid #ddd; padding: 6px; }
-            #results-table th { background-color: #0d6efd; color: white; padding-top: 10px; padding-bottom: 10px; text-align: left; }
-            #results-table tr:nth-child(even) { background-color: #f2f2f2; }
-            #results-table td p { margin: 0; }
-        """
-        
-        # Combine everything into a full HTML document string
-        full_html = f"""
-        <!DOCTYPE html>
-        <html><head><meta charset="utf-8"><title>CV Ranking Results</title></head>
-        <body><h1>CV Ranking Results</h1>{html_table}</body></html>
-        """
-
-        # Use WeasyPrint to render the HTML and CSS into a PDF in memory
-        pdf_bytes = HTML(string=full_html).write_pdf(stylesheets=[CSS(string=pdf_css)])
-
-        # Add a check to ensure pdf_bytes is not None before proceeding.
-        if pdf_bytes is None:
-            raise ValueError("PDF generation failed, resulted in None.")
-
-        # Create a response that the browser will interpret as a PDF file download
-        return StreamingResponse(
-            io.BytesIO(pdf_bytes),
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=cv_ranking_results.pdf"}
-        )
+        # Rebuild the rows from the JSON records
+        rows = rows_from_records(json.loads(results_json))
+
+        # Render off the event loop; the same rows are only rendered once (cached by content)
+        return _pdf_response(await render_pdf_report_async(rows))
 
     except Exception as e:
         logger.error(f"Error during PDF download: {e}", exc_info=True)
         return HTMLResponse(content="<h2>Error: Could not generate PDF file.</h2>", status_code=500)
     
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Reports disk cache hit/miss counts for extracted text, summaries, embeddings and PDF reports.
+    """
+    cache = get_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await asyncio.to_thread(cache.stats))}
+
+
+@app.get("/rate-limit/stats")
+async def rate_limit_stats():
+    """
+    Reports the shared Gemini rate limiter: remaining budgets, the adaptive
+    concurrency limit, calls in flight and the circuit breaker state.
+    """
+    return gemini_limiter.stats()
+
+
 @app.get("/health", status_code=200)
 async def health_check():
     """
     Simple endpoint for the hosting platform to verify the app is live and healthy.
     """
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus metrics: per-stage duration histograms, provider call/retry/token counters,
+    cache hit/miss counters, and gauges for jobs, the rate limiter and the result store.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe, separate from the /health liveness check: returns 503 until the
+    job workers are running and the Gemini clients have been initialized.
+    """
+    checks = {
+        "api_key_configured": bool(os.getenv('GOOGLE_API_KEY')),
+        "job_queue_running": job_manager.started,
+        # Without start-up warm-up the clients are built on the first request instead
+        "clients_initialized": _clients_ready or not WARM_UP_CLIENTS_ON_STARTUP,
+    }
+    ready = all(checks.values())
+    body = {"status": "ready" if ready else "not_ready", "checks": checks}
+    if _clients_error:
+        body["error"] = _clients_error
+    return JSONResponse(content=body, status_code=200 if ready else 503)
@@ -0,0 +1,330 @@
+"""
+Offline end-to-end benchmark of the /upload pipeline.
+
+Runs the real application in-process (FastAPI TestClient) with the fake LLM and
+embedding providers (LLM_PROVIDER=fake), so no Gemini access is needed. The CVs in
+dataset/cvs are scaled up to any number of synthetic PDFs. Each batch goes through
+the full flow: upload, background job and its progress, then the results page.
+
+Reports throughput, p50/p95 batch latency, peak RSS and a per-stage breakdown.
+With --baseline it compares against a stored run and exits with status 1 on a
+regression beyond --tolerance. Timings only compare on the same machine, so no
+baseline is committed: record one with --save-baseline where the comparison runs
+(e.g. in CI, from the base branch, before benchmarking the change). Baselines
+record the machine they came from, and comparing against another machine warns.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--cvs 400] [--batch-size 100] [--concurrency 2]
+        [--latency-ms 50] [--error-rate 0] [--rate-limit-rate 0] [--summary-batch]
+        [--baseline PATH] [--save-baseline PATH] [--tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DATASET_DIR = os.path.join(REPO_ROOT, "dataset", "cvs")
+
+# Pipeline stages in the order they complete (see src/pipeline.py)
+STAGES = ["extracted", "prefiltered", "summarized", "embedded", "ranked"]
+
+# How often a running job's progress is sampled; bounds the per-stage timing resolution
+POLL_SECONDS = 0.02
+
+# Metrics compared against the baseline: name -> True if higher is better
+GATED_METRICS = {"throughput_cvs_per_s": True, "p95_latency_s": False, "peak_rss_mb": False}
+
+# Vocabulary mixed into the synthetic CVs and JDs so their rankings differ
+SKILLS = [
+    "python", "java", "sql", "machine learning", "data analysis", "project management", "marketing",
+    "copywriting", "video editing", "journalism", "accounting", "excel", "customer service", "sales",
+    "react", "docker", "kubernetes", "research", "public speaking", "negotiation", "photoshop", "statistics",
+]
+
+
+# --- Synthetic PDFs ---
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(lines: list) -> bytes:
+    """A minimal single-page text PDF (Helvetica), readable by pdfplumber."""
+    content = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+    content += [f"({_pdf_escape(line[:110])}) Tj T*" for line in lines[:70]]
+    content.append("ET")
+    stream = "\n".join(content).encode("latin-1", "replace")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+    ]
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(output)
+
+
+def source_lines() -> list:
+    """Text lines of each CV in dataset/cvs, used as material for the synthetic CVs."""
+    from src.utils import extract_text_from_pdf
+    sources = []
+    for filename in sorted(os.listdir(DATASET_DIR)):
+        if filename.lower().endswith(".pdf"):
+            with open(os.path.join(DATASET_DIR, filename), "rb") as f:
+                lines = [line.strip() for line in extract_text_from_pdf(f).splitlines() if line.strip()]
+            if lines:
+                sources.append(lines)
+    if not sources:
+        raise SystemExit(f"No readable PDFs found in {DATASET_DIR}.")
+    return sources
+
+
+def generate_cvs(count: int, directory: str, seed: int) -> list:
+    """Writes `count` distinct synthetic CV PDFs and returns their paths."""
+    rng = random.Random(seed)
+    sources = source_lines()
+    paths = []
+    for i in range(count):
+        lines = list(sources[i % len(sources)][1:])
+        rng.shuffle(lines)
+        skills = ", ".join(rng.sample(SKILLS, 5))
+        # A unique name line and skill mix make every CV distinct (no cache or duplicate hits)
+        body = [f"Candidate {i:05d}", f"Key skills: {skills}"] + lines
+        path = os.path.join(directory, f"cv_{i:05d}.pdf")
+        with open(path, "wb") as f:
+            f.write(make_pdf(body))
+        paths.append(path)
+    return paths
+
+
+def generate_jd(directory: str, seed: int) -> str:
+    rng = random.Random(seed)
+    skills = rng.sample(SKILLS, 8)
+    lines = ["Job Description: Multimedia Analyst", "We are looking for a candidate with:"]
+    lines += [f"- Experience with {skill}" for skill in skills]
+    path = os.path.join(directory, "jd.pdf")
+    with open(path, "wb") as f:
+        f.write(make_pdf(lines))
+    return path
+
+
+# --- Running the flow ---
+
+def run_batch(client, cv_paths: list, jd_path: str) -> dict:
+    """Uploads one batch, follows its job to completion and returns its timings."""
+    started = time.perf_counter()
+    handles = [open(path, "rb") for path in cv_paths + [jd_path]]
+    try:
+        files = [("cv_files", (os.path.basename(path), handle, "application/pdf")) for path, handle in zip(cv_paths, handles)]
+        files.append(("jd_file", ("jd.pdf", handles[-1], "application/pdf")))
+        response = client.post(
+            "/upload", files=files, data={"min_score": "0", "max_results": "10"},
+            headers={"accept": "application/json"},
+        )
+    finally:
+        for handle in handles:
+            handle.close()
+    if response.status_code != 202:
+        return {"ok": False, "error": f"upload returned {response.status_code}"}
+    accepted = time.perf_counter()
+    job_id = response.json()["job_id"]
+
+    # The TestClient buffers streamed responses, so the job is polled instead of following its SSE stream
+    stage_done_at = {}
+    while True:
+        snapshot = client.get(f"/jobs/{job_id}").json()
+        now = time.perf_counter()
+        progress = snapshot["progress"]
+        for position, stage in enumerate(STAGES):
+            # A stage is over once it reports all items done or a later stage has started
+            # (the pre-filter, for one, finishes with fewer CVs than it started with)
+            counts = progress.get(stage)
+            later_started = any(later in progress for later in STAGES[position + 1:])
+            if counts and (counts["done"] >= counts["total"] or later_started):
+                stage_done_at.setdefault(stage, now)
+        if snapshot["status"] in ("done", "failed"):
+            status = snapshot["status"]
+            break
+        time.sleep(POLL_SECONDS)
+    if status == "done":
+        # Include rendering the results page, as a browser would load it next
+        client.get(f"/jobs/{job_id}/results")
+    finished = time.perf_counter()
+
+    # Each stage's duration runs from the end of the previous stage (or job acceptance)
+    stages = {"upload": accepted - started}
+    previous = accepted
+    for stage in STAGES:
+        if stage in stage_done_at:
+            stages[stage] = stage_done_at[stage] - previous
+            previous = stage_done_at[stage]
+    return {"ok": status == "done", "latency": finished - started, "stages": stages, "cvs": len(cv_paths)}
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_benchmark(args) -> dict:
+    from fastapi.testclient import TestClient
+    import app
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cv_paths = generate_cvs(args.cvs, workdir, args.seed)
+        jd_path = generate_jd(workdir, args.seed)
+        batches = [cv_paths[i:i + args.batch_size] for i in range(0, len(cv_paths), args.batch_size)]
+        print(f"Generated {len(cv_paths)} synthetic CVs in {len(batches)} batches.")
+
+        wall_started = time.perf_counter()
+        with TestClient(app.app) as client:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                runs = list(executor.map(lambda batch: run_batch(client, batch, jd_path), batches))
+        wall = time.perf_counter() - wall_started
+
+    succeeded = [run for run in runs if run["ok"]]
+    latencies = [run["latency"] for run in succeeded] or [0.0]
+    stage_names = ["upload"] + STAGES
+    stage_means = {
+        stage: statistics.mean([run["stages"][stage] for run in succeeded if stage in run["stages"]] or [0.0])
+        for stage in stage_names
+    }
+    # ru_maxrss is in KB on Linux; children covers the PDF extraction worker processes
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    peak_child_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {
+        "params": {
+            "cvs": args.cvs, "batch_size": args.batch_size, "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms, "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate,
+            "summary_batch": args.summary_batch,
+        },
+        "machine": machine(),
+        "batches": len(runs),
+        "failed_batches": len(runs) - len(succeeded),
+        "wall_s": round(wall, 3),
+        "throughput_cvs_per_s": round(sum(run["cvs"] for run in succeeded) / wall, 2),
+        "p50_latency_s": round(percentile(latencies, 0.50), 3),
+        "p95_latency_s": round(percentile(latencies, 0.95), 3),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "peak_child_rss_mb": round(peak_child_rss_mb, 1),
+        "summary_requests": summary_requests(),
+        "stage_mean_s": {stage: round(seconds, 3) for stage, seconds in stage_means.items()},
+    }
+
+
+def machine() -> dict:
+    """What the timings depend on besides the code, stored with each run."""
+    return {"platform": platform.platform(), "processor": platform.machine(), "cpus": os.cpu_count(), "python": platform.python_version()}
+
+
+def summary_requests() -> int:
+    """Summary provider calls made during the run (single and batched, including retries)."""
+    from src.metrics import API_CALLS
+    return int(sum(value for (api, _), value in API_CALLS._values.items() if api in ("summary", "summary_batch")))
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a description of every gated metric that regressed beyond `tolerance`."""
+    if baseline.get("params") != result["params"]:
+        print(f"WARNING: baseline was recorded with different parameters: {baseline.get('params')}")
+    if baseline.get("machine") != result["machine"]:
+        print(f"WARNING: baseline was recorded on another machine ({baseline.get('machine')}); its timings are not comparable.")
+    regressions = []
+    for metric, higher_is_better in GATED_METRICS.items():
+        old, new = baseline.get(metric), result[metric]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        print(f"  {metric:<22} {old:>10} -> {new:>10} ({change:+.1%})")
+        if worse > tolerance:
+            regressions.append(f"{metric} regressed by {worse:.1%} (tolerance {tolerance:.0%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cvs", type=int, default=400, help="Total synthetic CVs (default: 400)")
+    parser.add_argument("--batch-size", type=int, default=100, help="CVs per upload (default: 100)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Uploads in flight at once (default: 2)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake provider latency per call (default: 50)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls failing with 429")
+    parser.add_argument("--rpm", type=int, default=0, help="GEMINI_REQUESTS_PER_MINUTE for the run (default: 0 = unlimited)")
+    parser.add_argument("--summary-batch", action="store_true", help="Pack short CVs into batched summary requests (SUMMARY_BATCH_ENABLED)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="Baseline JSON to compare against; exit 1 on regression")
+    parser.add_argument("--save-baseline", help="Write this run's results as a baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+    args = parser.parse_args()
+    if args.baseline and not os.path.exists(args.baseline):
+        parser.error(f"no baseline at {args.baseline}; record one on this machine with --save-baseline {args.baseline}")
+
+    # Configure the app before it is imported: fake providers, fresh cache and pool, no API key needed
+    scratch = tempfile.mkdtemp(prefix="cvranker-bench-")
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_PROVIDER_LATENCY_MS": str(args.latency_ms),
+        "FAKE_PROVIDER_ERROR_RATE": str(args.error_rate),
+        "FAKE_PROVIDER_RATE_LIMIT_RATE": str(args.rate_limit_rate),
+        "GEMINI_REQUESTS_PER_MINUTE": str(args.rpm),
+        "GEMINI_TOKENS_PER_MINUTE": "0",
+        "SUMMARY_BATCH_ENABLED": str(args.summary_batch).lower(),
+        "JOB_MAX_CONCURRENT": str(args.concurrency),
+        "JOB_QUEUE_MAX_SIZE": str(max(20, args.cvs // max(1, args.batch_size))),
+        "CACHE_DIR": os.path.join(scratch, "cache"),
+        "POOL_DIR": os.path.join(scratch, "pool"),
+    })
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    os.chdir(REPO_ROOT) # Templates are resolved relative to the working directory
+    sys.path.insert(0, REPO_ROOT)
+    import logging
+    logging.disable(logging.WARNING) # Keep the report readable; failures are counted instead
+
+    result = run_benchmark(args)
+    print(json.dumps(result, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.save_baseline}")
+
+    status = 0
+    if result["failed_batches"]:
+        print(f"FAIL: {result['failed_batches']} batch(es) failed.")
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Comparing against {args.baseline}:")
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"FAIL: {regression}")
+        if regressions:
+            status = 1
+        else:
+            print("OK: no regressions beyond tolerance.")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Micro-benchmark for the similarity engine.
+
+Compares the original per-CV scikit-learn cosine loop (one JD at a time) with the
+matrix engine in src/similarity.py (one float32 matmul for N CVs x M JDs plus
+argpartition top-k), for a range of batch sizes.
+
+Usage:
+    python benchmarks/similarity_benchmark.py [--dim 768] [--repeats 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+# Allow running from the repository root without installing the package
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.similarity import similarity_matrix, top_k_indices  # noqa: E402
+
+
+def legacy_scores(cv_embeddings: list, jd_embeddings: list) -> list:
+    """The pre-engine approach: one cosine_similarity call per CV, repeated per JD."""
+    all_scores = []
+    for jd in jd_embeddings:
+        jd_embedding = np.array(jd).reshape(1, -1)
+        scores = [round(cosine_similarity(np.array(cv).reshape(1, -1), jd_embedding)[0][0] * 100, 2) for cv in cv_embeddings]
+        all_scores.append(sorted(scores, reverse=True)[:10])
+    return all_scores
+
+
+def engine_scores(cv_embeddings: list, jd_embeddings: list) -> list:
+    """The matrix engine: one matmul, then argpartition top-k per JD."""
+    scores = similarity_matrix(cv_embeddings, jd_embeddings)
+    return [scores[top_k_indices(scores[:, j], 10), j] for j in range(scores.shape[1])]
+
+
+def best_of(fn, repeats: int, *args) -> float:
+    """Best wall-clock time in seconds over `repeats` runs."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (text-embedding-004 uses 768).")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per measurement; the best is reported.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'CVs':>7} {'JDs':>4} {'legacy (s)':>12} {'engine (s)':>12} {'speed-up':>9}")
+    for n_cvs in (100, 1000, 5000):
+        for n_jds in (1, 5, 20):
+            # Embeddings arrive from the API as nested Python lists, so that is what both paths get
+            cvs = rng.normal(size=(n_cvs, args.dim)).tolist()
+            jds = rng.normal(size=(n_jds, args.dim)).tolist()
+            # The legacy loop is slow; measure it once for the largest batches
+            legacy = best_of(legacy_scores, 1 if n_cvs * n_jds > 20000 else args.repeats, cvs, jds)
+            engine = best_of(engine_scores, args.repeats, cvs, jds)
+            print(f"{n_cvs:>7} {n_jds:>4} {legacy:>12.4f} {engine:>12.4f} {legacy / engine:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
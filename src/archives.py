@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import posixpath
+import tempfile
+import zipfile
+from typing import Iterator, List, NamedTuple, Optional
+
+from .config import (
+    ALLOWED_EXTENSIONS, MAX_FILE_SIZE_MB, UPLOAD_CHUNK_SIZE_KB,
+    ARCHIVE_MAX_MEMBERS, ARCHIVE_MAX_UNCOMPRESSED_MB, ARCHIVE_MAX_COMPRESSION_RATIO,
+)
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# Highly compressible small files (e.g. text-only PDFs) are not held to the compression ratio
+_RATIO_CHECK_MIN_BYTES = 1024 * 1024
+
+
+class ArchiveError(Exception):
+    """Raised when an archive cannot be read or trips one of the zip-bomb guards."""
+
+
+class ArchiveMember(NamedTuple):
+    """A PDF decompressed from an archive: its name in the archive, the saved path and its SHA-256."""
+    filename: str
+    path: str
+    content_hash: str
+
+
+def _is_pdf_member(info: zipfile.ZipInfo) -> bool:
+    name = info.filename
+    basename = posixpath.basename(name)
+    if info.is_dir() or name.startswith("__MACOSX/") or basename.startswith("._"):
+        return False # Directories and macOS resource forks
+    return "." in basename and basename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def _open(archive_path: str) -> zipfile.ZipFile:
+    try:
+        archive = zipfile.ZipFile(archive_path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ArchiveError(f"Not a readable ZIP archive ({e}).") from e
+    if len(archive.infolist()) > ARCHIVE_MAX_MEMBERS:
+        archive.close()
+        raise ArchiveError(f"Archive has more than {ARCHIVE_MAX_MEMBERS} entries.")
+    return archive
+
+
+def list_pdf_members(
+    archive_path: str,
+    max_total_bytes: int = ARCHIVE_MAX_UNCOMPRESSED_MB * 1024 * 1024,
+    max_ratio: float = ARCHIVE_MAX_COMPRESSION_RATIO,
+) -> List[str]:
+    """
+    Names of the PDFs in an archive, read from its central directory (nothing is decompressed).
+    Raises ArchiveError if the declared sizes already trip the zip-bomb guards; headers can
+    lie, so iter_pdf_members checks the real sizes again while decompressing.
+    """
+    with _open(archive_path) as archive:
+        members = [info for info in archive.infolist() if _is_pdf_member(info)]
+    if sum(info.file_size for info in members) > max_total_bytes:
+        raise ArchiveError(f"Archive expands to more than {max_total_bytes // (1024 * 1024)}MB.")
+    for info in members:
+        if info.file_size > _RATIO_CHECK_MIN_BYTES and info.file_size > max_ratio * max(info.compress_size, 1):
+            raise ArchiveError(f"{info.filename} expands more than {max_ratio:g} times its compressed size.")
+    return [info.filename for info in members]
+
+
+def iter_pdf_members(
+    archive_path: str,
+    directory: str,
+    max_member_bytes: int = MAX_FILE_SIZE_MB * 1024 * 1024,
+    max_total_bytes: int = ARCHIVE_MAX_UNCOMPRESSED_MB * 1024 * 1024,
+    max_ratio: float = ARCHIVE_MAX_COMPRESSION_RATIO,
+    chunk_size: int = UPLOAD_CHUNK_SIZE_KB * 1024,
+    skipped: Optional[List[str]] = None,
+) -> Iterator[ArchiveMember]:
+    """
+    Decompresses the PDFs in an archive one at a time, in archive order, each into a new
+    file in `directory`, and yields them as they are written. Only one member is held in
+    memory (one chunk at a time), whatever the archive size; the caller deletes each file
+    once it is done with it.
+
+    Sizes are counted while decompressing rather than trusted from the archive headers.
+    A PDF over `max_member_bytes`, or an encrypted one, is skipped (its name is appended to
+    `skipped`). Going over `max_total_bytes` in total, or a member expanding more than
+    `max_ratio` times its compressed size, raises ArchiveError (a likely zip bomb).
+    """
+    total_bytes = 0
+    with _open(archive_path) as archive:
+        for info in archive.infolist():
+            if not _is_pdf_member(info):
+                continue
+            filename = posixpath.basename(info.filename)
+            if info.flag_bits & 0x1:
+                logger.warning(f"Skipping encrypted archive member: {info.filename}")
+                if skipped is not None:
+                    skipped.append(filename)
+                continue
+            if info.file_size > max_member_bytes:
+                logger.warning(f"Skipping archive member over the file size limit: {info.filename}")
+                if skipped is not None:
+                    skipped.append(filename)
+                continue
+
+            # The member name is only used for display; the file on disk gets a generated name
+            fd, filepath = tempfile.mkstemp(dir=directory, suffix=".pdf")
+            digest = hashlib.sha256()
+            size = 0
+            too_large = False
+            try:
+                with os.fdopen(fd, "wb") as buffer, archive.open(info) as member:
+                    while True:
+                        chunk = member.read(chunk_size)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        total_bytes += len(chunk)
+                        if total_bytes > max_total_bytes:
+                            raise ArchiveError(f"Archive expands to more than {max_total_bytes // (1024 * 1024)}MB.")
+                        if size > _RATIO_CHECK_MIN_BYTES and size > max_ratio * max(info.compress_size, 1):
+                            raise ArchiveError(f"{info.filename} expands more than {max_ratio:g} times its compressed size.")
+                        if size > max_member_bytes:
+                            too_large = True
+                            break
+                        digest.update(chunk)
+                        buffer.write(chunk)
+            except zipfile.BadZipFile as e:
+                os.remove(filepath)
+                raise ArchiveError(f"Archive member {info.filename} is corrupt: {e}") from e
+            except NotImplementedError:
+                # Compression method zipfile cannot read; the rest of the archive may still be fine
+                os.remove(filepath)
+                logger.warning(f"Skipping archive member with an unsupported compression method: {info.filename}")
+                if skipped is not None:
+                    skipped.append(filename)
+                continue
+            except BaseException:
+                os.remove(filepath)
+                raise
+            if too_large:
+                os.remove(filepath)
+                logger.warning(f"Skipping archive member over the file size limit: {info.filename}")
+                if skipped is not None:
+                    skipped.append(filename)
+                continue
+            yield ArchiveMember(filename, filepath, digest.hexdigest())
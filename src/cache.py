@@ -0,0 +1,224 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .config import CACHE_ENABLED, CACHE_DIR, CACHE_MAX_MB
+from .metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# How long a cache call waits for another process's write lock before giving up (treated as a miss)
+BUSY_TIMEOUT_SECONDS = 5
+# A hit only rewrites an entry's access time if it is older than this; LRU order stays accurate to the interval
+ACCESS_UPDATE_SECONDS = 300
+# Hit/miss counts are written to the shared stats table at most this often
+STATS_FLUSH_SECONDS = 30
+# Eviction frees space down to this fraction of the limit, so it does not run again on the next write
+EVICT_TARGET_FRACTION = 0.9
+
+
+def sha256_hex(data) -> str:
+    """Returns the SHA-256 hex digest of bytes or a string (encoded as UTF-8)."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class DiskCache:
+    """
+    A size-bounded, disk-backed key/value cache with LRU eviction.
+
+    Entries live in a SQLite database in WAL mode, so several uvicorn worker
+    processes can share one cache directory safely. Hit and miss counts are
+    kept per key namespace (the part of the key before the first ':') both for
+    this process and, aggregated across processes, in the database itself.
+    Any storage error is logged and treated as a miss; the cache never fails a request.
+
+    Reads stay cheap: a hit only rewrites the entry's access time when it is older than
+    ACCESS_UPDATE_SECONDS, and hit/miss counts are written in one batch every
+    STATS_FLUSH_SECONDS. The total size is kept in a `meta` row updated with each write,
+    so checking the limit never re-sums the table. All calls block on SQLite; async
+    code runs them in a thread (asyncio.to_thread).
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "cache.sqlite3")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._local_stats: Dict[str, Dict[str, int]] = {}
+        self._pending_stats: Dict[str, Dict[str, int]] = {} # Not yet written to the shared stats table
+        self._stats_flushed_at = time.monotonic()
+        self._conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+            CREATE TABLE IF NOT EXISTS stats (
+                namespace TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        # Databases created before the running total existed are summed once here
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta (name, value) SELECT 'total_size', COALESCE(SUM(size), 0) FROM entries"
+        )
+        logger.info(f"Disk cache opened at {self.path} (limit {max_bytes / (1024 * 1024):.0f}MB).")
+
+    def _record(self, key: str, hit: bool) -> None:
+        namespace = key.split(":", 1)[0]
+        column = "hits" if hit else "misses"
+        for stats in (self._local_stats, self._pending_stats):
+            stats.setdefault(namespace, {"hits": 0, "misses": 0})[column] += 1
+        CACHE_REQUESTS.inc(kind=namespace, result="hit" if hit else "miss")
+        if time.monotonic() - self._stats_flushed_at >= STATS_FLUSH_SECONDS:
+            self._flush_stats()
+
+    def _flush_stats(self) -> None:
+        """Adds the counts recorded since the last flush to the shared stats table, in one transaction."""
+        if not self._pending_stats:
+            return
+        pending, self._pending_stats = self._pending_stats, {}
+        self._stats_flushed_at = time.monotonic()
+        try:
+            self._conn.executemany(
+                "INSERT INTO stats (namespace, hits, misses) VALUES (?, ?, ?) "
+                "ON CONFLICT(namespace) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                [(namespace, counts["hits"], counts["misses"]) for namespace, counts in pending.items()],
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not write cache stats: {e}")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached value for `key`, or None on a miss."""
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT value, last_access FROM entries WHERE key = ?", (key,)).fetchone()
+                now = time.time()
+                if row is not None and now - row[1] > ACCESS_UPDATE_SECONDS:
+                    # Touch the entry so eviction sees it as recently used
+                    self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                self._record(key, hit=row is not None)
+            return row[0] if row is not None else None
+        except sqlite3.Error as e:
+            logger.warning(f"Cache read failed for key '{key}': {e}")
+            return None
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """Returns {key: value} for the keys that are cached (one thread hop for a whole batch)."""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        """Stores `value` under `key`, evicting least recently used entries if over the size limit."""
+        if len(value) > self.max_bytes:
+            logger.warning(f"Not caching '{key}': value of {len(value)} bytes exceeds the cache size limit.")
+            return
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                        (key, sqlite3.Binary(value), len(value), time.time()),
+                    )
+                    total = self._add_size(len(value) - (old[0] if old else 0))
+                    if total > self.max_bytes:
+                        self._evict(total)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logger.warning(f"Cache write failed for key '{key}': {e}")
+
+    def set_many(self, items: Dict[str, bytes]) -> None:
+        """Stores several values (one thread hop for a whole batch)."""
+        for key, value in items.items():
+            self.set(key, value)
+
+    def _add_size(self, delta: int) -> int:
+        """Adjusts the running total size by `delta` and returns the new total. Runs inside set()'s transaction."""
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_size'", (delta,))
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+
+    def _evict(self, total: int) -> None:
+        """
+        Deletes least recently used entries until the total size is below EVICT_TARGET_FRACTION
+        of the limit. Walks the last_access index in small batches, so only the evicted
+        entries are read. Runs inside set()'s transaction.
+        """
+        target = int(self.max_bytes * EVICT_TARGET_FRACTION)
+        freed = evicted = 0
+        while total - freed > target:
+            batch = self._conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC LIMIT 64").fetchall()
+            if not batch:
+                break
+            for key, size in batch:
+                if total - freed <= target:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                freed += size
+                evicted += 1
+        self._add_size(-freed)
+        logger.info(f"Cache eviction removed {evicted} entries.")
+
+    def stats(self) -> dict:
+        """Returns hit/miss counts for this process and for all processes sharing the cache."""
+        with self._lock:
+            self._flush_stats()
+            shared_rows = self._conn.execute("SELECT namespace, hits, misses FROM stats").fetchall()
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = self._conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+            local = {namespace: dict(counts) for namespace, counts in self._local_stats.items()}
+        return {
+            "entries": entries,
+            "size_bytes": total,
+            "max_bytes": self.max_bytes,
+            "process": local,
+            "shared": {namespace: {"hits": hits, "misses": misses} for namespace, hits, misses in shared_rows},
+        }
+
+
+# --- Shared Instance ---
+_cache: Optional[DiskCache] = None
+_cache_failed = False # Set once opening fails, so we don't retry (and log) on every call
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[DiskCache]:
+    """Returns the process-wide cache, or None when caching is disabled or unavailable."""
+    global _cache, _cache_failed
+    if not CACHE_ENABLED or _cache_failed:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = DiskCache(CACHE_DIR, CACHE_MAX_MB * 1024 * 1024)
+            except (OSError, sqlite3.Error) as e:
+                _cache_failed = True
+                logger.error(f"Could not open disk cache at {CACHE_DIR}; continuing without caching: {e}", exc_info=True)
+                return None
+        return _cache
@@ -0,0 +1,97 @@
+import logging
+import re
+from typing import List, Tuple
+
+import numpy as np
+
+from .config import FAST_CHUNK_CHARS, FAST_CHUNK_OVERLAP_CHARS, FAST_POOLING
+from .similarity import EmbeddingMatrix, normalize_rows
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+POOLING_MODES = ("max", "mean")
+
+_WHITESPACE = re.compile(r"\s")
+
+
+def chunk_text(text: str, chunk_chars: int = FAST_CHUNK_CHARS, overlap_chars: int = FAST_CHUNK_OVERLAP_CHARS) -> List[str]:
+    """
+    Splits text into chunks of at most `chunk_chars` characters, each starting
+    `overlap_chars` before the previous one ended, so a sentence cut at a chunk boundary
+    is still whole in one of the two chunks. Cuts are moved back to whitespace where
+    there is some in the second half of the chunk. Empty text gives no chunks.
+    """
+    text = text.strip()
+    chunk_chars = max(1, chunk_chars)
+    overlap_chars = min(max(0, overlap_chars), chunk_chars // 2)
+    if len(text) <= chunk_chars:
+        return [text] if text else []
+
+    chunks = []
+    start = 0
+    while True:
+        end = start + chunk_chars
+        if end >= len(text):
+            chunks.append(text[start:].strip())
+            return chunks
+        # Prefer to cut between words
+        for cut in range(end, start + chunk_chars // 2, -1):
+            if _WHITESPACE.match(text, cut):
+                end = cut
+                break
+        chunks.append(text[start:end].strip())
+        start = end - overlap_chars
+
+
+def chunk_documents(texts: List[str], chunk_chars: int = FAST_CHUNK_CHARS, overlap_chars: int = FAST_CHUNK_OVERLAP_CHARS) -> Tuple[List[str], np.ndarray]:
+    """
+    Chunks every text. Returns all chunks in order, plus `counts`: how many chunks each
+    text has (0 for an empty text), so text i owns chunks counts[:i].sum() onwards.
+    """
+    chunks: List[str] = []
+    counts = np.zeros(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        text_chunks = chunk_text(text, chunk_chars, overlap_chars)
+        chunks.extend(text_chunks)
+        counts[i] = len(text_chunks)
+    return chunks, counts
+
+
+def pooled_similarity(
+    chunk_embeddings: EmbeddingMatrix,
+    counts: np.ndarray,
+    jd_embeddings: EmbeddingMatrix,
+    pooling: str = FAST_POOLING,
+) -> np.ndarray:
+    """
+    Scores documents from their chunks: cosine similarity (in percent, rounded to 2
+    decimals) of every chunk against every JD with one matrix product, pooled per
+    document with `pooling` ("max": its best chunk, "mean": the average chunk).
+    `counts` gives the chunks per document, in order (see chunk_documents); documents
+    without chunks score 0. Returns an (N documents, M JDs) array.
+    """
+    if pooling not in POOLING_MODES:
+        raise ValueError(f"Unknown pooling {pooling!r}; expected one of {POOLING_MODES}.")
+    counts = np.asarray(counts, dtype=np.int64)
+    jds = normalize_rows(jd_embeddings)
+    scores = np.zeros((counts.shape[0], jds.shape[0]))
+    has_chunks = counts > 0
+    if not has_chunks.any() or jds.size == 0:
+        return scores
+
+    chunks = normalize_rows(chunk_embeddings)
+    if chunks.shape[0] != counts.sum():
+        raise ValueError(f"Expected {counts.sum()} chunk embeddings, got {chunks.shape[0]}.")
+    if chunks.shape[1] != jds.shape[1]:
+        raise ValueError(f"Chunk embedding dimension {chunks.shape[1]} does not match JD embedding dimension {jds.shape[1]}.")
+    similarities = chunks @ jds.T # (chunks, JDs)
+
+    # Each document's chunks are one contiguous run of rows; reduceat pools every run at once.
+    # Runs are only taken for documents that have chunks (an empty run would reduce wrongly).
+    starts = (np.cumsum(counts) - counts)[has_chunks]
+    if pooling == "max":
+        pooled = np.maximum.reduceat(similarities, starts, axis=0)
+    else:
+        pooled = np.add.reduceat(similarities, starts, axis=0) / counts[has_chunks, None]
+    scores[has_chunks] = np.round(pooled.astype(np.float64) * 100, 2)
+    return scores
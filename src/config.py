@@ -1,4 +1,5 @@
 import os
+import hashlib
 from . import prompts
 
 import logging # New import
@@ -6,32 +7,190 @@ logger = logging.getLogger(__name__) # Initialize a logger for this module
 logging.basicConfig(level=logging.INFO) # Set the logging level
 
 # --- API Key Validation (Optional but Recommended) ---
+# Checked when the Gemini clients are first built rather than at import, so the app can
+# start (and report itself not ready at /ready) without the key.
+def require_google_api_key() -> str:
+    """Returns GOOGLE_API_KEY, raising ValueError if it is not set."""
+    api_key = os.getenv('GOOGLE_API_KEY')
+    if not api_key:
+        # Log a critical error if the API key is missing. This is a deployment blocker.
+        logger.critical(
+            "API key 'GOOGLE_API_KEY' not found in environment variables. "
+            "Please check your .env file and your deployment environment settings."
+        )
+        raise ValueError(
+            "API key 'GOOGLE_API_KEY' not found in environment variables. "
+            "Please check your .env file and your deployment environment settings."
+        )
+    return api_key
+
+
 if not os.getenv('GOOGLE_API_KEY'):
-    # Log a critical error if the API key is missing. This is a deployment blocker.
-    logger.critical(
-        "API key 'GOOGLE_API_KEY' not found in environment variables. "
-        "Please check your .env file and your deployment environment settings. "
-        "Application cannot start without it."
-    )
-    raise ValueError(
-        "API key 'GOOGLE_API_KEY' not found in environment variables. "
-        "Please check your .env file and your deployment environment settings."
-    )
+    logger.warning("API key 'GOOGLE_API_KEY' is not set; AI summarization and embedding will fail until it is.")
 
 
 # --- Model Configuration ---
 LLM_MODEL_NAME = "gemini-2.5-flash-lite"
 EMBEDDING_MODEL_NAME = "models/text-embedding-004"
 
+# --- Provider Configuration ---
+# "gemini" in production; "fake" swaps in deterministic local stand-ins (no API calls) for
+# offline benchmarking, with optional injected latency, server errors (503) and 429s.
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini').lower()
+FAKE_PROVIDER_LATENCY_MS = float(os.getenv('FAKE_PROVIDER_LATENCY_MS', 0))
+FAKE_PROVIDER_ERROR_RATE = float(os.getenv('FAKE_PROVIDER_ERROR_RATE', 0))
+FAKE_PROVIDER_RATE_LIMIT_RATE = float(os.getenv('FAKE_PROVIDER_RATE_LIMIT_RATE', 0))
+
 # --- Prompt Configuration ---
 SUMMARIZER_PROMPT_MESSAGES = [
     ("system", prompts.SUMMARIZER_SYSTEM_PROMPT),
     ("user", prompts.SUMMARIZER_USER_PROMPT)
 ]
+# Fingerprint of the summarizer prompt, part of every cached summary key so that
+# editing a prompt invalidates summaries produced with the old wording.
+SUMMARIZER_PROMPT_HASH = hashlib.sha256(repr(SUMMARIZER_PROMPT_MESSAGES).encode("utf-8")).hexdigest()[:16]
+# Prompt for packing several CVs into one request, answered with structured JSON
+BATCH_SUMMARIZER_PROMPT_MESSAGES = [
+    ("system", prompts.BATCH_SUMMARIZER_SYSTEM_PROMPT),
+    ("user", prompts.BATCH_SUMMARIZER_USER_PROMPT)
+]
+BATCH_SUMMARIZER_PROMPT_HASH = hashlib.sha256(repr(BATCH_SUMMARIZER_PROMPT_MESSAGES).encode("utf-8")).hexdigest()[:16]
+
+# --- Batched Summarization ---
+# Off by default. When on, short CVs are packed into one request of up to SUMMARY_BATCH_MAX_CVS
+# CVs and SUMMARY_BATCH_MAX_TOKENS estimated input tokens; longer CVs are still sent one by one.
+SUMMARY_BATCH_ENABLED = os.getenv('SUMMARY_BATCH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SUMMARY_BATCH_MAX_CVS = int(os.getenv('SUMMARY_BATCH_MAX_CVS', 8))
+SUMMARY_BATCH_MAX_TOKENS = int(os.getenv('SUMMARY_BATCH_MAX_TOKENS', 8000))
+# CVs estimated above this many tokens count as long and are never packed.
+SUMMARY_BATCH_MAX_CV_TOKENS = int(os.getenv('SUMMARY_BATCH_MAX_CV_TOKENS', 2000))
+
+# --- Concurrency Configuration ---
+# Maximum number of summarization calls in flight at once for a single request.
+SUMMARY_MAX_CONCURRENCY = int(os.getenv('SUMMARY_MAX_CONCURRENCY', 8))
+# Worker processes used for PDF text extraction (CPU-bound, so defaults to the core count).
+PDF_EXTRACTION_WORKERS = int(os.getenv('PDF_EXTRACTION_WORKERS', os.cpu_count() or 1))
+# Seconds a worker may spend parsing a single PDF before it is skipped (treated as empty text);
+# time spent waiting for a free worker does not count.
+PDF_EXTRACTION_TIMEOUT_SECONDS = float(os.getenv('PDF_EXTRACTION_TIMEOUT_SECONDS', 60))
+# Embedding requests are split into batches within the API's per-request limits (texts and
+# estimated tokens); up to EMBEDDING_MAX_CONCURRENCY batches run at once across the process,
+# and a failing batch is retried on its own.
+EMBEDDING_BATCH_MAX_DOCS = int(os.getenv('EMBEDDING_BATCH_MAX_DOCS', 100))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv('EMBEDDING_BATCH_MAX_TOKENS', 20000))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv('EMBEDDING_MAX_CONCURRENCY', 4))
+
+# --- PDF Text Extraction ---
+# "pdfium" reads the raw text layer (fast); "pdfplumber" runs full layout analysis (slow).
+# The fallback engine is tried when the first one fails or finds almost no text.
+PDF_TEXT_ENGINE = os.getenv('PDF_TEXT_ENGINE', 'pdfium').lower()
+PDF_FALLBACK_ENGINE = os.getenv('PDF_FALLBACK_ENGINE', 'pdfplumber').lower()
+PDF_MIN_TEXT_CHARS = int(os.getenv('PDF_MIN_TEXT_CHARS', 50))
+# Budgets per file (0 = unlimited): pages read, and characters or estimated tokens kept.
+# Reading stops as soon as a budget is reached; the model never needs a whole long document.
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 10))
+PDF_MAX_CHARS = int(os.getenv('PDF_MAX_CHARS', 30000))
+PDF_MAX_TOKENS = int(os.getenv('PDF_MAX_TOKENS', 0))
+# Fingerprint of the extraction settings, part of every cached text key so that changing
+# the engine or a budget does not serve text extracted under the old settings.
+PDF_EXTRACTION_FINGERPRINT = hashlib.sha256(repr(
+    (PDF_TEXT_ENGINE, PDF_FALLBACK_ENGINE, PDF_MIN_TEXT_CHARS, PDF_MAX_PAGES, PDF_MAX_CHARS, PDF_MAX_TOKENS)
+).encode("utf-8")).hexdigest()[:16]
+
+# --- Gemini API Rate Limiting ---
+# Process-wide budgets shared by summarization and embedding calls (0 disables a budget).
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', 300))
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv('GEMINI_TOKENS_PER_MINUTE', 1000000))
+# Upper bound for Gemini calls in flight; the live limit halves on 429s and recovers on success.
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', 16))
+# Consecutive server errors/timeouts that open the circuit breaker, and how long it stays open.
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv('CIRCUIT_BREAKER_RESET_SECONDS', 30))
+
+# --- Lexical Pre-filter Configuration ---
+# Optional local BM25 stage: only the best PREFILTER_TOP_K CVs per JD are summarized and embedded.
+# Off unless enabled here; the upload form can still set K per request (0 = summarize all).
+PREFILTER_ENABLED = os.getenv('PREFILTER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PREFILTER_TOP_K = int(os.getenv('PREFILTER_TOP_K', 25))
+# CVs scoring below this fraction of the best BM25 score for every JD are dropped too (0 = off).
+PREFILTER_MIN_RELATIVE_SCORE = float(os.getenv('PREFILTER_MIN_RELATIVE_SCORE', 0))
+
+# --- Ranking Mode Configuration ---
+# "summary": CVs are summarized by the LLM and the summaries are embedded (default).
+# "fast": no LLM before ranking; the raw CV text is split into overlapping chunks, the chunks are
+# embedded, and each CV scores its best (max) or average (mean) chunk similarity to the JD.
+# Summaries are then generated only for the rows actually shown. The upload form can choose per request.
+RANKING_MODE = os.getenv('RANKING_MODE', 'summary').lower()
+FAST_CHUNK_CHARS = int(os.getenv('FAST_CHUNK_CHARS', 2000))
+FAST_CHUNK_OVERLAP_CHARS = int(os.getenv('FAST_CHUNK_OVERLAP_CHARS', 200))
+FAST_POOLING = os.getenv('FAST_POOLING', 'max').lower()
+
+# --- Startup Configuration ---
+# Build the Gemini clients in the background right after startup, so the first upload does not
+# pay for it. /ready reports not ready until this has finished.
+WARM_UP_CLIENTS_ON_STARTUP = os.getenv('WARM_UP_CLIENTS_ON_STARTUP', 'true').lower() in ('1', 'true', 'yes')
+
+# --- Background Job Configuration ---
+# Uploads are processed as background jobs; at most this many run at once.
+JOB_MAX_CONCURRENT = int(os.getenv('JOB_MAX_CONCURRENT', 2))
+# Jobs waiting beyond this are rejected with 503 instead of queueing without bound.
+JOB_QUEUE_MAX_SIZE = int(os.getenv('JOB_QUEUE_MAX_SIZE', 20))
+# Seconds a finished job (and its results) stays available.
+JOB_RESULT_TTL_SECONDS = int(os.getenv('JOB_RESULT_TTL_SECONDS', 3600))
+# Time budget per job, from when it starts running (0 = none). Summaries still running when it
+# runs out are cancelled; the CVs summarized so far are ranked and the rest marked not processed.
+JOB_TIME_BUDGET_SECONDS = float(os.getenv('JOB_TIME_BUDGET_SECONDS', 600))
+# A running job whose progress page (or poller) has gone away for this long is cancelled,
+# including its in-flight API calls (0 = never). Jobs nobody ever watched are not affected.
+JOB_ABANDON_SECONDS = float(os.getenv('JOB_ABANDON_SECONDS', 60))
+
+# --- Result Store Configuration ---
+# Ranked results are kept server-side so re-filtering and downloads skip recomputation.
+RESULT_STORE_TTL_SECONDS = int(os.getenv('RESULT_STORE_TTL_SECONDS', 3600))
+RESULT_STORE_MAX_MB = int(os.getenv('RESULT_STORE_MAX_MB', 256))
+# The results page renders the first RESULTS_PAGE_SIZE rows per JD and loads the rest in pages
+# from /results/{id}/rows; API clients may ask for up to RESULTS_PAGE_MAX rows per page.
+RESULTS_PAGE_SIZE = int(os.getenv('RESULTS_PAGE_SIZE', 25))
+RESULTS_PAGE_MAX = int(os.getenv('RESULTS_PAGE_MAX', 200))
+
+# --- Report Rendering Configuration ---
+# PDF reports are rendered by WeasyPrint in this many worker processes, off the event loop;
+# further downloads wait for a free worker.
+REPORT_RENDER_WORKERS = int(os.getenv('REPORT_RENDER_WORKERS', 2))
+# Rows written per chunk when CSV/NDJSON downloads are streamed.
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 200))
+
+# --- Cache Configuration ---
+# Disk cache for extracted text, summaries, embeddings and PDF reports, shared by all workers on a host.
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CACHE_DIR = os.getenv('CACHE_DIR', '.cache')
+CACHE_MAX_MB = int(os.getenv('CACHE_MAX_MB', 512))
+
+# --- Talent Pool Configuration ---
+# Directory holding the persistent talent pool (embeddings matrix, records, optional index).
+POOL_DIR = os.getenv('POOL_DIR', 'talent_pool')
+# Pools at least this large use the approximate partitioned index when one has been built.
+POOL_IVF_MIN_SIZE = int(os.getenv('POOL_IVF_MIN_SIZE', 20000))
+# Number of index partitions scanned per approximate query (higher = more accurate, slower).
+POOL_IVF_PROBES = int(os.getenv('POOL_IVF_PROBES', 8))
 
 # --- Application & UI Configuration ---
 ALLOWED_EXTENSIONS = {'pdf'}
 MAX_FILE_SIZE_MB = 20 # Used for both frontend and backend validation
+# Total bytes a single request may upload across all of its files.
+MAX_REQUEST_SIZE_MB = int(os.getenv('MAX_REQUEST_SIZE_MB', 500))
+# Uploads are copied to disk (and hashed) in chunks of this size, so memory use stays bounded.
+UPLOAD_CHUNK_SIZE_KB = int(os.getenv('UPLOAD_CHUNK_SIZE_KB', 1024))
+
+# --- ZIP Archive Ingestion ---
+# CVs may also be uploaded as ZIP archives of PDFs; an archive only counts against MAX_REQUEST_SIZE_MB.
+ARCHIVE_EXTENSIONS = {'zip'}
+# Zip-bomb guards: entries per archive, total decompressed size, and decompressed/compressed ratio.
+ARCHIVE_MAX_MEMBERS = int(os.getenv('ARCHIVE_MAX_MEMBERS', 5000))
+ARCHIVE_MAX_UNCOMPRESSED_MB = int(os.getenv('ARCHIVE_MAX_UNCOMPRESSED_MB', 4096))
+ARCHIVE_MAX_COMPRESSION_RATIO = float(os.getenv('ARCHIVE_MAX_COMPRESSION_RATIO', 100))
+# Decompressed PDFs waiting for (or in) extraction at any time; each is deleted once extracted.
+ARCHIVE_MAX_PENDING_FILES = int(os.getenv('ARCHIVE_MAX_PENDING_FILES', max(4, 2 * PDF_EXTRACTION_WORKERS)))
 
 # --- Data Structure Configuration ---
 DATA_COLUMNS = {
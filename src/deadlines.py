@@ -0,0 +1,110 @@
+import asyncio
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+
+class BudgetSpentError(Exception):
+    """Raised instead of waiting for an API call slot once the request's time budget is spent."""
+
+
+class RequestBudget:
+    """
+    The time a request (or its background job) may spend on API work, and whether it has
+    been cancelled. Read from worker threads too, so cancellation is a threading.Event.
+    """
+
+    def __init__(self, seconds: float = 0):
+        # 0 = no deadline; the budget can still be cancelled
+        self.deadline = time.monotonic() + seconds if seconds > 0 else None
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (0 once cancelled), or None without a deadline."""
+        if self._cancelled.is_set():
+            return 0.0
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def spent(self) -> bool:
+        """True once the deadline has passed or the budget was cancelled."""
+        return self.remaining() == 0.0
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def without_deadline(self) -> "RequestBudget":
+        """A budget with no deadline that is cancelled along with this one."""
+        budget = RequestBudget()
+        budget._cancelled = self._cancelled
+        return budget
+
+
+# The budget of the current request; copied into its tasks and worker threads like the trace id
+budget_var: contextvars.ContextVar[Optional[RequestBudget]] = contextvars.ContextVar("request_budget", default=None)
+
+
+def budget_spent() -> bool:
+    """True if the current request's deadline has passed or it was cancelled (False without a budget)."""
+    budget = budget_var.get()
+    return budget is not None and budget.spent
+
+
+@contextlib.contextmanager
+def deadline_lifted() -> Iterator[None]:
+    """
+    Runs the block without the current request's deadline, though cancelling the request
+    still stops it: for the work that turns what finished in time into a result.
+    """
+    budget = budget_var.get()
+    if budget is None:
+        yield
+        return
+    token = budget_var.set(budget.without_deadline())
+    try:
+        yield
+    finally:
+        budget_var.reset(token)
+
+
+def stop_when_budget_spent(retry_state) -> bool:
+    """tenacity stop condition: no further retries once the request's budget is spent."""
+    if budget_spent():
+        logger.info("Not retrying: the request's time budget is spent.")
+        return True
+    return False
+
+
+async def gather_within_budget(aws: Iterable[Awaitable], placeholder: Any) -> List[Any]:
+    """
+    Like asyncio.gather, but only until the current request's deadline: whatever has not
+    finished by then is cancelled and returned as `placeholder`, in its place in the list.
+    If the caller itself is cancelled, every awaitable is cancelled with it.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return []
+    budget = budget_var.get()
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=budget.remaining() if budget is not None else None)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+        logger.warning(f"Time budget ran out with {len(pending)} of {len(tasks)} calls unfinished; they were cancelled.")
+    return [placeholder if task in pending else task.result() for task in tasks]
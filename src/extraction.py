@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional
+
+from .config import PDF_EXTRACTION_WORKERS, PDF_EXTRACTION_TIMEOUT_SECONDS, PDF_EXTRACTION_FINGERPRINT, PDF_TEXT_ENGINE
+from .pdf_text import PdfText, extract_pdf_text
+from .cache import get_cache
+from .metrics import PDF_EXTRACTION_SECONDS, PDF_TRUNCATED
+from .deadlines import budget_spent
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# --- Process Pool Management ---
+# PDF parsing is CPU-bound and holds the GIL, so extraction runs in separate processes.
+# "spawn" is used instead of "fork" because the parent holds gRPC/HTTP client threads
+# that are not fork-safe.
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# Files are only submitted once a worker is free, so the per-file timeout measures parsing,
+# not time spent queued behind other files (or other jobs). One semaphore per event loop.
+_worker_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Returns the shared extraction pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = max(1, PDF_EXTRACTION_WORKERS)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"Started PDF extraction process pool with {workers} workers.")
+        return _pool
+
+
+def _get_worker_slots() -> asyncio.Semaphore:
+    """Returns the semaphore limiting files in flight to the number of workers, for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        slots = _worker_slots.get(loop)
+        if slots is None:
+            slots = _worker_slots[loop] = asyncio.Semaphore(max(1, PDF_EXTRACTION_WORKERS))
+        return slots
+
+
+def _retire_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Replaces the shared pool after a timeout or worker crash. A worker stuck on a malformed
+    PDF would otherwise keep its slot busy (and burn CPU) for good, so the old pool's worker
+    processes are terminated. Files other workers were parsing at that moment fail with
+    BrokenProcessPool and are retried on the fresh pool (see extract_texts_from_pdfs).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return # Already replaced by a concurrent request
+        _pool = None
+    processes = list((pool._processes or {}).values()) # Taken before shutdown() lets go of them
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    logger.warning(f"PDF extraction process pool retired ({len(processes)} workers terminated); a fresh pool will be used for new work.")
+
+
+def shutdown_extraction_pool() -> None:
+    """Shuts the extraction pool down. Called from the application's shutdown hook."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+        logger.info("PDF extraction process pool shut down.")
+
+
+def _text_cache_key(content_hash: str) -> str:
+    """Cache key for extracted text: depends on the file content and the extraction settings."""
+    return f"text:{PDF_EXTRACTION_FINGERPRINT}:{content_hash}"
+
+
+def _record(filename: str, result: PdfText) -> None:
+    """Reports one file's extraction time, engine and truncation (metrics and debug log)."""
+    if not result.engine:
+        return # Unreadable; the worker already logged why
+    PDF_EXTRACTION_SECONDS.observe(result.seconds, engine=result.engine)
+    if result.truncated:
+        PDF_TRUNCATED.inc()
+    if result.engine != PDF_TEXT_ENGINE:
+        logger.info(f"Extracted {filename} with the fallback engine {result.engine}.")
+    logger.debug(
+        f"Extracted {filename} with {result.engine} in {result.seconds:.3f}s: "
+        f"{result.pages_read}/{result.page_count} pages, {len(result.text)} characters"
+        f"{' (truncated)' if result.truncated else ''}."
+    )
+
+
+async def extract_texts_from_pdfs(
+    pdf_paths: List[str],
+    content_hashes: Optional[List[str]] = None,
+    timeout: float = PDF_EXTRACTION_TIMEOUT_SECONDS,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    always_extract: int = 0,
+) -> List[Optional[str]]:
+    """
+    Extracts text from several PDF files in parallel using the process pool, with the
+    engine and page/character budgets from config (see src/pdf_text.py).
+    Results are returned in input order. A file that fails or takes longer than `timeout`
+    seconds once a worker has picked it up yields an empty string, matching
+    extract_text_from_pdf; files waiting for a free worker are not timed.
+    Per-file time (by engine) and truncation are recorded in the metrics.
+
+    If `content_hashes` (SHA-256 of each file's bytes) is given, previously
+    extracted text is served from the disk cache and only new files are parsed.
+    `on_progress(done, total)` is called on the event loop as files finish.
+
+    Once the request's time budget (see deadlines.py) is spent, files that have not been
+    handed to a worker yet are not parsed and come back as None, except the first
+    `always_extract` files (e.g. the JDs, which every result needs).
+    """
+    if not pdf_paths:
+        return []
+
+    cache = get_cache() if content_hashes else None
+    texts: List[Optional[str]] = [None] * len(pdf_paths)
+    if cache is not None:
+        # SQLite calls block, so the whole batch of lookups runs in a thread
+        cached = await asyncio.to_thread(cache.get_many, [_text_cache_key(content_hash) for content_hash in content_hashes])
+        for i, content_hash in enumerate(content_hashes):
+            value = cached.get(_text_cache_key(content_hash))
+            if value is not None:
+                texts[i] = value.decode("utf-8")
+    pending = [i for i, text in enumerate(texts) if text is None]
+    if cache is not None:
+        logger.info(f"Extraction cache: {len(pdf_paths) - len(pending)} hits, {len(pending)} misses.")
+    done = len(pdf_paths) - len(pending)
+    if on_progress is not None:
+        on_progress(done, len(pdf_paths))
+    if not pending:
+        return texts
+
+    loop = asyncio.get_running_loop()
+    slots = _get_worker_slots()
+
+    async def _extract(index: int) -> Optional[str]:
+        nonlocal done
+        text = await _extract_in_pool(pdf_paths[index], index < always_extract)
+        done += 1
+        if on_progress is not None:
+            on_progress(done, len(pdf_paths))
+        return text
+
+    async def _extract_in_pool(path: str, required: bool) -> Optional[str]:
+        filename = os.path.basename(path)
+        for attempt in range(2):
+            async with slots:
+                if not required and budget_spent():
+                    return None
+                pool = _get_pool()
+                try:
+                    result = await asyncio.wait_for(loop.run_in_executor(pool, extract_pdf_text, path), timeout)
+                    _record(filename, result)
+                    return result.text
+                except asyncio.TimeoutError:
+                    logger.error(f"PDF extraction timed out after {timeout}s: {filename}")
+                    _retire_pool(pool) # Kills the stuck worker before its slot is released
+                    return ""
+                except BrokenProcessPool as e:
+                    with _pool_lock:
+                        replaced = _pool is not pool
+                    if replaced and attempt == 0:
+                        # The pool was retired while this file was being parsed; try it on the new one
+                        continue
+                    # A worker died (e.g. crashed on a malformed file); the pool cannot be reused
+                    logger.error(f"PDF extraction worker crashed while processing {filename}: {e}")
+                    _retire_pool(pool)
+                    return ""
+                except Exception as e:
+                    logger.error(f"PDF extraction failed in worker for {filename}: {e}", exc_info=True)
+                    return ""
+        return ""
+
+    extracted = await asyncio.gather(*(_extract(i) for i in pending))
+    not_extracted = extracted.count(None)
+    if not_extracted:
+        logger.warning(f"Time budget ran out: {not_extracted} of {len(pdf_paths)} PDFs were not extracted.")
+
+    for i, text in zip(pending, extracted):
+        texts[i] = text
+    if cache is not None:
+        # Empty text may come from a timeout or crash, so it is never cached
+        await asyncio.to_thread(cache.set_many, {
+            _text_cache_key(content_hashes[i]): text.encode("utf-8") for i, text in zip(pending, extracted) if text
+        })
+
+    return texts
@@ -1,28 +1,36 @@
+import contextvars
 import logging
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Union
+
+import numpy as np
 # Imports for tenacity
-from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
+from tenacity import retry, wait_random_exponential, stop_after_attempt, retry_if_exception_type
 
 # Specific Google API exceptions that are typically retryable
 # These are from google-api-core, which underlies langchain-google-genai
 from google.api_core.exceptions import ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded, GoogleAPIError
 
-# Import the new config variables
-from .config import EMBEDDING_MODEL_NAME
+from .config import EMBEDDING_BATCH_MAX_DOCS, EMBEDDING_BATCH_MAX_TOKENS, EMBEDDING_MAX_CONCURRENCY
+from .cache import get_cache, sha256_hex
+from .providers import get_embedding_provider
+from .metrics import API_RETRIES
+from .rate_limit import gemini_limiter, estimate_tokens, CircuitOpenError, RETRYABLE_ERRORS
+from .deadlines import BudgetSpentError, stop_when_budget_spent
+from .singleflight import embedding_flight
 
 logger = logging.getLogger(__name__) # Initialize a logger for this module
 
-# Initialize the embedding model once using values from config
-embeddings_model = GoogleGenerativeAIEmbeddings(
-    model=EMBEDDING_MODEL_NAME
-)
-
 @retry(
-    wait=wait_exponential(multiplier=1, min=4, max=10), # Exponential backoff: 4s, 8s, 16s, ... up to 10s max
-    stop=stop_after_attempt(5), # Try up to 5 times in total (1 initial attempt + 4 retries)
+    wait=wait_random_exponential(multiplier=1, max=10), # Random backoff within 1s, 2s, 4s, ... up to 10s max
+    # Try up to 5 times in total (1 initial attempt + 4 retries), and never after the request's deadline
+    stop=stop_after_attempt(5) | stop_when_budget_spent,
     # Retry on specific Google API errors: Quota Exceeded (429), Internal Server Error (500),
-    # Service Unavailable (503), and Deadline Exceeded (timeout)
-    retry=retry_if_exception_type((ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded)),
+    # Service Unavailable (503), and Deadline Exceeded (timeout). Pacing is left to the shared limiter.
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    before_sleep=lambda retry_state: API_RETRIES.inc(api="embedding"),
     reraise=True # Re-raise the last exception if all retries fail, to be caught by the outer try-except
 )
 def _embed_documents_with_retry(documents: list[str]) -> list[list[float]]:
@@ -31,22 +39,164 @@ def _embed_documents_with_retry(documents: list[str]) -> list[list[float]]:
     This function will be retried automatically by tenacity on transient errors.
     """
     logger.debug("Attempting to embed documents with GoogleGenerativeAIEmbeddings.")
-    embeddings = embeddings_model.embed_documents(documents)
+    # The whole batch is one call against the process-wide Gemini limiter
+    with gemini_limiter.limit(sum(estimate_tokens(document) for document in documents), api="embedding"):
+        embeddings = get_embedding_provider().embed_documents(documents)
     logger.debug("GoogleGenerativeAIEmbeddings successful.")
     return embeddings
 
-def embed_multiple_documents(documents: list[str]) -> list[list[float]]:
+def _embedding_cache_key(document: str) -> str:
+    """Cache key for an embedding: depends on the provider/model and the document text."""
+    return f"embedding:{get_embedding_provider().cache_namespace}:{sha256_hex(document)}"
+
+
+def batch_documents(
+    documents: List[str],
+    max_docs: int = EMBEDDING_BATCH_MAX_DOCS,
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+) -> List[List[str]]:
+    """
+    Splits documents, in order, into batches of at most `max_docs` texts and `max_tokens`
+    estimated tokens. A document over the token limit on its own gets a batch to itself.
+    """
+    batches: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+    for document in documents:
+        tokens = estimate_tokens(document)
+        if current and (len(current) >= max(1, max_docs) or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(document)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+# --- Batch Pool ---
+# Batches are sent from a small shared thread pool, so at most EMBEDDING_MAX_CONCURRENCY
+# embedding requests are in flight across the whole process.
+_batch_pool: Optional[ThreadPoolExecutor] = None
+_batch_pool_lock = threading.Lock()
+
+
+def _get_batch_pool() -> ThreadPoolExecutor:
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ThreadPoolExecutor(max_workers=max(1, EMBEDDING_MAX_CONCURRENCY), thread_name_prefix="embedding")
+        return _batch_pool
+
+
+def shutdown_embedding_pool() -> None:
+    """Shuts the batch pool down. Called from the application's shutdown hook."""
+    global _batch_pool
+    with _batch_pool_lock:
+        pool, _batch_pool = _batch_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _embed_batch(batch: List[str]) -> np.ndarray:
+    """Embeds one batch (with retries) and returns its float32 rows."""
+    embeddings = _embed_documents_with_retry(batch)
+    if len(embeddings) != len(batch):
+        raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}.")
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def _embed_and_store(document: str, key: str, cache) -> np.ndarray:
+    """Embeds one document whose in-flight call was released by another request, and caches it."""
+    vector = _embed_batch([document])[0]
+    if cache is not None:
+        cache.set(key, vector.tobytes())
+    return vector
+
+
+def _embed_batches(batches: List[List[str]]) -> List[Union[np.ndarray, Exception]]:
+    """Runs the batches concurrently; returns each batch's matrix, or the error it finally failed with."""
+    pool = _get_batch_pool()
+    # Each batch runs in a copy of the caller's context, so retries see the request's time budget
+    futures = [pool.submit(contextvars.copy_context().run, _embed_batch, batch) for batch in batches]
+    outcomes: List[Union[np.ndarray, Exception]] = []
+    for future in futures:
+        try:
+            outcomes.append(future.result())
+        except Exception as e:
+            outcomes.append(e)
+    return outcomes
+
+
+def embed_multiple_documents(documents: list[str]) -> np.ndarray:
     """
-    Generates embeddings for a list of documents using LangChain.
-    Handles empty input and API errors with retries.
+    Generates embeddings for a list of documents and returns them as one contiguous
+    (len(documents), dim) float32 matrix, a row per document in input order.
+    Identical documents are embedded once. Embeddings found in the disk cache are reused;
+    the rest are sent in concurrent batches within the API's per-request limits, each
+    retried on its own, so one failing batch does not resend the others. If a batch still
+    fails, its error is raised (the other batches' embeddings are cached by then).
     """
     if not documents:
-        logger.info("No documents provided for embedding. Returning empty list.")
-        return []
-        
+        logger.info("No documents provided for embedding. Returning an empty matrix.")
+        return np.empty((0, 0), dtype=np.float32)
+
+    cache = get_cache()
+    # dict.fromkeys keeps the first occurrence of each distinct text, in order
+    unique_documents = list(dict.fromkeys(documents))
+    vectors: Dict[str, np.ndarray] = {}
+    if cache is not None:
+        for document in unique_documents:
+            cached = cache.get(_embedding_cache_key(document))
+            if cached is not None:
+                vectors[document] = np.frombuffer(cached, dtype=np.float32)
+    pending = [document for document in unique_documents if document not in vectors]
+    if cache is not None:
+        logger.info(f"Embedding cache: {len(unique_documents) - len(pending)} hits, {len(pending)} misses.")
+
+    # Documents another request is already embedding are waited for instead of sent again
+    # (single flight); the rest are claimed so later requests wait for this call
+    keys = {document: _embedding_cache_key(document) for document in pending}
+    claims = {}
+    joined = {}
+    for document in pending:
+        future, leader = embedding_flight.claim(keys[document])
+        (claims if leader else joined)[document] = future
+
     try:
-        # Call the retriable internal function
-        return _embed_documents_with_retry(documents)
+        if claims:
+            batches = batch_documents(list(claims))
+            logger.info(f"Embedding {len(claims)} documents in {len(batches)} batches.")
+            failures = []
+            for batch, outcome in zip(batches, _embed_batches(batches)):
+                if isinstance(outcome, BudgetSpentError):
+                    # Only this request ran out of time; waiting requests embed these documents themselves
+                    for document in batch:
+                        embedding_flight.release(keys[document], claims[document])
+                    failures.append(outcome)
+                    continue
+                if isinstance(outcome, Exception):
+                    # Every request waiting on these documents gets the same error
+                    for document in batch:
+                        embedding_flight.finish(keys[document], claims[document], error=outcome)
+                    failures.append(outcome)
+                    continue
+                for document, vector in zip(batch, outcome):
+                    vectors[document] = vector
+                    if cache is not None:
+                        cache.set(keys[document], vector.tobytes())
+                    embedding_flight.finish(keys[document], claims[document], vector)
+            if failures:
+                logger.error(f"{len(failures)} of {len(batches)} embedding batches failed.")
+                raise failures[0]
+        # Claimed documents are finished first, so two requests waiting on each other cannot deadlock
+        for document, future in joined.items():
+            vectors[document] = embedding_flight.result(keys[document], future, partial(_embed_and_store, document, keys[document], cache))
+        return np.stack([vectors[document] for document in documents])
+    except CircuitOpenError as e:
+        # The API has been failing; fail fast instead of queueing more calls against it.
+        logger.error(f"Embedding skipped: {e}")
+        raise # Re-raise to app.py
     except (ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded) as e:
         # This block catches the exception if all retries have failed for known transient API issues.
         logger.error(f"Persistent Google Generative AI API error after retries during embedding: {e}", exc_info=True)
@@ -59,4 +209,9 @@ def embed_multiple_documents(documents: list[str]) -> list[list[float]]:
     except Exception as e:
         # This block catches any other unexpected exceptions.
         logger.error(f"An unexpected error occurred during document embedding: {e}", exc_info=True)
-        raise # Re-raise to app.py
\ No newline at end of file
+        raise # Re-raise to app.py
+    finally:
+        # Never leave waiters hanging on a claim this call could not finish (e.g. interrupted)
+        for document, future in claims.items():
+            if not future.done():
+                embedding_flight.finish(keys[document], future, error=RuntimeError("The embedding call was interrupted."))
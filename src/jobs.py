@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .config import JOB_MAX_CONCURRENT, JOB_QUEUE_MAX_SIZE, JOB_RESULT_TTL_SECONDS, JOB_TIME_BUDGET_SECONDS, JOB_ABANDON_SECONDS
+from .deadlines import RequestBudget, budget_var
+from .metrics import Gauge, JOBS_ABANDONED, trace_id_var
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# How often a running job is checked for a client that went away
+_WATCH_INTERVAL_SECONDS = 5.0
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobFailedError(Exception):
+    """Raised by a job's work to fail it with a message that is safe to show to the user."""
+
+
+class Job:
+    """
+    A unit of background work with per-stage progress that can be streamed to clients.
+    All methods are called on the event loop thread.
+    """
+
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.status = QUEUED
+        self.progress: Dict[str, dict] = {} # stage -> {"done": n, "total": N}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        # Trace id of the request that submitted the job, restored while the job runs
+        self.trace_id = trace_id_var.get()
+        self.finished_at: Optional[float] = None
+        # Time budget of the running job; cancelled along with the job
+        self.budget: Optional[RequestBudget] = None
+        # Clients following the job: open event streams, and when one was last seen (None = never)
+        self.watchers = 0
+        self.last_seen: Optional[float] = None
+        # Latest event per progress stage plus the status events, by key, in publishing order and
+        # numbered; earlier progress events are dropped, so a long job keeps only a handful
+        self._events: Dict[str, Tuple[int, dict]] = {}
+        self._sequence = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def report(self, stage: str, done: int, total: int) -> None:
+        """Records progress for a pipeline stage and wakes up event stream subscribers."""
+        self.progress[stage] = {"done": done, "total": total}
+        self._publish({"event": "progress", "stage": stage, "done": done, "total": total})
+
+    def _set_status(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        if self.finished:
+            self.finished_at = time.time()
+        event = {"event": status}
+        if error:
+            event["error"] = error
+        self._publish(event)
+
+    def _publish(self, event: dict) -> None:
+        self._sequence += 1
+        key = f"progress:{event['stage']}" if event["event"] == "progress" else event["event"]
+        self._events.pop(key, None) # Re-inserted at the end, keeping the dict in publishing order
+        self._events[key] = (self._sequence, event)
+        # Wake everyone waiting on the current event, then arm a fresh one for the next change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def touch(self) -> None:
+        """Records that a client is still interested in the job (it polled its status)."""
+        self.last_seen = time.time()
+
+    def abandoned(self, after_seconds: float) -> bool:
+        """
+        True if clients were following the job but none has been connected, or polled,
+        for `after_seconds` (0 = never abandoned). Jobs nobody ever watched are not abandoned.
+        """
+        if after_seconds <= 0 or self.last_seen is None or self.watchers > 0:
+            return False
+        return time.time() - self.last_seen > after_seconds
+
+    def _events_after(self, sequence: int) -> List[Tuple[int, dict]]:
+        """The retained events published after `sequence`, oldest first."""
+        return [(number, event) for number, event in self._events.values() if number > sequence]
+
+    def snapshot(self) -> dict:
+        """JSON-serializable job state."""
+        return {"job_id": self.id, "status": self.status, "progress": self.progress, "error": self.error}
+
+    async def stream_events(self, heartbeat_seconds: float = 15.0) -> AsyncIterator[str]:
+        """
+        Yields Server-Sent Events until the job finishes: the current status, then the
+        retained events (the latest progress per stage and the status changes so far, so a
+        late subscriber still sees e.g. "done"), then every change. A subscriber that falls
+        behind gets only the latest progress of each stage. Sends comment heartbeats so
+        proxies keep the stream open. An open stream counts as a watcher (see abandoned()).
+        """
+        self.watchers += 1
+        self.touch()
+        try:
+            yield _format_sse("status", self.snapshot())
+            seen = 0
+            while True:
+                changed = self._changed
+                for seen, event in self._events_after(seen):
+                    yield _format_sse(event["event"], event)
+                if self.finished:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+        finally:
+            # The client disconnected (or the job finished)
+            self.watchers -= 1
+            self.touch()
+
+
+def _format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class JobManager:
+    """
+    Runs submitted jobs on a bounded queue with at most `max_concurrent` jobs running.
+    Finished jobs are kept for `result_ttl` seconds so clients can fetch their results.
+    Each running job gets a RequestBudget of `time_budget` seconds, and is cancelled
+    once its clients have been gone for `abandon_after` seconds.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, result_ttl: float, time_budget: float = 0, abandon_after: float = 0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.time_budget = time_budget
+        self.abandon_after = abandon_after
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Starts the worker tasks. Called from the application's startup hook."""
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._workers = [asyncio.create_task(self._worker(n)) for n in range(self.max_concurrent)]
+        logger.info(f"Job queue started with {self.max_concurrent} workers (queue limit {self.max_queued}).")
+
+    async def stop(self) -> None:
+        """Cancels running jobs and runs the cleanup of jobs that never started."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        while self._queue is not None and not self._queue.empty():
+            job, _, cleanup = self._queue.get_nowait()
+            job._set_status(FAILED, "Server shutting down.")
+            _run_cleanup(cleanup)
+        logger.info("Job queue stopped.")
+
+    @property
+    def started(self) -> bool:
+        """True once start() has run and the worker tasks are alive."""
+        return any(not worker.done() for worker in self._workers)
+
+    def submit(self, work: Callable[[Job], Awaitable[Any]], cleanup: Optional[Callable[[], None]] = None) -> Job:
+        """
+        Queues `work(job)` and returns the job immediately. `cleanup()` always runs
+        once the job has finished or been discarded. Raises QueueFullError at capacity.
+        """
+        if self._queue is None:
+            raise RuntimeError("JobManager.start() has not been called.")
+        self._prune()
+        job = Job(uuid.uuid4().hex)
+        try:
+            self._queue.put_nowait((job, work, cleanup))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_queued} waiting).")
+        self._jobs[job.id] = job
+        logger.info(f"Job {job.id} queued ({self._queue.qsize()} waiting).")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        """Queue depth and number of running jobs, for monitoring."""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": sum(1 for job in self._jobs.values() if job.status == RUNNING),
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+        }
+
+    def _prune(self) -> None:
+        """Forgets finished jobs older than the result TTL."""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self, worker_number: int) -> None:
+        while True:
+            job, work, cleanup = await self._queue.get()
+            trace_token = trace_id_var.set(job.trace_id)
+            job.budget = RequestBudget(self.time_budget)
+            budget_token = budget_var.set(job.budget)
+            job._set_status(RUNNING)
+            logger.info(f"Job {job.id} started on worker {worker_number}.")
+            try:
+                job.result = await self._run(job, work)
+                job._set_status(DONE)
+                logger.info(f"Job {job.id} finished in {job.finished_at - job.created_at:.1f}s.")
+            except asyncio.CancelledError:
+                job._set_status(FAILED, "Job was cancelled.")
+                raise
+            except JobFailedError as e:
+                logger.warning(f"Job {job.id} failed: {e}")
+                job._set_status(FAILED, str(e))
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+                job._set_status(FAILED, "An unexpected error occurred during processing.")
+            finally:
+                _run_cleanup(cleanup)
+                self._queue.task_done()
+                budget_var.reset(budget_token)
+                trace_id_var.reset(trace_token)
+
+    async def _run(self, job: Job, work: Callable[[Job], Awaitable[Any]]) -> Any:
+        """
+        Runs `work(job)` in its own task (which inherits the job's budget), checking every few
+        seconds whether the job has been abandoned. An abandoned job is cancelled together
+        with its in-flight API calls and fails with JobFailedError.
+        """
+        task = asyncio.create_task(work(job))
+        abandoned = False
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=_WATCH_INTERVAL_SECONDS)
+                if not task.done() and not abandoned and job.abandoned(self.abandon_after):
+                    logger.warning(f"Job {job.id} has had no client for {self.abandon_after:.0f}s; cancelling it.")
+                    JOBS_ABANDONED.inc()
+                    abandoned = True
+                    job.budget.cancel() # Stops retries in worker threads, which task.cancel() cannot reach
+                    task.cancel()
+        except BaseException:
+            # The worker itself is being cancelled (server shutdown)
+            job.budget.cancel()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+        if abandoned and task.cancelled():
+            raise JobFailedError("The job was cancelled because its client disconnected.")
+        return task.result()
+
+
+def _run_cleanup(cleanup: Optional[Callable[[], None]]) -> None:
+    if cleanup is None:
+        return
+    try:
+        cleanup()
+    except Exception as e:
+        logger.error(f"Job cleanup failed: {e}", exc_info=True)
+
+
+# --- Shared Instance ---
+job_manager = JobManager(JOB_MAX_CONCURRENT, JOB_QUEUE_MAX_SIZE, JOB_RESULT_TTL_SECONDS, JOB_TIME_BUDGET_SECONDS, JOB_ABANDON_SECONDS)
+
+
+def _job_counts() -> dict:
+    stats = job_manager.stats()
+    return {("queued",): stats["queued"], ("running",): stats["running"]}
+
+
+# Queue depth and running jobs, read at scrape time
+Gauge("cvranker_jobs", "Background jobs by state.", ["state"], callback=_job_counts)
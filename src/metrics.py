@@ -0,0 +1,245 @@
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# A small in-process metrics registry rendered in the Prometheus text exposition format,
+# so /metrics can be scraped without adding a client library. Metrics are per process.
+
+LabelValues = Tuple[str, ...]
+
+# Seconds; covers fast in-memory steps up to whole-batch extraction and summarization
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type_name}\n"
+        return header + "".join(line + "\n" for line in self._samples())
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. API calls or cache hits."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """
+    Current value, e.g. queue depth. Either set directly, or computed at scrape time
+    by a callback returning {label values: value} (or a plain number without labels).
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                values = self._callback()
+            except Exception as e:
+                logger.warning(f"Could not collect gauge {self.name}: {e}")
+                return []
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (cumulative buckets, sum and count), e.g. stage durations."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observes the duration of the block in seconds (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key in sorted(self._counts):
+                cumulative = 0
+                for bound, count in zip(self.buckets, self._counts[key]):
+                    cumulative += count
+                    le = 'le="' + _format_value(bound) + '"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(self._sums[key])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+# --- Application Metrics ---
+
+STAGE_SECONDS = Histogram(
+    "cvranker_stage_duration_seconds",
+    "Time spent in each pipeline stage.",
+    ["stage"],
+)
+API_CALLS = Counter(
+    "cvranker_api_calls_total",
+    "Calls to the summary and embedding providers, by outcome.",
+    ["api", "outcome"],
+)
+API_RETRIES = Counter(
+    "cvranker_api_retries_total",
+    "Retries of provider calls after a transient error.",
+    ["api"],
+)
+API_TOKENS = Counter(
+    "cvranker_api_tokens_total",
+    "Estimated input tokens sent to the providers.",
+    ["api"],
+)
+SUMMARY_BATCH_FALLBACKS = Counter(
+    "cvranker_summary_batch_fallbacks_total",
+    "CVs summarized one by one because their batched reply was missing or malformed.",
+)
+PDF_EXTRACTION_SECONDS = Histogram(
+    "cvranker_pdf_extraction_seconds",
+    "Time to extract the text of one PDF, by the engine that produced it.",
+    ["engine"],
+)
+PDF_TRUNCATED = Counter(
+    "cvranker_pdf_truncated_total",
+    "PDFs whose text was cut short by the page or character budget.",
+)
+COALESCED_CALLS = Counter(
+    "cvranker_coalesced_calls_total",
+    "Provider calls not made because an identical call was already in flight (single flight).",
+    ["kind"],
+)
+JOBS_ABANDONED = Counter(
+    "cvranker_jobs_abandoned_total",
+    "Running jobs cancelled because their client went away.",
+)
+CVS_NOT_PROCESSED = Counter(
+    "cvranker_cvs_not_processed_total",
+    "CVs left unranked because their job's time budget ran out.",
+)
+CACHE_REQUESTS = Counter(
+    "cvranker_cache_requests_total",
+    "Disk cache lookups by kind (text, summary, embedding, report) and result.",
+    ["kind", "result"],
+)
+
+
+def observe_stage(stage: str):
+    """Context manager timing one pipeline stage into cvranker_stage_duration_seconds."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+# --- Trace IDs ---
+
+# The current request's trace id; copied into background jobs and worker threads
+trace_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def install_trace_id_logging() -> None:
+    """Adds the current trace id to every log record as `trace_id`, for use in log formats."""
+    previous_factory = logging.getLogRecordFactory()
+    if getattr(previous_factory, "_adds_trace_id", False):
+        return
+
+    def factory(*args, **kwargs):
+        record = previous_factory(*args, **kwargs)
+        record.trace_id = trace_id_var.get()
+        return record
+
+    factory._adds_trace_id = True
+    logging.setLogRecordFactory(factory)
@@ -0,0 +1,166 @@
+import contextlib
+import logging
+import re
+import time
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .config import (
+    PDF_TEXT_ENGINE, PDF_FALLBACK_ENGINE, PDF_MIN_TEXT_CHARS,
+    PDF_MAX_PAGES, PDF_MAX_CHARS, PDF_MAX_TOKENS,
+)
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# Characters per token, as in rate_limit.estimate_tokens
+_CHARS_PER_TOKEN = 4
+
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0e-\x1f\ufffe\uffff]")
+_HORIZONTAL_SPACE = re.compile(r"[ \t\f\v\u00a0\u2000-\u200b\u3000]+")
+
+
+class PdfText(NamedTuple):
+    """Text extracted from one PDF, with what it took to get it (returned from worker processes)."""
+    text: str
+    engine: str # Engine that produced the text ("" if none could read the file)
+    pages_read: int
+    page_count: int
+    truncated: bool # A page or character budget cut the text short
+    seconds: float
+
+
+# --- Engines ---
+# Each engine opens a PDF (path or binary stream) and yields (page count, page_text(i)).
+
+@contextlib.contextmanager
+def _open_pdfium(source) -> Iterator[Tuple[int, Callable[[int], str]]]:
+    import pypdfium2 as pdfium # Imported here: only the extraction worker processes need it
+
+    pdf = pdfium.PdfDocument(source)
+
+    def page_text(index: int) -> str:
+        page = pdf[index]
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_bounded()
+        finally:
+            textpage.close()
+            page.close()
+
+    try:
+        yield len(pdf), page_text
+    finally:
+        pdf.close()
+
+
+@contextlib.contextmanager
+def _open_pdfplumber(source) -> Iterator[Tuple[int, Callable[[int], str]]]:
+    import pdfplumber # Imported here: only the extraction worker processes need it
+
+    with pdfplumber.open(source) as pdf:
+        def page_text(index: int) -> str:
+            page = pdf.pages[index]
+            try:
+                return page.extract_text() or ""
+            finally:
+                page.close() # Drops the page's parsed layout objects
+
+        yield len(pdf.pages), page_text
+
+
+ENGINES = {
+    "pdfium": _open_pdfium,
+    "pdfplumber": _open_pdfplumber,
+}
+
+
+# --- Text Budget and Normalization ---
+
+def char_budget(max_chars: int = PDF_MAX_CHARS, max_tokens: int = PDF_MAX_TOKENS) -> int:
+    """Characters kept per file: the tighter of the character and token budgets (0 = unlimited)."""
+    budgets = [budget for budget in (max_chars, max_tokens * _CHARS_PER_TOKEN) if budget > 0]
+    return min(budgets) if budgets else 0
+
+
+def normalize_whitespace(text: str) -> str:
+    """
+    Collapses runs of spaces and tabs, strips every line and keeps at most one blank
+    line in a row, so layout padding does not cost prompt tokens. Drops control characters.
+    """
+    text = _CONTROL_CHARS.sub("", text.replace("\r\n", "\n").replace("\r", "\n"))
+    lines: List[str] = []
+    for line in text.split("\n"):
+        line = _HORIZONTAL_SPACE.sub(" ", line).strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def _read(engine: str, source, max_pages: int, max_chars: int) -> Tuple[str, int, int, bool]:
+    """Reads pages until the page or character budget is reached; returns (text, pages read, page count, truncated)."""
+    parts: List[str] = []
+    chars = 0
+    pages_read = 0
+    with ENGINES[engine](source) as (page_count, page_text):
+        last_page = min(page_count, max_pages) if max_pages > 0 else page_count
+        for index in range(last_page):
+            text = normalize_whitespace(page_text(index))
+            pages_read += 1
+            if text:
+                parts.append(text)
+                chars += len(text) + 2 # Pages are joined with a blank line
+            if max_chars > 0 and chars >= max_chars:
+                break # Stop early; the remaining pages would be cut anyway
+    text = "\n\n".join(parts)
+    truncated = pages_read < page_count
+    if max_chars > 0 and len(text) > max_chars:
+        # Cut at a word boundary where there is one near the limit
+        cut = text[:max_chars]
+        space = cut.rfind(" ", max_chars - 200)
+        text = cut[:space] if space > 0 else cut
+        truncated = True
+    return text, pages_read, page_count, truncated
+
+
+def extract_pdf_text(
+    source,
+    engine: str = PDF_TEXT_ENGINE,
+    fallback_engine: str = PDF_FALLBACK_ENGINE,
+    max_pages: int = PDF_MAX_PAGES,
+    max_chars: Optional[int] = None,
+) -> PdfText:
+    """
+    Extracts normalized text from a PDF (path or binary stream) within the page and
+    character budgets (defaults from config; `max_chars` defaults to char_budget()).
+    Uses `engine`, and `fallback_engine` when that fails or finds fewer than
+    PDF_MIN_TEXT_CHARS characters. Never raises: an unreadable file gives empty text.
+    """
+    started = time.perf_counter()
+    if max_chars is None:
+        max_chars = char_budget()
+    engines = [engine] + ([fallback_engine] if fallback_engine and fallback_engine != engine else [])
+    best = ("", "", 0, 0, False) # text, engine, pages read, page count, truncated
+
+    for name in engines:
+        if name not in ENGINES:
+            logger.error(f"Unknown PDF text engine {name!r}; expected one of {sorted(ENGINES)}.")
+            continue
+        try:
+            if hasattr(source, "seek"):
+                source.seek(0)
+            text, pages_read, page_count, truncated = _read(name, source, max_pages, max_chars)
+        except ImportError as e:
+            logger.warning(f"PDF text engine {name} is not installed: {e}")
+            continue
+        except Exception as e:
+            logger.warning(f"PDF text engine {name} could not read the file: {e}")
+            continue
+        if len(text) > len(best[0]) or not best[1]:
+            best = (text, name, pages_read, page_count, truncated)
+        if len(text) >= PDF_MIN_TEXT_CHARS:
+            break
+        logger.debug(f"PDF text engine {name} found only {len(text)} characters.")
+
+    text, name, pages_read, page_count, truncated = best
+    if not name:
+        logger.error("Error extracting text from PDF: no engine could read the file.")
+    return PdfText(text, name, pages_read, page_count, truncated, time.perf_counter() - started)
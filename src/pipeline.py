@@ -0,0 +1,444 @@
+import asyncio
+import logging
+import os
+import posixpath
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .config import PREFILTER_MIN_RELATIVE_SCORE, ARCHIVE_MAX_PENDING_FILES, SUMMARY_BATCH_ENABLED, RANKING_MODE, RESULTS_PAGE_SIZE
+from .archives import iter_pdf_members, list_pdf_members
+from .extraction import extract_texts_from_pdfs
+from .prefilter import lexical_prefilter
+from .summarizer import NOT_PROCESSED_MESSAGE, bounded_summarizer, is_failed_summary, summarize_cvs
+from .gemini_embedding import embed_multiple_documents
+from .similarity import similarity_matrix
+from .chunking import chunk_documents, pooled_similarity
+from .result_store import RankedResults, SummaryPlaceholders
+from .render import html_table
+from .metrics import CVS_NOT_PROCESSED, observe_stage
+from .deadlines import budget_spent, deadline_lifted, gather_within_budget
+from .utils import parse_summaries, summary_text
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# progress(stage, done, total) - called on the event loop as the pipeline advances
+ProgressCallback = Callable[[str, int, int], None]
+
+# "summary": rank LLM summaries; "fast": rank chunks of the raw text, summarize only the rows shown
+RANKING_MODES = ("summary", "fast")
+
+
+def cv_id_from_hash(content_hash: str) -> str:
+    """Stable CV id: a prefix of the file's SHA-256 (uploads are de-duplicated by content, so ids are unique)."""
+    return content_hash[:16]
+
+
+def _split_unextracted(
+    texts: List[Optional[str]], filenames: List[str], hashes: List[str],
+) -> Tuple[List[str], List[str], List[str], List[str]]:
+    """Leaves out the CVs the time budget stopped before extraction: returns the others' texts, names and hashes, and the left-out names."""
+    kept = [i for i, text in enumerate(texts) if text is not None]
+    left_out = [filenames[i] for i, text in enumerate(texts) if text is None]
+    return [texts[i] for i in kept], [filenames[i] for i in kept], [hashes[i] for i in kept], left_out
+
+
+def build_result_set(
+    results: RankedResults, jd_index: int, min_score: float, max_results: int, placeholders: Optional[SummaryPlaceholders] = None,
+) -> dict:
+    """
+    Prepares one JD's result set for the results page: its title, the HTML table of its
+    first RESULTS_PAGE_SIZE rows (the page loads the rest on demand) and its row count.
+    """
+    with observe_stage("select"):
+        indices, ranks, total = results.page(jd_index, min_score, max_results, limit=RESULTS_PAGE_SIZE)
+        rows = results.rows_at(jd_index, indices, ranks, placeholders)
+    with observe_stage("render_html"):
+        results_html = html_table(rows) # Display summaries keep their <br /> tags
+    return {"title": results.jd_names[jd_index], "results_data": results_html, "row_count": total, "rows_shown": len(rows)}
+
+
+async def summarize_rows(results: RankedResults, indices) -> SummaryPlaceholders:
+    """
+    Fast ranking mode: generates the summaries (and names) of the given rows, if they do
+    not have them yet. Rows never served are never summarized.
+    Summaries that fail (e.g. a transient API error) are not stored: their error text is
+    returned as placeholders for this response only, and the next load tries again.
+    """
+    pending = results.pending_summaries(list(indices))
+    if not pending:
+        return {}
+    logger.info(f"Summarizing {len(pending)} ranked CVs on demand.")
+    with observe_stage("summarization"):
+        summaries = await summarize_cvs([results.unsummarized_text(i) for i in pending])
+    names, clean_summaries, display_summaries = parse_summaries(summaries)
+    placeholders: SummaryPlaceholders = {}
+    for i, summary, name, clean_summary, display_summary in zip(pending, summaries, names, clean_summaries, display_summaries):
+        if is_failed_summary(summary):
+            placeholders[i] = (name, clean_summary, display_summary)
+        else:
+            results.set_summary(i, name, clean_summary, display_summary)
+    if placeholders:
+        logger.warning(f"{len(placeholders)} on-demand summaries failed; they will be retried on the next load.")
+    return placeholders
+
+
+async def summarize_shown_rows(results: RankedResults, jd_index: int, min_score: float, max_results: int) -> SummaryPlaceholders:
+    """Fast ranking mode: summarizes every row one JD's filters select (e.g. for a download)."""
+    return await summarize_rows(results, results.select(jd_index, min_score, max_results).tolist())
+
+
+async def summarize_first_page(results: RankedResults, jd_index: int, min_score: float, max_results: int) -> SummaryPlaceholders:
+    """Fast ranking mode: summarizes the rows build_result_set renders for the results page."""
+    indices, _, _ = results.page(jd_index, min_score, max_results, limit=RESULTS_PAGE_SIZE)
+    return await summarize_rows(results, indices.tolist())
+
+
+async def extract_archive_cvs(
+    archive_paths: Sequence[str],
+    known_hashes: Set[str],
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    on_text: Optional[Callable[[int, str], None]] = None,
+) -> Tuple[List[Optional[str]], List[str], List[str], int, List[str], List[str]]:
+    """
+    Decompresses the PDFs in each ZIP archive one member at a time and extracts each
+    one's text as soon as it is written, so decompression overlaps extraction and at most
+    ARCHIVE_MAX_PENDING_FILES decompressed PDFs exist at any time (each is deleted once
+    extracted). Members whose content is in `known_hashes`, or repeats an earlier member,
+    are skipped. Raises ArchiveError for unreadable archives and zip bombs.
+
+    Once the request's time budget (see deadlines.py) is spent, nothing more is decompressed.
+
+    Returns the texts, member filenames and content hashes in archive order (a text is None
+    if the budget ran out before its extraction started), the number of duplicates, the
+    names of members that were skipped (encrypted, too large or unreadable) and the names of
+    members never reached because the budget ran out.
+    `on_progress(done, total)` reports members handled; `on_text(position, text)` is called
+    as each text is ready, with its position in the returned lists.
+    """
+    member_lists = await asyncio.gather(*(asyncio.to_thread(list_pdf_members, path) for path in archive_paths))
+    members_total = sum(len(names) for names in member_lists)
+    logger.info(f"Streaming {members_total} PDFs from {len(archive_paths)} archive(s).")
+
+    texts: List[Optional[str]] = []
+    filenames: List[str] = []
+    hashes: List[str] = []
+    skipped: List[str] = []
+    unread: List[str] = []
+    seen = set(known_hashes)
+    duplicates = 0
+    extracted = 0
+    pending_files = asyncio.Semaphore(max(1, ARCHIVE_MAX_PENDING_FILES))
+    tasks: List[asyncio.Task] = []
+
+    def report() -> None:
+        if on_progress is not None:
+            on_progress(extracted + duplicates + len(skipped), members_total)
+
+    async def _extract(position: int, path: str, content_hash: str) -> None:
+        nonlocal extracted
+        try:
+            text = (await extract_texts_from_pdfs([path], [content_hash]))[0]
+        finally:
+            os.remove(path)
+            pending_files.release()
+        texts[position] = text
+        extracted += 1
+        report()
+        if on_text is not None and text is not None:
+            on_text(position, text)
+
+    try:
+        for archive_path, member_names in zip(archive_paths, member_lists):
+            if budget_spent():
+                unread += [posixpath.basename(name) for name in member_names]
+                continue
+            members = iter_pdf_members(archive_path, os.path.dirname(archive_path), skipped=skipped)
+            skipped_before = len(skipped)
+            yielded = 0
+            try:
+                while True:
+                    # Wait for a free slot before decompressing the next member (back-pressure)
+                    await pending_files.acquire()
+                    if budget_spent():
+                        # Out of time: the members not decompressed yet are not processed
+                        pending_files.release()
+                        handled = yielded + len(skipped) - skipped_before
+                        unread += [posixpath.basename(name) for name in member_names[handled:]]
+                        break
+                    member = await asyncio.to_thread(next, members, None)
+                    if member is None:
+                        pending_files.release()
+                        break
+                    yielded += 1
+                    if member.content_hash in seen:
+                        os.remove(member.path)
+                        pending_files.release()
+                        duplicates += 1
+                        report()
+                        continue
+                    seen.add(member.content_hash)
+                    texts.append(None)
+                    filenames.append(member.filename)
+                    hashes.append(member.content_hash)
+                    tasks.append(asyncio.create_task(_extract(len(texts) - 1, member.path, member.content_hash)))
+            finally:
+                try:
+                    members.close()
+                except ValueError:
+                    pass # Still running in its thread after a cancellation; it finishes on its own
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    report()
+    if skipped:
+        logger.warning(f"Skipped {len(skipped)} archive member(s): {', '.join(skipped[:10])}")
+    if unread:
+        logger.warning(f"Time budget ran out: {len(unread)} archive member(s) were not decompressed.")
+    return texts, filenames, hashes, duplicates, skipped, unread
+
+
+async def rank_uploaded_cvs(
+    jd_filepaths: List[str],
+    jd_hashes: List[str],
+    jd_names: List[str],
+    cv_filepaths: List[str],
+    cv_hashes: List[str],
+    cv_filenames: List[str],
+    min_score: float,
+    max_results: int,
+    progress: Optional[ProgressCallback] = None,
+    prefilter_top_k: int = 0,
+    duplicates_skipped: int = 0,
+    cv_archives: Sequence[str] = (),
+    ranking_mode: str = RANKING_MODE,
+) -> RankedResults:
+    """
+    Runs the ranking pipeline on saved upload files: extraction, summarization,
+    embedding and similarity. Returns the full ranking of every CV against every JD;
+    `min_score` and `max_results` are stored as its default filters.
+    CV summaries and embeddings are computed once and reused for every JD.
+    With `prefilter_top_k` > 0, only the CVs among the best K lexical (BM25) matches
+    for some JD go on to summarization and embedding; the others are left out.
+    `duplicates_skipped` is the number of repeated CVs the caller already dropped (reported in the stats).
+    If the request's time budget (see deadlines.py) runs out during extraction or
+    summarization, the CVs finished so far are ranked and the rest are listed as not
+    processed; embedding the finished CVs is not cut short by the deadline.
+
+    CVs in `cv_archives` (ZIP files) are decompressed and extracted one by one after the
+    loose files (see extract_archive_cvs). Without the pre-filter or batched summarization,
+    each CV's summary is started as soon as its text is ready instead of after the whole
+    batch is extracted.
+
+    With `ranking_mode` "fast", nothing is summarized before ranking: CVs are scored on
+    chunks of their raw text (see _rank_by_chunks), and summaries are generated later
+    for the rows actually shown (see summarize_shown_rows).
+    """
+    def report(stage: str, done: int, total: int) -> None:
+        if progress is not None:
+            progress(stage, done, total)
+
+    # --- Step 2: Extract text ---
+    logger.info(f"Starting PDF text extraction for {len(jd_filepaths)} JDs and {len(cv_filepaths)} CVs.")
+    # Extraction runs in a process pool; the JDs are extracted alongside the CVs
+    with observe_stage("extraction"):
+        all_texts = await extract_texts_from_pdfs(
+            jd_filepaths + cv_filepaths, jd_hashes + cv_hashes,
+            on_progress=lambda done, total: report("extracted", done, total),
+            always_extract=len(jd_filepaths), # Every result needs the JDs, even past the deadline
+        )
+    jd_texts = all_texts[:len(jd_filepaths)]
+    # CVs the time budget did not reach are left out of the ranking and listed instead
+    cv_texts, cv_filenames, cv_hashes, not_extracted = _split_unextracted(all_texts[len(jd_filepaths):], cv_filenames, cv_hashes)
+    logger.info(f"Extracted text from {len(jd_texts)} JDs and {len(cv_texts)} CVs.")
+
+    # Step 2a: CVs from ZIP archives, streamed member by member
+    early_summaries: Optional[List[asyncio.Future]] = None
+    archive_skipped: List[str] = []
+    if cv_archives:
+        loose_count = len(all_texts)
+        archive_summaries: Dict[int, asyncio.Future] = {}
+        on_text: Optional[Callable[[int, str], None]] = None
+        if ranking_mode == "summary" and prefilter_top_k <= 0 and not SUMMARY_BATCH_ENABLED:
+            # Nothing has to see every text first, so summaries start while extraction goes on
+            # (batched summarization packs CVs together, so it waits for all of them)
+            summaries_started = summaries_done = 0
+
+            def count_summary() -> None:
+                nonlocal summaries_done
+                summaries_done += 1
+                report("summarized", summaries_done, summaries_started)
+
+            summarize = bounded_summarizer(on_done=count_summary)
+
+            def start_summary(text: str) -> asyncio.Future:
+                nonlocal summaries_started
+                summaries_started += 1
+                return asyncio.ensure_future(summarize(text))
+
+            def summarize_archived(position: int, text: str) -> None:
+                archive_summaries[position] = start_summary(text)
+
+            early_summaries = [start_summary(text) for text in cv_texts]
+            on_text = summarize_archived
+        try:
+            with observe_stage("extraction"):
+                archive_texts, archive_filenames, archive_hashes, archive_duplicates, archive_skipped, archive_unread = await extract_archive_cvs(
+                    cv_archives, set(cv_hashes),
+                    on_progress=lambda done, total: report("extracted", loose_count + done, loose_count + total),
+                    on_text=on_text,
+                )
+        except BaseException:
+            for future in (early_summaries or []) + list(archive_summaries.values()):
+                future.cancel()
+            raise
+        if early_summaries is not None:
+            # Summaries were only started for texts that were extracted, in archive order
+            early_summaries += [archive_summaries[i] for i in sorted(archive_summaries)]
+        archive_texts, archive_filenames, archive_hashes, archive_missed = _split_unextracted(archive_texts, archive_filenames, archive_hashes)
+        cv_texts = cv_texts + archive_texts
+        cv_filenames = cv_filenames + archive_filenames
+        cv_hashes = cv_hashes + archive_hashes
+        not_extracted += archive_missed + archive_unread
+        duplicates_skipped += archive_duplicates
+        logger.info(f"Extracted text from {len(archive_texts)} archived CVs ({archive_duplicates} duplicates, {len(archive_skipped)} skipped).")
+
+    if not_extracted:
+        CVS_NOT_PROCESSED.inc(len(not_extracted))
+        logger.warning(f"Time budget ran out during extraction: {len(not_extracted)} CVs not processed.")
+
+    # Step 2b: Optional local pre-filter, so clearly unrelated CVs never reach the LLM
+    uploaded_count = len(cv_texts) + len(not_extracted)
+    calls_saved = 0
+    if prefilter_top_k > 0:
+        with observe_stage("prefilter"):
+            kept = await asyncio.to_thread(lexical_prefilter, cv_texts, jd_texts, prefilter_top_k, PREFILTER_MIN_RELATIVE_SCORE)
+        kept_set = set(kept)
+        # Each dropped CV with text is one summarization call (and one embedding) not made
+        calls_saved = sum(1 for i, text in enumerate(cv_texts) if i not in kept_set and text.strip())
+        cv_texts = [cv_texts[i] for i in kept]
+        cv_filenames = [cv_filenames[i] for i in kept]
+        cv_hashes = [cv_hashes[i] for i in kept]
+    report("prefiltered", len(cv_texts), uploaded_count)
+    stats = {
+        "cvs_uploaded": uploaded_count, "cvs_ranked": len(cv_texts), "llm_calls_saved": calls_saved,
+        "duplicates_skipped": duplicates_skipped, "archive_files_skipped": len(archive_skipped),
+    }
+
+    if ranking_mode == "fast":
+        return await _rank_by_chunks(jd_names, jd_texts, cv_texts, cv_filenames, cv_hashes, min_score, max_results, stats, report, not_extracted)
+
+    # Step 3: Get raw summaries from the AI
+    logger.info("Generating raw summaries from AI.")
+    with observe_stage("summarization"):
+        if early_summaries is not None:
+            # Already under way since the texts arrived; the ones still running are awaited here
+            raw_summaries = await gather_within_budget(early_summaries, NOT_PROCESSED_MESSAGE)
+        else:
+            report("summarized", 0, len(cv_texts))
+            raw_summaries = await summarize_cvs(cv_texts, on_progress=lambda done, total: report("summarized", done, total))
+    logger.info("Raw summaries generated.")
+
+    # Step 3a: CVs the time budget did not reach are left out of the ranking and listed instead
+    not_summarized = [cv_filenames[i] for i, summary in enumerate(raw_summaries) if summary == NOT_PROCESSED_MESSAGE]
+    if not_summarized:
+        finished = [i for i, summary in enumerate(raw_summaries) if summary != NOT_PROCESSED_MESSAGE]
+        raw_summaries = [raw_summaries[i] for i in finished]
+        cv_filenames = [cv_filenames[i] for i in finished]
+        cv_hashes = [cv_hashes[i] for i in finished]
+        CVS_NOT_PROCESSED.inc(len(not_summarized))
+        logger.warning(f"Time budget ran out: ranking {len(finished)} CVs, {len(not_summarized)} not summarized.")
+    not_processed = not_extracted + not_summarized
+    stats["cvs_not_processed"] = len(not_processed)
+    stats["cvs_ranked"] = len(raw_summaries)
+
+    # --- Step 4: Process Summaries ---
+    # Extract names, clean summaries (CSV/JSON) and display summaries; batched summaries
+    # already have separate name and summary fields, only single-CV replies are parsed
+    names, clean_summaries, display_summaries = parse_summaries(raw_summaries)
+    logger.info("Names, clean summaries and display summaries extracted.")
+
+    # Step 5: Embed documents (using the raw summaries is fine here); all JDs are embedded in the same call
+    cv_count = len(raw_summaries)
+    # Nothing to compare if no CV was summarized within the time budget
+    documents_to_embed = [summary_text(summary) for summary in raw_summaries] + jd_texts if cv_count else []
+    logger.info("Generating embeddings for documents.")
+    report("embedded", 0, len(documents_to_embed))
+    # The embedding client is synchronous, so it runs in a thread to keep the event loop free;
+    # the CVs that made it this far are embedded even if the deadline has passed
+    with observe_stage("embedding"), deadline_lifted():
+        embeddings = await asyncio.to_thread(embed_multiple_documents, documents_to_embed)
+    report("embedded", len(documents_to_embed), len(documents_to_embed))
+    logger.info("Embeddings generated.")
+
+    # Step 6: Calculate similarities for every CV against every JD with one matrix product
+    logger.info("Calculating similarities.")
+    with observe_stage("similarity"):
+        scores = similarity_matrix(embeddings[:cv_count], embeddings[cv_count:]) if cv_count else np.zeros((0, len(jd_names)))
+    logger.info(f"Similarities calculated ({scores.shape[0]} CVs x {scores.shape[1]} JDs).")
+
+    # Step 7: Keep the full ranking; filtering and rendering happen per request
+    results = RankedResults(
+        jd_names, names, cv_filenames, clean_summaries, display_summaries, scores,
+        min_score=min_score, max_results=max_results, stats=stats,
+        cv_ids=[cv_id_from_hash(content_hash) for content_hash in cv_hashes],
+        not_processed=not_processed,
+    )
+    report("ranked", len(jd_names), len(jd_names))
+    return results
+
+
+async def _rank_by_chunks(
+    jd_names: List[str],
+    jd_texts: List[str],
+    cv_texts: List[str],
+    cv_filenames: List[str],
+    cv_hashes: List[str],
+    min_score: float,
+    max_results: int,
+    stats: Dict[str, int],
+    report: ProgressCallback,
+    not_processed: Sequence[str] = (),
+) -> RankedResults:
+    """
+    Fast ranking mode, after extraction (and the pre-filter): each CV's raw text is split
+    into overlapping chunks, the chunks and JDs are embedded in batches, and each CV is
+    scored by pooling its chunk similarities to each JD. No LLM call is made; the results
+    keep the raw texts so the rows shown can be summarized on demand. `not_processed` are
+    the CVs the time budget stopped before extraction.
+    """
+    report("summarized", 0, 0) # Nothing is summarized before ranking
+    chunks, chunk_counts = chunk_documents(cv_texts)
+    logger.info(f"Fast ranking: {len(cv_texts)} CVs split into {len(chunks)} chunks.")
+
+    # Step 5: Embed the chunks and JDs together (identical chunks are embedded once)
+    documents_to_embed = chunks + jd_texts if chunks else []
+    report("embedded", 0, len(documents_to_embed))
+    with observe_stage("embedding"), deadline_lifted():
+        embeddings = await asyncio.to_thread(embed_multiple_documents, documents_to_embed)
+    report("embedded", len(documents_to_embed), len(documents_to_embed))
+
+    # Step 6: Pool chunk similarities into one score per CV and JD
+    with observe_stage("similarity"):
+        if chunks:
+            scores = pooled_similarity(embeddings[:len(chunks)], chunk_counts, embeddings[len(chunks):])
+        else:
+            scores = np.zeros((len(cv_texts), len(jd_names)))
+    logger.info(f"Similarities calculated ({scores.shape[0]} CVs x {scores.shape[1]} JDs).")
+
+    # Step 7: Names and summaries stay empty until a row is shown
+    stats["fast_ranking"] = 1
+    stats["cvs_not_processed"] = len(not_processed)
+    results = RankedResults(
+        jd_names, [""] * len(cv_texts), cv_filenames, [""] * len(cv_texts), [""] * len(cv_texts), scores,
+        min_score=min_score, max_results=max_results, stats=stats,
+        cv_ids=[cv_id_from_hash(content_hash) for content_hash in cv_hashes],
+        unsummarized_texts=dict(enumerate(cv_texts)),
+        not_processed=list(not_processed),
+    )
+    report("ranked", len(jd_names), len(jd_names))
+    return results
@@ -0,0 +1,71 @@
+import logging
+from typing import List
+
+import numpy as np
+
+from .similarity import top_k_indices
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# Standard BM25 parameters: term-frequency saturation and document-length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def bm25_scores(cv_texts: List[str], jd_texts: List[str], k1: float = BM25_K1, b: float = BM25_B) -> np.ndarray:
+    """
+    BM25 scores of every CV (as a document) against every JD (as a query), as an
+    (N CVs, M JDs) array. Runs locally on the raw extracted text; no API calls.
+    IDF statistics come from the CV batch itself.
+    """
+    scores = np.zeros((len(cv_texts), len(jd_texts)))
+    if not cv_texts or not jd_texts:
+        return scores
+
+    # sklearn is slow to import, so it is loaded only when the pre-filter actually runs
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    vectorizer = CountVectorizer(stop_words="english", dtype=np.float64)
+    try:
+        term_counts = vectorizer.fit_transform(cv_texts).tocsr()
+    except ValueError:
+        # Every CV is empty (or only stop words), so nothing can be scored
+        return scores
+    # JD terms that never occur in a CV cannot change the ranking, so the CV vocabulary is enough
+    query_terms = (vectorizer.transform(jd_texts) > 0).astype(np.float64).T.tocsr()
+
+    doc_count = term_counts.shape[0]
+    doc_freq = np.bincount(term_counts.indices, minlength=term_counts.shape[1])
+    idf = np.log(1.0 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+    doc_lengths = np.asarray(term_counts.sum(axis=1)).ravel()
+    length_norm = 1.0 - b + b * doc_lengths / max(doc_lengths.mean(), 1.0)
+
+    # Apply the BM25 term weighting to the non-zero counts only, keeping the matrix sparse
+    tf = term_counts.data
+    rows = np.repeat(np.arange(doc_count), np.diff(term_counts.indptr))
+    weighted = term_counts.copy()
+    weighted.data = idf[term_counts.indices] * tf * (k1 + 1) / (tf + k1 * length_norm[rows])
+    return np.asarray((weighted @ query_terms).todense())
+
+
+def lexical_prefilter(cv_texts: List[str], jd_texts: List[str], top_k: int, min_relative_score: float = 0.0) -> List[int]:
+    """
+    Cheap first ranking stage: returns the indices (ascending) of the CVs worth sending
+    to summarization and embedding. A CV is kept if it is among the `top_k` BM25
+    matches for at least one JD and scores at least `min_relative_score` times that
+    JD's best score.
+    """
+    if top_k <= 0 or len(cv_texts) <= top_k and min_relative_score <= 0:
+        return list(range(len(cv_texts)))
+
+    scores = bm25_scores(cv_texts, jd_texts)
+    keep = np.zeros(len(cv_texts), dtype=bool)
+    for jd_index in range(scores.shape[1]):
+        column = scores[:, jd_index]
+        selected = top_k_indices(column, top_k)
+        if min_relative_score > 0:
+            selected = selected[column[selected] >= min_relative_score * column.max()]
+        keep[selected] = True
+    kept = np.flatnonzero(keep).tolist()
+    logger.info(f"Lexical pre-filter kept {len(kept)} of {len(cv_texts)} CVs for summarization.")
+    return kept
@@ -13,4 +13,21 @@ SUMMARIZER_USER_PROMPT = (
     "respectively by comparing your summary of the applicant's skills and experiences with the Job description which "
     "he has and was already advertised. Make the first line a heading with only the applicant's name. Be careful to not "
     "miss any relevant experience or skill. This is the CV: {cv_text}"
-)
\ No newline at end of file
+)
+
+# --- Batched Summarization Prompts ---
+# Used when several short CVs are packed into one request; the reply is JSON, so names and
+# summaries come back as separate fields instead of being parsed out of free text.
+BATCH_SUMMARIZER_SYSTEM_PROMPT = (
+    SUMMARIZER_SYSTEM_PROMPT + " You answer with JSON only, without markdown fences or any other text."
+)
+
+BATCH_SUMMARIZER_USER_PROMPT = (
+    "The hiring officer wants you to help summarize the key skills and experiences of each CV below in two "
+    "paragraphs of 100 words in total. He plans to read your summaries and decide whether to hire each applicant "
+    "by comparing them with the Job description which he has and was already advertised. Be careful to not miss "
+    "any relevant experience or skill, and never mix up details between CVs. Each CV starts with a line "
+    "'=== CV <id> ==='. Reply with a JSON array holding exactly one object per CV, in the same order, of the form "
+    '{{"id": "<id>", "name": "<the applicant\'s name>", "summary": "<first paragraph>\\n\\n<second paragraph>"}}. '
+    "These are the CVs:\n\n{cvs}"
+)
@@ -0,0 +1,291 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+
+from .config import (
+    LLM_MODEL_NAME, EMBEDDING_MODEL_NAME, SUMMARIZER_PROMPT_MESSAGES, BATCH_SUMMARIZER_PROMPT_MESSAGES, require_google_api_key,
+    LLM_PROVIDER, FAKE_PROVIDER_LATENCY_MS, FAKE_PROVIDER_ERROR_RATE, FAKE_PROVIDER_RATE_LIMIT_RATE,
+)
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+
+# --- Provider Interfaces ---
+
+class SummaryProvider:
+    """Generates a raw CV summary: the candidate's name on the first line, the summary below."""
+
+    # Part of every cached summary key, so output from different providers never mixes
+    cache_namespace = ""
+
+    def summarize(self, cv_text: str) -> str:
+        raise NotImplementedError
+
+    async def asummarize(self, cv_text: str) -> str:
+        raise NotImplementedError
+
+    async def asummarize_batch(self, cvs: str) -> str:
+        """
+        Summarizes several CVs packed into one prompt, each under a '=== CV <id> ===' line.
+        Returns the raw reply: a JSON array of {"id", "name", "summary"} objects.
+        """
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Creates any clients up front, so the first request does not pay for it."""
+
+
+class EmbeddingProvider:
+    """Turns documents into embedding vectors (one list of floats per document)."""
+
+    # Part of every cached embedding key, so vectors from different providers never mix
+    cache_namespace = ""
+
+    def embed_documents(self, documents: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Creates any clients up front, so the first request does not pay for it."""
+
+
+# --- Gemini (production) Providers ---
+
+class GeminiSummaryProvider(SummaryProvider):
+    """Summaries from Gemini through a LangChain chain, built on first use (thread-safe)."""
+
+    cache_namespace = LLM_MODEL_NAME
+
+    def __init__(self):
+        self._chain = None
+        self._batch_chain = None
+        self._lock = threading.Lock()
+
+    def _build_chains(self) -> None:
+        if self._chain is None:
+            with self._lock:
+                if self._chain is None:
+                    require_google_api_key()
+                    # LangChain is slow to import, so it is only loaded when a chain is needed
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    from langchain_core.prompts import ChatPromptTemplate
+                    from langchain_core.output_parsers import StrOutputParser
+
+                    # Initialize the Language Model using values from config
+                    llm = ChatGoogleGenerativeAI(
+                        model=LLM_MODEL_NAME
+                    )
+                    # The batched chain shares the model; its reply is validated by the summarizer
+                    self._batch_chain = ChatPromptTemplate.from_messages(BATCH_SUMMARIZER_PROMPT_MESSAGES) | llm | StrOutputParser()
+                    # Create the prompt template directly from the config
+                    prompt_template = ChatPromptTemplate.from_messages(
+                        SUMMARIZER_PROMPT_MESSAGES
+                    )
+                    # Create the summarization chain
+                    self._chain = prompt_template | llm | StrOutputParser()
+                    logger.info("Summarization chain initialized.")
+
+    def _get_chain(self):
+        self._build_chains()
+        return self._chain
+
+    def summarize(self, cv_text: str) -> str:
+        return self._get_chain().invoke({"cv_text": cv_text})
+
+    async def asummarize(self, cv_text: str) -> str:
+        return await self._get_chain().ainvoke({"cv_text": cv_text})
+
+    async def asummarize_batch(self, cvs: str) -> str:
+        self._build_chains()
+        return await self._batch_chain.ainvoke({"cvs": cvs})
+
+    def warm_up(self) -> None:
+        self._build_chains()
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the Gemini embedding model, created on first use (thread-safe)."""
+
+    cache_namespace = EMBEDDING_MODEL_NAME
+
+    def __init__(self):
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    require_google_api_key()
+                    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                    # Initialize the embedding model once using values from config
+                    self._model = GoogleGenerativeAIEmbeddings(
+                        model=EMBEDDING_MODEL_NAME
+                    )
+                    logger.info("Embedding model initialized.")
+        return self._model
+
+    def embed_documents(self, documents: List[str]) -> List[List[float]]:
+        return self._get_model().embed_documents(documents)
+
+    def warm_up(self) -> None:
+        self._get_model()
+
+
+# --- Fake (offline) Providers ---
+
+class _FaultInjector:
+    """
+    Decides deterministically whether a call fails. The decision depends only on the
+    input and how many times that input has been tried, so a run is reproducible
+    regardless of concurrency, and a retried call can succeed.
+    """
+
+    def __init__(self, error_rate: float, rate_limit_rate: float, seed: int):
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def check(self, key: str) -> None:
+        """Raises ResourceExhausted (429) or ServiceUnavailable (503) for the selected calls."""
+        if self.error_rate <= 0 and self.rate_limit_rate <= 0:
+            return
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+        draw = _unit_hash(f"{self.seed}:{key}:{attempt}")
+        if draw < self.rate_limit_rate:
+            raise ResourceExhausted("Injected rate limit (fake provider).")
+        if draw < self.rate_limit_rate + self.error_rate:
+            raise ServiceUnavailable("Injected server error (fake provider).")
+
+
+def _unit_hash(text: str) -> float:
+    """Deterministic value in [0, 1) derived from `text`."""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big") / 2**64
+
+
+class FakeSummaryProvider(SummaryProvider):
+    """
+    Deterministic local stand-in for the LLM: uses the first CV line as the name and
+    the first ~100 words as the summary. Latency, server errors and 429s are configurable.
+    """
+
+    cache_namespace = "fake"
+
+    def __init__(self, latency_ms: float = 0, error_rate: float = 0, rate_limit_rate: float = 0, seed: int = 0):
+        self.latency_seconds = latency_ms / 1000
+        self._faults = _FaultInjector(error_rate, rate_limit_rate, seed)
+
+    @staticmethod
+    def _name_and_summary(cv_text: str):
+        lines = [line.strip() for line in cv_text.splitlines() if line.strip()]
+        name = lines[0][:60] if lines else "Unknown Candidate"
+        words = " ".join(lines[1:]).split()
+        return name, f"{' '.join(words[:50])}\n\n{' '.join(words[50:100])}"
+
+    def _summary(self, cv_text: str) -> str:
+        self._faults.check(hashlib.sha256(cv_text.encode("utf-8")).hexdigest())
+        name, summary = self._name_and_summary(cv_text)
+        return f"**{name}**\n{summary}"
+
+    def summarize(self, cv_text: str) -> str:
+        time.sleep(self.latency_seconds)
+        return self._summary(cv_text)
+
+    async def asummarize(self, cv_text: str) -> str:
+        await asyncio.sleep(self.latency_seconds)
+        return self._summary(cv_text)
+
+    async def asummarize_batch(self, cvs: str) -> str:
+        await asyncio.sleep(self.latency_seconds)
+        self._faults.check(hashlib.sha256(cvs.encode("utf-8")).hexdigest())
+        # Split the packed prompt back on its '=== CV <id> ===' lines
+        parts = re.split(r"^=== CV (\S+) ===$", cvs, flags=re.MULTILINE)
+        replies = []
+        for cv_id, cv_text in zip(parts[1::2], parts[2::2]):
+            name, summary = self._name_and_summary(cv_text)
+            replies.append({"id": cv_id, "name": name, "summary": summary})
+        return json.dumps(replies)
+
+
+class FakeEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic local stand-in for the embedding model: hashed bag-of-words vectors,
+    so documents sharing vocabulary score as similar. Latency is per call; server
+    errors and 429s are configurable.
+    """
+
+    cache_namespace = "fake"
+
+    def __init__(self, dimensions: int = 768, latency_ms: float = 0, error_rate: float = 0, rate_limit_rate: float = 0, seed: int = 0):
+        self.dimensions = dimensions
+        self.latency_seconds = latency_ms / 1000
+        self._faults = _FaultInjector(error_rate, rate_limit_rate, seed)
+
+    def _embed(self, document: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9]+", document.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "big") % self.dimensions] += 1.0 if digest[4] & 1 else -1.0
+        return vector.tolist()
+
+    def embed_documents(self, documents: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_seconds)
+        self._faults.check(hashlib.sha256("\0".join(documents).encode("utf-8")).hexdigest())
+        return [self._embed(document) for document in documents]
+
+
+# --- Provider Selection ---
+
+_summary_provider: Optional[SummaryProvider] = None
+_embedding_provider: Optional[EmbeddingProvider] = None
+_selection_lock = threading.Lock()
+
+
+def _create_providers() -> None:
+    global _summary_provider, _embedding_provider
+    if LLM_PROVIDER == "fake":
+        logger.warning("Using the fake (offline) LLM and embedding providers; results are not meaningful.")
+        _summary_provider = _summary_provider or FakeSummaryProvider(FAKE_PROVIDER_LATENCY_MS, FAKE_PROVIDER_ERROR_RATE, FAKE_PROVIDER_RATE_LIMIT_RATE)
+        _embedding_provider = _embedding_provider or FakeEmbeddingProvider(latency_ms=FAKE_PROVIDER_LATENCY_MS, error_rate=FAKE_PROVIDER_ERROR_RATE, rate_limit_rate=FAKE_PROVIDER_RATE_LIMIT_RATE)
+    else:
+        _summary_provider = _summary_provider or GeminiSummaryProvider()
+        _embedding_provider = _embedding_provider or GeminiEmbeddingProvider()
+
+
+def get_summary_provider() -> SummaryProvider:
+    """Returns the configured summary provider (LLM_PROVIDER), creating it on first use."""
+    if _summary_provider is None:
+        with _selection_lock:
+            if _summary_provider is None:
+                _create_providers()
+    return _summary_provider
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """Returns the configured embedding provider (LLM_PROVIDER), creating it on first use."""
+    if _embedding_provider is None:
+        with _selection_lock:
+            if _embedding_provider is None:
+                _create_providers()
+    return _embedding_provider
+
+
+def set_providers(summary: Optional[SummaryProvider] = None, embedding: Optional[EmbeddingProvider] = None) -> None:
+    """Replaces the active providers (used by benchmarks and local experiments)."""
+    global _summary_provider, _embedding_provider
+    with _selection_lock:
+        if summary is not None:
+            _summary_provider = summary
+        if embedding is not None:
+            _embedding_provider = embedding
@@ -0,0 +1,300 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from typing import AsyncIterator, Iterator, Optional, Tuple
+
+from google.api_core.exceptions import ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded
+
+from .metrics import API_CALLS, API_TOKENS, Gauge
+from .deadlines import BudgetSpentError, budget_var
+from .config import (
+    GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE, GEMINI_MAX_CONCURRENCY,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_SECONDS,
+)
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# Errors worth retrying; ResourceExhausted (429) also shrinks the concurrency limit,
+# the others count towards opening the circuit breaker.
+RETRYABLE_ERRORS = (ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded)
+_OUTAGE_ERRORS = (InternalServerError, ServiceUnavailable, DeadlineExceeded)
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# How often a caller re-checks when it is waiting for a concurrency slot
+_SLOT_POLL_SECONDS = 0.05
+# Several 429s arriving together count as one congestion signal
+_DECREASE_COOLDOWN_SECONDS = 1.0
+# Longest wait between checks of the request's time budget (it can be cancelled at any time)
+_BUDGET_POLL_SECONDS = 1.0
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about 4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def _outcome(error: BaseException) -> str:
+    """Metrics label for a failed call."""
+    if isinstance(error, ResourceExhausted):
+        return "rate_limited"
+    return "error"
+
+
+def _wait_within_budget(wait: float, api: str) -> float:
+    """
+    How long a caller should sleep before trying for a slot again: at most until the
+    request's deadline. Raises BudgetSpentError once the budget is spent or cancelled.
+    """
+    budget = budget_var.get()
+    if budget is None:
+        return wait
+    if budget.spent:
+        API_CALLS.inc(api=api, outcome="budget_spent")
+        raise BudgetSpentError("The request's time budget ran out while waiting for a Gemini API call slot.")
+    remaining = budget.remaining()
+    return min(wait, _BUDGET_POLL_SECONDS, remaining if remaining is not None else wait)
+
+
+class _TokenBucket:
+    """Refills `per_minute` units evenly over a minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity) # Oversized requests only wait for a full bucket
+        return 0.0 if self.available >= amount else (amount - self.available) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.available -= min(amount, self.capacity)
+
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide limiter for calls to the Gemini APIs, shared by the summarizer and the
+    embedding client, from both event-loop coroutines and worker threads.
+
+    - Requests/minute and tokens/minute budgets are enforced with token buckets
+      (a budget of 0 disables that bucket).
+    - The number of calls in flight is capped by an AIMD limit: it halves on a 429 and
+      grows by about one slot for every `limit` successful calls, up to `max_concurrency`.
+    - A circuit breaker opens after `failure_threshold` consecutive server errors or
+      timeouts. While open, calls fail fast with CircuitOpenError; after `reset_seconds`
+      a single trial call is let through and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrency: int,
+        failure_threshold: int,
+        reset_seconds: float,
+    ):
+        self._lock = threading.Lock()
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_concurrency = max(1, max_concurrency)
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._counts = {"calls": 0, "throttled": 0, "failures": 0, "rejected": 0}
+
+    # --- Acquiring and releasing call slots ---
+
+    def _try_acquire(self, tokens: int) -> Tuple[float, bool]:
+        """
+        Takes a call slot if the circuit, the concurrency limit and both budgets allow it
+        and returns (0, is_trial_call); otherwise returns how long to wait before trying again.
+        Raises CircuitOpenError while the circuit is open.
+        """
+        with self._lock:
+            now = time.monotonic()
+            trial = False
+            if self._state == OPEN:
+                if now - self._opened_at < self.reset_seconds:
+                    self._counts["rejected"] += 1
+                    raise CircuitOpenError("Gemini API circuit breaker is open after repeated failures.")
+                self._state = HALF_OPEN
+                logger.info("Circuit breaker half-open; letting a trial call through.")
+            if self._state == HALF_OPEN:
+                if self._trial_in_flight:
+                    self._counts["rejected"] += 1
+                    raise CircuitOpenError("Gemini API circuit breaker is waiting on a trial call.")
+                trial = True
+            if self._in_flight >= int(self._limit):
+                return _SLOT_POLL_SECONDS, False
+            wait = max(
+                self._requests.wait_time(1, now) if self._requests else 0.0,
+                self._tokens.wait_time(tokens, now) if self._tokens else 0.0,
+            )
+            if wait > 0:
+                return wait, False
+            if self._requests:
+                self._requests.take(1)
+            if self._tokens:
+                self._tokens.take(tokens)
+            self._in_flight += 1
+            if trial:
+                self._trial_in_flight = True
+            self._counts["calls"] += 1
+            return 0.0, trial
+
+    def _release(self, error: Optional[BaseException], trial: bool) -> None:
+        """Frees a call slot and updates the AIMD limit and the breaker from the call's outcome."""
+        with self._lock:
+            self._in_flight -= 1
+            if trial:
+                self._trial_in_flight = False
+            now = time.monotonic()
+            if error is None:
+                # Additive increase: about +1 after `limit` successes
+                self._limit = min(float(self.max_concurrency), self._limit + 1.0 / self._limit)
+                self._consecutive_failures = 0
+                if self._state != CLOSED:
+                    logger.info("Circuit breaker closed; Gemini API calls are succeeding again.")
+                self._state = CLOSED
+            elif isinstance(error, ResourceExhausted):
+                # Multiplicative decrease; the API is up, so the breaker is not involved
+                self._counts["throttled"] += 1
+                if now - self._last_decrease >= _DECREASE_COOLDOWN_SECONDS:
+                    self._limit = max(1.0, self._limit / 2)
+                    self._last_decrease = now
+                    logger.warning(f"Gemini API rate limited; concurrency limit lowered to {int(self._limit)}.")
+                if self._state == HALF_OPEN:
+                    self._state = CLOSED
+            elif isinstance(error, _OUTAGE_ERRORS):
+                self._counts["failures"] += 1
+                self._consecutive_failures += 1
+                if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                    if self._state != OPEN:
+                        logger.error(
+                            f"Circuit breaker opened after {self._consecutive_failures} consecutive Gemini API failures; "
+                            f"failing fast for {self.reset_seconds:g}s."
+                        )
+                    self._state = OPEN
+                    self._opened_at = now
+            elif trial:
+                # An unrelated error says nothing about availability; allow another trial
+                self._state = OPEN
+                self._opened_at = now - self.reset_seconds
+
+    def _acquire_or_count_rejection(self, tokens: int, api: str) -> Tuple[float, bool]:
+        try:
+            return self._try_acquire(tokens)
+        except CircuitOpenError:
+            API_CALLS.inc(api=api, outcome="rejected")
+            raise
+
+    @contextlib.contextmanager
+    def limit(self, tokens: int = 1, api: str = "other") -> Iterator[None]:
+        """
+        Blocks the calling thread until a call slot is available, and holds it for the block.
+        `api` labels the call in the cvranker_api_* metrics. Raises BudgetSpentError instead
+        of waiting once the request's time budget (see deadlines.py) is spent or cancelled.
+        """
+        while True:
+            wait, trial = self._acquire_or_count_rejection(tokens, api)
+            if wait <= 0:
+                break
+            time.sleep(_wait_within_budget(wait, api))
+        API_TOKENS.inc(tokens, api=api)
+        try:
+            yield
+        except BaseException as e:
+            self._release(e, trial)
+            API_CALLS.inc(api=api, outcome=_outcome(e))
+            raise
+        self._release(None, trial)
+        API_CALLS.inc(api=api, outcome="success")
+
+    @contextlib.asynccontextmanager
+    async def alimit(self, tokens: int = 1, api: str = "other") -> AsyncIterator[None]:
+        """Async counterpart of limit(); waits with asyncio.sleep so the event loop stays free."""
+        while True:
+            wait, trial = self._acquire_or_count_rejection(tokens, api)
+            if wait <= 0:
+                break
+            await asyncio.sleep(_wait_within_budget(wait, api))
+        API_TOKENS.inc(tokens, api=api)
+        try:
+            yield
+        except BaseException as e:
+            self._release(e, trial)
+            API_CALLS.inc(api=api, outcome=_outcome(e))
+            raise
+        self._release(None, trial)
+        API_CALLS.inc(api=api, outcome="success")
+
+    def stats(self) -> dict:
+        """Current limiter and circuit breaker state, for monitoring."""
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self._requests, self._tokens):
+                if bucket:
+                    bucket.wait_time(0, now) # Refill, so the reported budget is current
+            state = self._state
+            if state == OPEN and now - self._opened_at >= self.reset_seconds:
+                state = HALF_OPEN
+            return {
+                "circuit_state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "concurrency_limit": int(self._limit),
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "requests_available": round(self._requests.available, 1) if self._requests else None,
+                "requests_per_minute": self._requests.capacity if self._requests else None,
+                "tokens_available": round(self._tokens.available) if self._tokens else None,
+                "tokens_per_minute": self._tokens.capacity if self._tokens else None,
+                **self._counts,
+            }
+
+
+# --- Shared Instance ---
+gemini_limiter = AdaptiveRateLimiter(
+    GEMINI_REQUESTS_PER_MINUTE,
+    GEMINI_TOKENS_PER_MINUTE,
+    GEMINI_MAX_CONCURRENCY,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_RESET_SECONDS,
+)
+
+
+# Limiter state, read at scrape time
+Gauge(
+    "cvranker_gemini_in_flight", "Provider calls currently in flight.",
+    callback=lambda: gemini_limiter.stats()["in_flight"],
+)
+Gauge(
+    "cvranker_gemini_concurrency_limit", "Current adaptive (AIMD) limit on provider calls in flight.",
+    callback=lambda: gemini_limiter.stats()["concurrency_limit"],
+)
+Gauge(
+    "cvranker_gemini_circuit_open", "1 while the circuit breaker is open or half-open, else 0.",
+    callback=lambda: 0 if gemini_limiter.stats()["circuit_state"] == CLOSED else 1,
+)
@@ -0,0 +1,97 @@
+import csv
+import html
+import io
+import json
+import logging
+from typing import Iterable, Iterator, List, Sequence
+
+from .config import DATA_COLUMNS, EXPORT_CHUNK_ROWS
+from .result_store import RankedRow
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# Output columns, in display order
+COLUMNS = [DATA_COLUMNS["NAME"], DATA_COLUMNS["FILENAME"], DATA_COLUMNS["SUMMARY"], DATA_COLUMNS["SCORE"]]
+
+
+def format_score(score: float) -> str:
+    """Display form of a similarity score (one decimal). Scores are only formatted here."""
+    return f"{score:.1f}"
+
+
+def html_table(rows: Iterable[RankedRow], table_attributes: str = 'class="table table-striped results-table"', html_summaries: bool = True) -> str:
+    """
+    Renders rows as an HTML table. Names and filenames are escaped; with html_summaries=True
+    the display summaries (which contain <br /> line breaks) are inserted as they are,
+    otherwise the clean summaries are escaped.
+    """
+    header = "".join(f"<th>{html.escape(column)}</th>" for column in COLUMNS)
+    body = []
+    for row in rows:
+        summary = row.html_summary if html_summaries else html.escape(row.summary)
+        body.append(
+            f'<tr data-cv-id="{html.escape(row.cv_id)}">'
+            f"<td>{html.escape(row.name)}</td><td>{html.escape(row.filename)}</td>"
+            f"<td>{summary}</td><td>{format_score(row.score)}</td></tr>"
+        )
+    return f"<table {table_attributes}><thead><tr>{header}</tr></thead><tbody>{''.join(body)}</tbody></table>"
+
+
+def iter_csv(rows: Sequence[RankedRow], chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """
+    Yields the rows as CSV text with a header line (clean summaries), `chunk_rows` rows at
+    a time, for streamed downloads: only one chunk of text exists at once, whatever the row count.
+    """
+    chunk_rows = max(1, chunk_rows)
+    stream = io.StringIO()
+    writer = csv.writer(stream, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    for start in range(0, len(rows), chunk_rows):
+        for row in rows[start:start + chunk_rows]:
+            writer.writerow([row.name, row.filename, row.summary, format_score(row.score)])
+        yield stream.getvalue()
+        # Reuse the buffer for the next chunk
+        stream.seek(0)
+        stream.truncate()
+    if stream.tell():
+        yield stream.getvalue() # Header only (no rows)
+
+
+def iter_ndjson(rows: Sequence[RankedRow], chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """Yields the rows as newline-delimited JSON records (see json_records), `chunk_rows` lines at a time."""
+    chunk_rows = max(1, chunk_rows)
+    for start in range(0, len(rows), chunk_rows):
+        yield "".join(json.dumps(record) + "\n" for record in json_records(rows[start:start + chunk_rows]))
+
+
+def json_records(rows: Iterable[RankedRow], html_summaries: bool = False) -> List[dict]:
+    """
+    Rows as JSON-ready dicts; the score stays a number (in percent, 2 decimals).
+    With html_summaries=True each record also has the display summary as "html_summary".
+    """
+    records = []
+    for row in rows:
+        record = {"rank": row.rank, "cv_id": row.cv_id, "name": row.name, "filename": row.filename, "summary": row.summary, "score": row.score}
+        if html_summaries:
+            record["html_summary"] = row.html_summary
+        records.append(record)
+    return records
+
+
+def rows_from_records(records: List[dict]) -> List[RankedRow]:
+    """
+    Rebuilds rows from client-supplied records keyed by the output column names (as the
+    legacy POST download endpoints receive them). Unparseable scores count as 0.
+    """
+    rows = []
+    for rank, record in enumerate(records, start=1):
+        try:
+            score = float(record.get(DATA_COLUMNS["SCORE"], 0) or 0)
+        except (TypeError, ValueError):
+            score = 0.0
+        summary = str(record.get(DATA_COLUMNS["SUMMARY"], "") or "")
+        rows.append(RankedRow(
+            rank, str(rank), str(record.get(DATA_COLUMNS["NAME"], "") or ""), str(record.get(DATA_COLUMNS["FILENAME"], "") or ""),
+            summary, html.escape(summary), score,
+        ))
+    return rows
@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import json
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+from .config import REPORT_RENDER_WORKERS
+from .cache import get_cache, sha256_hex
+from .metrics import observe_stage
+from .render import html_table, json_records
+from .result_store import RankedRow
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# CSS for a professional-looking report
+REPORT_CSS = """
+    @page { size: A4 landscape; margin: 1.5cm; }
+    body { font-family: sans-serif; }
+    h1 { text-align: center; color: #333; }
+    #results-table { border-collapse: collapse; width: 100%; font-size: 10px; }
+    #results-table th, #results-table td { border: 1px solid #ddd; padding: 6px; }
+    #results-table th { background-color: #0d6efd; color: white; padding-top: 10px; padding-bottom: 10px; text-align: left; }
+    #results-table tr:nth-child(even) { background-color: #f2f2f2; }
+    #results-table td p { margin: 0; }
+"""
+
+REPORT_TEMPLATE = """
+<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>CV Ranking Results</title></head>
+<body><h1>CV Ranking Results</h1>{table}</body></html>
+"""
+
+# Part of every cached report key, so a layout change does not serve reports in the old layout
+REPORT_FINGERPRINT = sha256_hex(REPORT_CSS + REPORT_TEMPLATE)[:16]
+
+# --- Worker Pool ---
+# WeasyPrint layout takes seconds for long reports and is mostly pure Python, so it holds
+# the GIL: in a thread it would still starve the event loop. Reports are rendered in a
+# small process pool instead ("spawn", for the same reason as the extraction pool in
+# src/extraction.py), and at most REPORT_RENDER_WORKERS reports are rendered at once
+# (later downloads queue for a free worker).
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Returns the shared report pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = max(1, REPORT_RENDER_WORKERS)
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"Started PDF report process pool with {workers} workers.")
+        return _executor
+
+
+def _retire_executor(executor: ProcessPoolExecutor) -> None:
+    """Replaces the shared pool after a worker crashed; a broken pool cannot take new work."""
+    global _executor
+    with _executor_lock:
+        if _executor is not executor:
+            return # Already replaced by a concurrent request
+        _executor = None
+    executor.shutdown(wait=False)
+    logger.warning("PDF report process pool retired; a fresh pool will be used for new reports.")
+
+
+def shutdown_report_pool() -> None:
+    """Shuts the report pool down. Called from the application's shutdown hook."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+        logger.info("PDF report pool shut down.")
+
+
+@functools.lru_cache(maxsize=1)
+def _stylesheet():
+    """The report stylesheet, parsed once per process and shared by every render."""
+    # WeasyPrint is slow to import, so it is loaded on the first PDF download
+    from weasyprint import CSS
+
+    return CSS(string=REPORT_CSS)
+
+
+def render_pdf_report(rows: List[RankedRow]) -> bytes:
+    """
+    Renders result rows as a styled PDF report (blocking; see render_pdf_report_async,
+    which runs it in a worker process and records its time in the metrics).
+    """
+    from weasyprint import HTML
+
+    # Clean summaries, escaped, so the report shows exactly what the CSV holds
+    full_html = REPORT_TEMPLATE.format(table=html_table(rows, table_attributes='id="results-table"', html_summaries=False))
+    pdf_bytes = HTML(string=full_html).write_pdf(stylesheets=[_stylesheet()])
+
+    # Add a check to ensure pdf_bytes is not None before proceeding.
+    if pdf_bytes is None:
+        raise ValueError("PDF generation failed, resulted in None.")
+    return pdf_bytes
+
+
+def _report_cache_key(rows: List[RankedRow]) -> str:
+    """Cache key for a report: depends only on the rows shown and the report layout."""
+    content = json.dumps(json_records(rows), sort_keys=True)
+    return f"report:{REPORT_FINGERPRINT}:{sha256_hex(content)}"
+
+
+async def render_pdf_report_async(rows: List[RankedRow]) -> bytes:
+    """
+    Returns the PDF report for `rows`, rendered in the report process pool. Reports are cached on
+    disk by a hash of their content, so the same rows (from any result or worker process)
+    are only rendered once.
+    """
+    cache = get_cache()
+    key = _report_cache_key(rows)
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            return cached
+
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    try:
+        # Timed here: metrics recorded inside the worker process would not reach /metrics
+        with observe_stage("render_pdf"):
+            pdf_bytes = await loop.run_in_executor(executor, render_pdf_report, rows)
+    except BrokenProcessPool:
+        _retire_executor(executor)
+        raise
+    if cache is not None:
+        await asyncio.to_thread(cache.set, key, pdf_bytes)
+    return pdf_bytes
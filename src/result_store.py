@@ -0,0 +1,299 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import RESULT_STORE_TTL_SECONDS, RESULT_STORE_MAX_MB
+from .metrics import Gauge
+from .similarity import top_k_indices
+from .utils import summary_html
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+# Orders a page of results can be served in: best score first, lowest score first, or by filename
+RESULT_SORTS = ("score", "score_asc", "filename")
+
+
+class RankedRow(NamedTuple):
+    """One ranked CV as shown to the user. Scores stay numeric; they are formatted when rendered."""
+    rank: int # 1-based position for the JD
+    cv_id: str # Stable id of the CV within the result (derived from its content hash)
+    name: str
+    filename: str
+    summary: str # Clean summary (CSV/JSON/PDF)
+    html_summary: str # Display summary with <br /> line breaks
+    score: float # Similarity in percent
+
+
+# Per-response stand-ins for rows whose summaries could not be generated: {row index: (name, summary, display summary)}.
+# They are shown once and never stored, so the next load of those rows tries again.
+SummaryPlaceholders = Dict[int, Tuple[str, str, str]]
+
+
+class RankedResults:
+    """
+    The full ranking of one batch of CVs against one or more JDs.
+
+    Every CV is kept (not only the rows shown), with its score against each JD, so
+    any min_score/max_results combination can be served later without recomputing.
+    Columns are plain lists plus one (CVs x JDs) score matrix; rows are addressed by
+    a stable CV id, so CVs sharing a filename never get mixed up.
+    """
+
+    def __init__(
+        self,
+        jd_names: List[str],
+        names: List[str],
+        filenames: List[str],
+        summaries: List[str],
+        display_summaries: List[str],
+        scores: np.ndarray,
+        min_score: float = 0,
+        max_results: int = 10,
+        stats: Optional[Dict[str, int]] = None,
+        cv_ids: Optional[List[str]] = None,
+        not_processed: Optional[List[str]] = None,
+        unsummarized_texts: Optional[Dict[int, str]] = None,
+    ):
+        self.jd_names = jd_names
+        self.names = names
+        self.filenames = filenames
+        self.summaries = summaries
+        # Summaries as displayed (line breaks kept); turned into HTML only for the rows served
+        self.display_summaries = display_summaries
+        self.scores = np.asarray(scores, dtype=np.float64).reshape(len(names), len(jd_names))
+        # Content-derived ids when the caller has them (stable across re-runs), else positions
+        self.cv_ids = list(cv_ids) if cv_ids is not None else [f"cv{i + 1}" for i in range(len(names))]
+        self._row_by_id = {cv_id: i for i, cv_id in enumerate(self.cv_ids)}
+        # Filters chosen at upload time, used when a request does not specify its own
+        self.min_score = min_score
+        self.max_results = max_results
+        # Per-request pipeline counts (e.g. CVs left out by the pre-filter), shown with the results
+        self.stats = stats or {}
+        # Filenames of CVs left out because the time budget ran out before they were extracted or summarized
+        self.not_processed = not_processed or []
+        # Fast ranking mode: raw texts of the CVs whose summaries are generated only once a
+        # row is shown (see pipeline.summarize_shown_rows); their summary columns are empty until then
+        self._unsummarized: Dict[int, str] = dict(unsummarized_texts or {})
+        # Told how many bytes the results grew by when summaries are filled in (set by ResultStore.put)
+        self.on_resize: Optional[Callable[[int], None]] = None
+
+    def select(self, jd_index: int, min_score: float, max_results: int) -> np.ndarray:
+        """
+        Row indices for one JD with score >= min_score, best first, at most max_results.
+        Only the selected rows are sorted (partial top-k selection); ties keep upload order.
+        """
+        column = self.scores[:, jd_index]
+        candidates = np.flatnonzero(column >= min_score)
+        return candidates[top_k_indices(column[candidates], max_results)]
+
+    def rows(
+        self, jd_index: int, min_score: float, max_results: int, placeholders: Optional[SummaryPlaceholders] = None,
+    ) -> List[RankedRow]:
+        """The selected rows for one JD as records, best first."""
+        indices = self.select(jd_index, min_score, max_results)
+        return self.rows_at(jd_index, indices, range(1, len(indices) + 1), placeholders)
+
+    def page(
+        self, jd_index: int, min_score: float, max_results: int, sort: str = "score", offset: int = 0, limit: int = 25,
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        One page of the selected rows for a JD (see select), in `sort` order (one of
+        RESULT_SORTS). Returns (row indices, their ranks by score, total selected rows).
+        Sorted by score, only the rows up to the end of the page are selected and sorted.
+        """
+        if sort not in RESULT_SORTS:
+            raise ValueError(f"Unknown sort {sort!r}; expected one of {RESULT_SORTS}.")
+        column = self.scores[:, jd_index]
+        candidates = np.flatnonzero(column >= min_score)
+        total = min(len(candidates), max(0, max_results))
+        offset = min(max(0, offset), total)
+        end = min(total, offset + max(0, limit))
+        if sort == "score":
+            indices = candidates[top_k_indices(column[candidates], end)][offset:]
+            return indices, np.arange(offset + 1, end + 1), total
+        best_first = candidates[top_k_indices(column[candidates], total)]
+        if sort == "score_asc":
+            positions = np.arange(total)[::-1]
+        else:
+            filenames = [self.filenames[i].lower() for i in best_first.tolist()]
+            positions = np.array(sorted(range(total), key=lambda p: (filenames[p], p)), dtype=np.int64)
+        positions = positions[offset:end]
+        return best_first[positions], positions + 1, total
+
+    def rows_at(
+        self, jd_index: int, indices: Sequence[int], ranks: Sequence[int], placeholders: Optional[SummaryPlaceholders] = None,
+    ) -> List[RankedRow]:
+        """
+        Records for the given rows and ranks; HTML summaries are only built here.
+        Rows in `placeholders` show its name and summaries instead of the stored ones.
+        """
+        placeholders = placeholders or {}
+        rows = []
+        for i, rank in zip(np.asarray(indices).tolist(), ranks):
+            name, summary, display_summary = placeholders.get(i) or (self.names[i], self.summaries[i], self.display_summaries[i])
+            rows.append(RankedRow(
+                int(rank), self.cv_ids[i], name, self.filenames[i],
+                summary, summary_html(display_summary), float(self.scores[i, jd_index]),
+            ))
+        return rows
+
+    def pending_summaries(self, indices) -> List[int]:
+        """The row indices among `indices` whose summaries have not been generated yet."""
+        return [i for i in indices if i in self._unsummarized]
+
+    def unsummarized_text(self, index: int) -> str:
+        return self._unsummarized[index]
+
+    def set_summary(self, index: int, name: str, summary: str, display_summary: str) -> None:
+        """Fills in a lazily generated summary; the CV's raw text is no longer kept."""
+        old_size = len(self.names[index]) + len(self.summaries[index]) + len(self.display_summaries[index])
+        self.names[index] = name
+        self.summaries[index] = summary
+        self.display_summaries[index] = display_summary
+        old_size += len(self._unsummarized.pop(index, ""))
+        if self.on_resize is not None:
+            self.on_resize(len(name) + len(summary) + len(display_summary) - old_size)
+
+    def row_index(self, cv_id: str) -> Optional[int]:
+        """Position of a CV by its id, or None if it is not part of these results."""
+        return self._row_by_id.get(cv_id)
+
+    def estimated_size(self) -> int:
+        """Approximate memory footprint in bytes, for the store's memory cap."""
+        text_bytes = sum(len(text) for column in (self.names, self.filenames, self.summaries, self.display_summaries, self.cv_ids, self.not_processed, self._unsummarized.values()) for text in column)
+        return text_bytes + self.scores.nbytes
+
+
+def _artifact_size(value: Any) -> int:
+    """Approximate size in bytes of a memoized artifact (strings, bytes, or dicts of them)."""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_artifact_size(item) for item in value.values())
+    return 0
+
+
+class _Entry:
+    def __init__(self, results: RankedResults, ttl_seconds: float):
+        self.results = results
+        self.artifacts: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.size = results.estimated_size()
+        self.expires_at = time.time() + ttl_seconds
+
+
+class ResultStore:
+    """
+    In-memory store of ranked results keyed by result id, with a TTL and a memory cap.
+
+    Rendered artifacts (HTML tables) are memoized per result id and filter
+    combination and count towards the memory cap. When over the cap, the least
+    recently used results are dropped first.
+    """
+
+    def __init__(self, ttl_seconds: float, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, results: RankedResults) -> str:
+        """Stores ranked results and returns their new result id."""
+        result_id = uuid.uuid4().hex
+        entry = _Entry(results, self.ttl_seconds)
+        with self._lock:
+            self._entries[result_id] = entry
+            self._total_bytes += entry.size
+            self._evict(keep=result_id)
+        results.on_resize = lambda delta: self._resize(result_id, entry, delta)
+        logger.info(f"Stored result {result_id} (~{entry.size / 1024:.0f}KB).")
+        return result_id
+
+    def get(self, result_id: str) -> Optional[RankedResults]:
+        """Returns the stored results, or None if unknown or expired."""
+        with self._lock:
+            entry = self._touch(result_id)
+            return entry.results if entry is not None else None
+
+    def artifact(self, result_id: str, key: Hashable, render: Callable[[RankedResults], Any]) -> Any:
+        """
+        Returns the memoized artifact `key` for a result, calling `render(results)` on
+        the first request. Raises KeyError if the result is unknown or expired.
+        """
+        with self._lock:
+            entry = self._touch(result_id)
+            if entry is None:
+                raise KeyError(result_id)
+            if key in entry.artifacts:
+                entry.artifacts.move_to_end(key)
+                return entry.artifacts[key]
+        # Render outside the lock; two concurrent first requests may both render, which is harmless
+        value = render(entry.results)
+        size = _artifact_size(value)
+        with self._lock:
+            if self._entries.get(result_id) is entry and key not in entry.artifacts:
+                entry.artifacts[key] = value
+                entry.size += size
+                self._total_bytes += size
+                self._evict(keep=result_id)
+        return value
+
+    def _resize(self, result_id: str, entry: _Entry, delta: int) -> None:
+        """Accounts for a stored result growing (or shrinking) by `delta` bytes after it was stored."""
+        with self._lock:
+            if self._entries.get(result_id) is not entry:
+                return # Already evicted or expired
+            entry.size += delta
+            self._total_bytes += delta
+            self._evict(keep=result_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"results": len(self._entries), "size_bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+    def _touch(self, result_id: str) -> Optional[_Entry]:
+        entry = self._entries.get(result_id)
+        if entry is None:
+            return None
+        if entry.expires_at < time.time():
+            self._remove(result_id)
+            return None
+        self._entries.move_to_end(result_id)
+        return entry
+
+    def _remove(self, result_id: str) -> None:
+        entry = self._entries.pop(result_id)
+        self._total_bytes -= entry.size
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """
+        Drops expired results, then least recently used ones until under the memory cap.
+        The result `keep` (the one just written) is never dropped; if it alone is over
+        the cap, its oldest memoized artifacts are discarded instead.
+        """
+        now = time.time()
+        for result_id in [rid for rid, entry in self._entries.items() if entry.expires_at < now and rid != keep]:
+            self._remove(result_id)
+        for result_id in [rid for rid in self._entries if rid != keep]:
+            if self._total_bytes <= self.max_bytes:
+                return
+            logger.info(f"Evicting result {result_id} to stay under the result store memory cap.")
+            self._remove(result_id)
+        entry = self._entries.get(keep)
+        while entry is not None and entry.artifacts and self._total_bytes > self.max_bytes:
+            _, value = entry.artifacts.popitem(last=False)
+            size = _artifact_size(value)
+            entry.size -= size
+            self._total_bytes -= size
+
+
+# --- Shared Instance ---
+result_store = ResultStore(RESULT_STORE_TTL_SECONDS, RESULT_STORE_MAX_MB * 1024 * 1024)
+
+Gauge("cvranker_result_store_bytes", "Approximate memory held by stored results and their artifacts.",
+      callback=lambda: result_store.stats()["size_bytes"])
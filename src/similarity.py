@@ -0,0 +1,51 @@
+import logging
+from typing import Sequence, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+EmbeddingMatrix = Union[np.ndarray, Sequence[Sequence[float]]]
+
+
+def normalize_rows(matrix: EmbeddingMatrix) -> np.ndarray:
+    """
+    Returns a float32 copy of `matrix` with each row L2-normalized, so cosine
+    similarity becomes a plain dot product. All-zero rows stay zero.
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0 # Avoid dividing by zero; a zero vector scores 0 against everything
+    return matrix / norms
+
+
+def similarity_matrix(cv_embeddings: EmbeddingMatrix, jd_embeddings: EmbeddingMatrix, normalized: bool = False) -> np.ndarray:
+    """
+    Cosine similarities (in percent, rounded to 2 decimals) between N CV embeddings
+    and M JD embeddings, computed with a single matrix multiplication.
+    The product runs in float32; the (N, M) result is float64 so rounded scores stay exact.
+    Pass normalized=True if both inputs are already L2-normalized.
+    """
+    cvs = np.asarray(cv_embeddings, dtype=np.float32) if normalized else normalize_rows(cv_embeddings)
+    jds = np.asarray(jd_embeddings, dtype=np.float32) if normalized else normalize_rows(jd_embeddings)
+    if cvs.size == 0 or jds.size == 0:
+        return np.zeros((cvs.shape[0] if cvs.ndim == 2 else 0, jds.shape[0] if jds.ndim == 2 else 0))
+    if cvs.shape[1] != jds.shape[1]:
+        raise ValueError(f"CV embedding dimension {cvs.shape[1]} does not match JD embedding dimension {jds.shape[1]}.")
+    return np.round((cvs @ jds.T).astype(np.float64) * 100, 2)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores in a 1-D array, best first. Uses argpartition,
+    so only the selected k are sorted (O(N + k log k) instead of O(N log N)).
+    Selected entries with equal scores are ordered by index.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k == scores.shape[0]:
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    # Sort the selected candidates by (score desc, index asc) for a deterministic order
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from .metrics import COALESCED_CALLS, Gauge
+from .deadlines import BudgetSpentError
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+
+class _Released(Exception):
+    """Set on an in-flight call whose leader gave up without a result; waiters then try again."""
+
+
+class SingleFlight:
+    """
+    Process-wide de-duplication of identical in-flight calls ("single flight").
+
+    The first caller for a key (the leader) does the work; callers arriving with the same
+    key while it runs wait for the leader's result instead of repeating the call. Results
+    and errors are handed to every waiter, and nothing is kept once the call has finished
+    (the disk cache is what remembers results). Works across threads and event loops.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind # Metric label, e.g. "summary"
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def claim(self, key: str, count: bool = True) -> Tuple[Future, bool]:
+        """
+        Returns (future, leader). The leader must end the call with finish() or release();
+        anyone else waits on the future. With count=False a joined call is not counted as
+        coalesced (for callers that join through do()/ado() afterwards, which count it).
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                if count:
+                    COALESCED_CALLS.inc(kind=self.kind)
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def finish(self, key: str, future: Future, result: Any = None, error: BaseException = None) -> None:
+        """Ends a call claimed as leader, passing its result (or error) to every waiter."""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def release(self, key: str, future: Future) -> None:
+        """Ends a call claimed as leader without a result (e.g. it was cancelled); waiters retry it themselves."""
+        self.finish(key, future, error=_Released())
+
+    def result(self, key: str, future: Future, fn: Callable[[], Any]) -> Any:
+        """The outcome of a call joined through claim(); if its leader released it, fn() is done through do() instead."""
+        try:
+            return future.result()
+        except _Released:
+            return self.do(key, fn)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Returns fn(), or the result of the identical call already in flight (blocking).
+        A leader whose own time budget ran out releases the call to its waiters.
+        """
+        while True:
+            future, leader = self.claim(key)
+            if not leader:
+                try:
+                    return future.result()
+                except _Released:
+                    continue
+            try:
+                result = fn()
+            except BudgetSpentError:
+                self.release(key, future)
+                raise
+            except BaseException as e:
+                self.finish(key, future, error=e)
+                raise
+            self.finish(key, future, result)
+            return result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Async do(). A cancelled waiter does not affect the shared call; a cancelled leader
+        (or one whose time budget ran out) releases it, so one of its waiters repeats the
+        call instead of failing.
+        """
+        while True:
+            future, leader = self.claim(key)
+            if not leader:
+                waiter = asyncio.wrap_future(future)
+                try:
+                    # shield: cancelling this waiter must not cancel the shared future
+                    return await asyncio.shield(waiter)
+                except _Released:
+                    continue
+                except asyncio.CancelledError:
+                    # Nobody reads the outcome now; retrieve it so asyncio does not log it as lost
+                    waiter.add_done_callback(lambda done: done.cancelled() or done.exception())
+                    raise
+            try:
+                result = await fn()
+            except (asyncio.CancelledError, BudgetSpentError):
+                self.release(key, future)
+                raise
+            except BaseException as e:
+                self.finish(key, future, error=e)
+                raise
+            self.finish(key, future, result)
+            return result
+
+
+# --- Shared Instances ---
+# Keys are the disk cache keys of the results: provider/model, prompt hash and input hash
+summary_flight = SingleFlight("summary")
+embedding_flight = SingleFlight("embedding")
+
+Gauge(
+    "cvranker_singleflight_in_flight",
+    "Distinct provider calls currently in flight that other callers can join.",
+    ["kind"],
+    callback=lambda: {(flight.kind,): flight.in_flight() for flight in (summary_flight, embedding_flight)},
+)
@@ -1,12 +1,22 @@
+import asyncio
+import json
 import logging
-from typing import List
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from .config import LLM_MODEL_NAME, SUMMARIZER_PROMPT_MESSAGES
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from .config import (
+    SUMMARIZER_PROMPT_HASH, BATCH_SUMMARIZER_PROMPT_HASH, SUMMARY_MAX_CONCURRENCY,
+    SUMMARY_BATCH_ENABLED, SUMMARY_BATCH_MAX_CVS, SUMMARY_BATCH_MAX_TOKENS, SUMMARY_BATCH_MAX_CV_TOKENS,
+)
+from .providers import get_summary_provider
+from .cache import get_cache, sha256_hex
+
+from .metrics import API_RETRIES, SUMMARY_BATCH_FALLBACKS
+from .rate_limit import gemini_limiter, estimate_tokens, CircuitOpenError, RETRYABLE_ERRORS
+from .deadlines import BudgetSpentError, gather_within_budget, stop_when_budget_spent
+from .singleflight import summary_flight
+from .utils import Summary, SummaryRecord
 
 # Imports for tenacity
-from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
+from tenacity import retry, wait_random_exponential, stop_after_attempt, retry_if_exception_type
 # Specific Google API exceptions that are typically retryable
 from google.api_core.exceptions import ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded
 # --- Logging Configuration ---
@@ -14,58 +24,434 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
-# Initialize the Language Model using values from config
-llm = ChatGoogleGenerativeAI(
-    model=LLM_MODEL_NAME
-)
+# Shared retry policy for the sync and async summarization paths.
+# tenacity detects coroutine functions and backs off with asyncio.sleep for them,
+# so concurrent async calls each retry independently without blocking the event loop.
+# Pacing against the quota is left to the shared limiter; the backoff here is short
+# and jittered so retries from concurrent calls do not arrive together.
+def _retry_policy(api: str):
+    return retry(
+        wait=wait_random_exponential(multiplier=1, max=10), # Random backoff within 1s, 2s, 4s, ... up to 10s max
+        # Try up to 5 times in total (1 initial attempt + 4 retries), and never after the request's deadline
+        stop=stop_after_attempt(5) | stop_when_budget_spent,
+        # Retry on specific Google API errors: Quota Exceeded (429), Internal Server Error (500),
+        # Service Unavailable (503), and Deadline Exceeded (timeout).
+        # CircuitOpenError is not retried, so calls fail fast while the API is down.
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        before_sleep=lambda retry_state: API_RETRIES.inc(api=api),
+        reraise=True # Re-raise the last exception if all retries fail, to be caught by the outer try-except
+    )
 
-# Create the prompt template directly from the config
-prompt_template = ChatPromptTemplate.from_messages(
-    SUMMARIZER_PROMPT_MESSAGES
-)
 
-# Create the summarization chain
-output_parser = StrOutputParser()
-summarization_chain = prompt_template | llm | output_parser
+_retry_on_transient_errors = _retry_policy("summary")
 
+# --- Per-CV result strings (shared by the sync and async paths) ---
+EMPTY_CV_MESSAGE = "No content provided for summary."
+API_ERROR_MESSAGE = "Error: Could not generate summary due to persistent API issues (e.g., quota, server error, timeout). Please try again later."
+UNEXPECTED_ERROR_MESSAGE = "Error: An unexpected issue occurred during summary generation."
+NOT_PROCESSED_MESSAGE = "Not processed: the time budget ran out before this CV was summarized."
 
-@retry(
-    wait=wait_exponential(multiplier=1, min=4, max=10), # Exponential backoff: 4s, 8s, 16s, ... up to 10s max
-    stop=stop_after_attempt(5), # Try up to 5 times in total (1 initial attempt + 4 retries)
-    # Retry on specific Google API errors: Quota Exceeded (429), Internal Server Error (500),
-    # Service Unavailable (503), and Deadline Exceeded (timeout)
-    retry=retry_if_exception_type((ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded)),
-    reraise=True # Re-raise the last exception if all retries fail, to be caught by the outer try-except
-)
+
+def is_failed_summary(summary: Summary) -> bool:
+    """True if `summary` is one of the per-CV placeholder/error strings rather than model output."""
+    return summary in (EMPTY_CV_MESSAGE, API_ERROR_MESSAGE, UNEXPECTED_ERROR_MESSAGE, NOT_PROCESSED_MESSAGE)
+
+
+def _summary_cache_key(cv_text: str, prompt_hash: str = SUMMARIZER_PROMPT_HASH) -> str:
+    """Cache key for a summary: depends on the provider/model, the prompt wording and the CV text."""
+    return f"summary:{get_summary_provider().cache_namespace}:{prompt_hash}:{sha256_hex(cv_text)}"
+
+
+def _get_cached_summary(cv_text: str) -> Optional[Summary]:
+    """
+    Returns a previously generated summary for this CV text, if cached: the raw reply of a
+    single request, or the structured record from a batched one. Either one is reused.
+    """
+    cache = get_cache()
+    if cache is None:
+        return None
+    cached = cache.get(_summary_cache_key(cv_text))
+    if cached is not None:
+        return cached.decode("utf-8")
+    cached = cache.get(_summary_cache_key(cv_text, BATCH_SUMMARIZER_PROMPT_HASH))
+    if cached is not None:
+        try:
+            return SummaryRecord(**json.loads(cached))
+        except (ValueError, TypeError):
+            return cached.decode("utf-8") # Cached before batched summaries were stored as JSON
+    return None
+
+
+def _store_summary(cv_text: str, summary: Summary) -> None:
+    """
+    Caches a model-generated summary. Only real model output reaches here;
+    the per-CV error strings are returned from the except blocks and never cached.
+    Structured records from batched replies are stored as JSON under the batch prompt's key.
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+    if isinstance(summary, SummaryRecord):
+        cache.set(_summary_cache_key(cv_text, BATCH_SUMMARIZER_PROMPT_HASH), json.dumps(summary._asdict()).encode("utf-8"))
+    else:
+        cache.set(_summary_cache_key(cv_text), summary.encode("utf-8"))
+
+
+def _get_cached_summaries(cv_texts: List[str]) -> List[Optional[Summary]]:
+    """_get_cached_summary for several CVs (empty ones are skipped), so a batch takes one thread hop."""
+    return [_get_cached_summary(cv_text) if cv_text and cv_text.strip() else None for cv_text in cv_texts]
+
+
+def _store_summaries(summaries: List[Tuple[str, Summary]]) -> None:
+    """_store_summary for several (cv_text, summary) pairs."""
+    for cv_text, summary in summaries:
+        _store_summary(cv_text, summary)
+
+
+def _summarize_and_store(cv_text: str) -> str:
+    response = _summarize_cv_with_retry(cv_text)
+    _store_summary(cv_text, response)
+    return response
+
+
+async def _asummarize_and_store(cv_text: str) -> str:
+    response = await _asummarize_cv_with_retry(cv_text)
+    await asyncio.to_thread(_store_summary, cv_text, response)
+    return response
+
+
+@_retry_on_transient_errors
 def _summarize_cv_with_retry(cv_text: str) -> str:
     """
-    Internal function to invoke the summarization chain with retries.
+    Internal function to call the summary provider with retries.
     This function will be retried automatically by tenacity on transient errors.
     """
     logger.debug("Attempting to summarize CV with AI.")
-    response = summarization_chain.invoke({"cv_text": cv_text})
+    # Each attempt takes a slot from the process-wide Gemini limiter
+    with gemini_limiter.limit(estimate_tokens(cv_text), api="summary"):
+        response = get_summary_provider().summarize(cv_text)
     logger.debug("AI summarization successful.")
     return response
 
 
-def summarize_cv(cv_text: str) -> str:
+@_retry_on_transient_errors
+async def _asummarize_cv_with_retry(cv_text: str) -> str:
     """
-    Summarizes the skills and experiences in a CV using a LangChain chain.
-    Returns the raw summary from the model. Handles empty input and API errors.
+    Async counterpart of _summarize_cv_with_retry, using the chain's ainvoke.
+    """
+    logger.debug("Attempting to summarize CV with AI (async).")
+    async with gemini_limiter.alimit(estimate_tokens(cv_text), api="summary"):
+        response = await get_summary_provider().asummarize(cv_text)
+    logger.debug("AI summarization successful (async).")
+    return response
+
+
+def summarize_cv(cv_text: str) -> Summary:
+    """
+    Summarizes the skills and experiences in a CV using the configured summary provider
+    (Gemini through LangChain in production).
+    Returns the raw summary from the model (or a SummaryRecord cached from a batched request).
+    Handles empty input and API errors.
     """
     if not cv_text or not cv_text.strip():
         logger.warning("Received empty or whitespace-only CV text for summarization.")
-        return "No content provided for summary."
+        return EMPTY_CV_MESSAGE
+
+    cached = _get_cached_summary(cv_text)
+    if cached is not None:
+        return cached
 
     try:
-        # Call the retriable internal function
-        response = _summarize_cv_with_retry(cv_text)
-        return response
+        # Call the retriable internal function; an identical call already in flight
+        # (e.g. the same CV from another request) is joined instead of repeated
+        return summary_flight.do(_summary_cache_key(cv_text), lambda: _summarize_and_store(cv_text))
+    except BudgetSpentError as e:
+        logger.warning(f"Summarization skipped: {e}")
+        return NOT_PROCESSED_MESSAGE
+    except CircuitOpenError as e:
+        logger.error(f"Summarization skipped: {e}")
+        return API_ERROR_MESSAGE
     except (ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded) as e:
         # This block catches the exception if all retries have failed for a known API issue.
         logger.error(f"Persistent Google Generative AI API error after retries during summarization: {e}", exc_info=True)
-        return "Error: Could not generate summary due to persistent API issues (e.g., quota, server error, timeout). Please try again later."
+        return API_ERROR_MESSAGE
     except Exception as e:
         # This block catches any other unexpected exceptions.
         logger.error(f"An unexpected error occurred during summarization: {e}", exc_info=True)
-        return "Error: An unexpected issue occurred during summary generation."
\ No newline at end of file
+        return UNEXPECTED_ERROR_MESSAGE
+
+
+async def asummarize_cv(cv_text: str) -> Summary:
+    """
+    Async version of summarize_cv. Returns the same per-CV error strings. A cached (or joined
+    in-flight) summary from a batched request comes back as a SummaryRecord.
+    """
+    if not cv_text or not cv_text.strip():
+        logger.warning("Received empty or whitespace-only CV text for summarization.")
+        return EMPTY_CV_MESSAGE
+
+    cached = await asyncio.to_thread(_get_cached_summary, cv_text)
+    if cached is not None:
+        return cached
+
+    try:
+        return await summary_flight.ado(_summary_cache_key(cv_text), lambda: _asummarize_and_store(cv_text))
+    except BudgetSpentError as e:
+        logger.warning(f"Summarization skipped: {e}")
+        return NOT_PROCESSED_MESSAGE
+    except CircuitOpenError as e:
+        logger.error(f"Summarization skipped: {e}")
+        return API_ERROR_MESSAGE
+    except (ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded) as e:
+        logger.error(f"Persistent Google Generative AI API error after retries during summarization: {e}", exc_info=True)
+        return API_ERROR_MESSAGE
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during summarization: {e}", exc_info=True)
+        return UNEXPECTED_ERROR_MESSAGE
+
+
+# --- Batched summarization (several short CVs per request, JSON reply) ---
+
+def pack_cvs(
+    cv_texts: List[str],
+    indices: List[int],
+    max_cvs: int = SUMMARY_BATCH_MAX_CVS,
+    max_tokens: int = SUMMARY_BATCH_MAX_TOKENS,
+    max_cv_tokens: int = SUMMARY_BATCH_MAX_CV_TOKENS,
+) -> Tuple[List[List[int]], List[int]]:
+    """
+    Groups the CVs at `indices` into packs of at most `max_cvs` CVs and `max_tokens`
+    estimated tokens, in order. Returns the packs and the CVs to send on their own:
+    long CVs (over `max_cv_tokens`) and any CV that would be alone in its pack.
+    """
+    packs: List[List[int]] = []
+    singles: List[int] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i in indices:
+        tokens = estimate_tokens(cv_texts[i])
+        if tokens > max_cv_tokens:
+            singles.append(i)
+            continue
+        if current and (len(current) >= max_cvs or current_tokens + tokens > max_tokens):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    singles += [pack[0] for pack in packs if len(pack) == 1]
+    return [pack for pack in packs if len(pack) > 1], sorted(singles)
+
+
+def parse_batch_reply(reply: str, cv_ids: List[str]) -> Dict[str, SummaryRecord]:
+    """
+    Validates a batched JSON reply and returns {cv id: SummaryRecord} for each well-formed
+    entry with a requested id. The name and summary are kept as the separate fields the
+    model returned, so nothing has to be parsed back out of free text. CVs missing from the
+    reply are simply absent; a reply that is not a JSON array raises ValueError.
+    """
+    text = reply.strip()
+    if text.startswith("```"):
+        # Some models wrap JSON in a markdown fence despite the instructions
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    entries = json.loads(text) # json.JSONDecodeError is a ValueError
+    if not isinstance(entries, list):
+        raise ValueError(f"Expected a JSON array, got {type(entries).__name__}.")
+
+    wanted = set(cv_ids)
+    summaries = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        cv_id, name, summary = str(entry.get("id", "")), entry.get("name"), entry.get("summary")
+        if cv_id not in wanted or cv_id in summaries:
+            continue
+        if not isinstance(name, str) or not isinstance(summary, str) or not name.strip() or not summary.strip():
+            continue
+        summaries[cv_id] = SummaryRecord(" ".join(name.split()), summary.strip())
+    return summaries
+
+
+@_retry_policy("summary_batch")
+async def _asummarize_batch_with_retry(cvs: str) -> str:
+    logger.debug("Attempting to summarize a pack of CVs with AI.")
+    async with gemini_limiter.alimit(estimate_tokens(cvs), api="summary_batch"):
+        response = await get_summary_provider().asummarize_batch(cvs)
+    logger.debug("AI batched summarization successful.")
+    return response
+
+
+async def asummarize_pack(cv_texts: List[str]) -> List[Optional[Summary]]:
+    """
+    Summarizes several CVs with one request. Returns a SummaryRecord per CV, or None for
+    CVs the reply left out or got wrong, which the caller summarizes one by one.
+    Persistent API errors give every CV the same error string as a single call would.
+    """
+    cv_ids = [str(i + 1) for i in range(len(cv_texts))]
+    cvs = "\n\n".join(f"=== CV {cv_id} ===\n{cv_text.strip()}" for cv_id, cv_text in zip(cv_ids, cv_texts))
+    try:
+        reply = await _asummarize_batch_with_retry(cvs)
+    except BudgetSpentError as e:
+        logger.warning(f"Batched summarization skipped: {e}")
+        return [NOT_PROCESSED_MESSAGE] * len(cv_texts)
+    except CircuitOpenError as e:
+        logger.error(f"Batched summarization skipped: {e}")
+        return [API_ERROR_MESSAGE] * len(cv_texts)
+    except (ResourceExhausted, InternalServerError, ServiceUnavailable, DeadlineExceeded) as e:
+        logger.error(f"Persistent Google Generative AI API error after retries during batched summarization: {e}", exc_info=True)
+        return [API_ERROR_MESSAGE] * len(cv_texts)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during batched summarization: {e}", exc_info=True)
+        summaries: Dict[str, Summary] = {}
+    else:
+        try:
+            summaries = parse_batch_reply(reply, cv_ids)
+        except ValueError as e:
+            logger.warning(f"Could not parse the batched summary reply for {len(cv_texts)} CVs: {e}")
+            summaries = {}
+
+    results = [summaries.get(cv_id) for cv_id in cv_ids]
+    await asyncio.to_thread(_store_summaries, [(cv_text, summary) for cv_text, summary in zip(cv_texts, results) if summary is not None])
+    missing = results.count(None)
+    if missing:
+        SUMMARY_BATCH_FALLBACKS.inc(missing)
+        logger.warning(f"{missing} of {len(cv_texts)} CVs in a batch fall back to single summarization calls.")
+    return results
+
+
+async def _summarize_cvs_batched(
+    cv_texts: List[str],
+    max_concurrency: int,
+    on_progress: Optional[Callable[[int, int], None]],
+) -> List[Summary]:
+    """summarize_cvs with short uncached CVs packed into batched requests."""
+    results: List[Optional[Summary]] = [None] * len(cv_texts)
+    done = 0
+
+    def _count(n: int = 1) -> None:
+        nonlocal done
+        done += n
+        if on_progress is not None:
+            on_progress(done, len(cv_texts))
+
+    # Empty and cached CVs are answered without a request (asummarize_cv does the same)
+    uncached = []
+    cached = await asyncio.to_thread(_get_cached_summaries, cv_texts)
+    for i, cv_text in enumerate(cv_texts):
+        if not cv_text or not cv_text.strip():
+            results[i] = EMPTY_CV_MESSAGE
+        else:
+            results[i] = cached[i]
+        if results[i] is None:
+            uncached.append(i)
+    if len(uncached) < len(cv_texts):
+        _count(len(cv_texts) - len(uncached))
+
+    # Packed CVs are claimed in the single-flight registry, so other requests wait for this
+    # pack instead of summarizing them again. CVs already in flight elsewhere are joined
+    # through asummarize_cv (as singles) rather than packed.
+    keys = {i: _summary_cache_key(cv_texts[i]) for i in uncached}
+    claims = {}
+    joined = []
+    for i in uncached:
+        future, leader = summary_flight.claim(keys[i], count=False)
+        if leader:
+            claims[i] = future
+        else:
+            joined.append(i)
+    packs, singles = pack_cvs(cv_texts, list(claims))
+    for i in singles:
+        summary_flight.release(keys[i], claims.pop(i)) # asummarize_cv claims it again for itself
+    singles = sorted(singles + joined)
+    logger.info(f"Summarizing {len(uncached)} CVs with {len(packs)} batched and {len(singles)} single requests.")
+
+    # One semaphore for packs and single calls, as in bounded_summarizer
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _single(i: int) -> None:
+        async with semaphore:
+            results[i] = await asummarize_cv(cv_texts[i])
+        _count()
+
+    async def _pack(indices: List[int]) -> None:
+        try:
+            async with semaphore:
+                summaries = await asummarize_pack([cv_texts[i] for i in indices])
+        except BaseException:
+            # Cancelled (e.g. at the deadline): whoever joined these CVs summarizes them instead
+            for i in indices:
+                summary_flight.release(keys[i], claims[i])
+            raise
+        fallbacks = []
+        for i, summary in zip(indices, summaries):
+            if summary is None:
+                summary_flight.release(keys[i], claims[i])
+                fallbacks.append(i)
+            else:
+                summary_flight.finish(keys[i], claims[i], summary)
+                results[i] = summary
+        _count(len(indices) - len(fallbacks))
+        await asyncio.gather(*(_single(i) for i in fallbacks))
+
+    # Work still running at the request's deadline is cancelled; its CVs stay unsummarized
+    await gather_within_budget([*(_pack(pack) for pack in packs), *(_single(i) for i in singles)], None)
+    return [NOT_PROCESSED_MESSAGE if summary is None else summary for summary in results]
+
+
+def bounded_summarizer(
+    max_concurrency: int = SUMMARY_MAX_CONCURRENCY,
+    on_done: Optional[Callable[[], None]] = None,
+) -> Callable[[str], Awaitable[Summary]]:
+    """
+    Returns an async `summarize(cv_text)` allowing at most `max_concurrency` calls in flight
+    across everything that uses it, so CVs can be handed over one by one as they arrive.
+    `on_done()` is called as each summary finishes. Like asummarize_cv, it never raises.
+    """
+    # The semaphore wraps the whole retrying call, so a CV that is backing off
+    # keeps its slot and retries never push us over the concurrency limit.
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _bounded(cv_text: str) -> Summary:
+        async with semaphore:
+            summary = await asummarize_cv(cv_text)
+        if on_done is not None:
+            on_done()
+        return summary
+
+    return _bounded
+
+
+async def summarize_cvs(
+    cv_texts: List[str],
+    max_concurrency: int = SUMMARY_MAX_CONCURRENCY,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    batch: Optional[bool] = None,
+) -> List[Summary]:
+    """
+    Summarizes many CVs concurrently, with at most `max_concurrency` calls in flight.
+    Results are returned in the same order as `cv_texts`.
+    `on_progress(done, total)` is called as each summary finishes. Calls still running when
+    the request's time budget runs out (see deadlines.py) are cancelled, and their CVs get
+    NOT_PROCESSED_MESSAGE.
+    With `batch` (default: SUMMARY_BATCH_ENABLED), short CVs are packed several to a
+    request with a structured JSON reply; their summaries come back as SummaryRecords, while
+    CVs a reply misses are retried one by one and keep the raw single-CV reply.
+    """
+    if not cv_texts:
+        return []
+    if SUMMARY_BATCH_ENABLED if batch is None else batch:
+        return await _summarize_cvs_batched(cv_texts, max_concurrency, on_progress)
+
+    done = 0
+
+    def _count() -> None:
+        nonlocal done
+        done += 1
+        if on_progress is not None:
+            on_progress(done, len(cv_texts))
+
+    summarize = bounded_summarizer(max_concurrency, _count)
+    # Results keep the input order; asummarize_cv never raises.
+    return await gather_within_budget((summarize(cv_text) for cv_text in cv_texts), NOT_PROCESSED_MESSAGE)
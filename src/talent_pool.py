@@ -0,0 +1,253 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+import numpy as np
+
+from .config import POOL_DIR, POOL_IVF_PROBES, POOL_IVF_MIN_SIZE
+from .similarity import normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+
+class TalentPool:
+    """
+    A persistent pool of summarized CVs that can be ranked against new job descriptions.
+
+    On disk (in `directory`):
+      - embeddings.f32: an append-only float32 matrix of L2-normalized embeddings,
+        read through a memory map so the pool does not have to fit in RAM.
+      - records.jsonl: one JSON record per row (name, filename, summary, content hash).
+      - ivf.npz: an optional partitioned (IVF) index of k-means centroids and row
+        assignments, used for approximate search on large pools.
+    Writers take an exclusive file lock, so several worker processes can share a pool.
+    Each process notices new rows by the file sizes and reloads incrementally.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._embeddings_path = os.path.join(directory, "embeddings.f32")
+        self._records_path = os.path.join(directory, "records.jsonl")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._ivf_path = os.path.join(directory, "ivf.npz")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._thread_lock = threading.Lock()
+
+        self._dim: Optional[int] = None
+        self._matrix: Optional[np.memmap] = None
+        self._records: List[dict] = []
+        self._records_offset = 0 # Bytes of records.jsonl already loaded
+        self._hashes = set()
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._ivf_mtime: Optional[float] = None
+
+    # --- Locking & Loading ---
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive inter-process lock for writes."""
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Picks up rows (and index changes) written by this or any other process."""
+        if self._dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self._dim = json.load(f)["dim"]
+
+        if os.path.exists(self._records_path) and os.path.getsize(self._records_path) > self._records_offset:
+            with open(self._records_path, "rb") as f:
+                f.seek(self._records_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break # A partially written line; picked up on the next refresh
+                    record = json.loads(line)
+                    self._records.append(record)
+                    self._hashes.add(record["content_hash"])
+                    self._records_offset += len(line)
+
+        if self._dim is not None and os.path.exists(self._embeddings_path):
+            rows = os.path.getsize(self._embeddings_path) // (self._dim * 4)
+            if self._matrix is None or self._matrix.shape[0] != rows:
+                self._matrix = np.memmap(self._embeddings_path, dtype=np.float32, mode="r", shape=(rows, self._dim)) if rows else None
+
+        if os.path.exists(self._ivf_path):
+            mtime = os.path.getmtime(self._ivf_path)
+            if mtime != self._ivf_mtime:
+                with np.load(self._ivf_path) as data:
+                    self._centroids = data["centroids"]
+                    self._assignments = data["assignments"]
+                self._ivf_mtime = mtime
+
+    @property
+    def size(self) -> int:
+        """Number of complete rows (both the embedding and the record are written)."""
+        with self._thread_lock:
+            self._refresh()
+            return self._size()
+
+    def _size(self) -> int:
+        rows = self._matrix.shape[0] if self._matrix is not None else 0
+        return min(rows, len(self._records))
+
+    def contains(self, content_hash: str) -> bool:
+        """True if a CV with this content hash is already in the pool."""
+        with self._thread_lock:
+            self._refresh()
+            return content_hash in self._hashes
+
+    # --- Writes ---
+
+    def add(self, records: List[dict], embeddings: List[List[float]]) -> int:
+        """
+        Appends CVs to the pool. Each record needs 'name', 'filename', 'summary' and
+        'content_hash'; records whose content hash is already pooled are skipped.
+        Returns the number of rows added.
+        """
+        if not records:
+            return 0
+        vectors = normalize_rows(embeddings)
+
+        with self._thread_lock, self._file_lock():
+            self._refresh()
+            if self._dim is None:
+                self._dim = int(vectors.shape[1])
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self._dim}, f)
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the pool's dimension {self._dim}.")
+
+            keep = []
+            for i, record in enumerate(records):
+                if record["content_hash"] not in self._hashes:
+                    self._hashes.add(record["content_hash"])
+                    keep.append(i)
+            if not keep:
+                return 0
+
+            # Embeddings are written before records, so a crash between the two leaves
+            # extra embedding rows rather than records without vectors. Drop any such
+            # rows first so the matrix and the records stay aligned.
+            if self._matrix is not None and self._matrix.shape[0] > len(self._records):
+                self._matrix = None
+                with open(self._embeddings_path, "r+b") as f:
+                    f.truncate(len(self._records) * self._dim * 4)
+            # Under the lock, a partial last record line can only be left by a crashed
+            # write; cut it off so the next record does not get appended to it
+            if os.path.exists(self._records_path) and os.path.getsize(self._records_path) > self._records_offset:
+                with open(self._records_path, "r+b") as f:
+                    f.truncate(self._records_offset)
+            with open(self._embeddings_path, "ab") as f:
+                f.write(vectors[keep].tobytes())
+            with open(self._records_path, "a", encoding="utf-8") as f:
+                for i in keep:
+                    f.write(json.dumps(records[i]) + "\n")
+
+            if self._centroids is not None:
+                # Keep the partitioned index current by assigning new rows to their nearest centroid
+                new_assignments = np.argmax(vectors[keep] @ self._centroids.T, axis=1).astype(np.int32)
+                self._assignments = np.concatenate([self._assignments, new_assignments])
+                self._save_ivf()
+
+            self._refresh()
+            logger.info(f"Added {len(keep)} CVs to the talent pool (now {self._size()}).")
+            return len(keep)
+
+    def build_index(self, n_lists: Optional[int] = None, iterations: int = 10) -> int:
+        """
+        Builds the partitioned (IVF) index with spherical k-means over the pooled embeddings.
+        Returns the number of partitions.
+        """
+        with self._thread_lock, self._file_lock():
+            self._refresh()
+            size = self._size()
+            if size == 0:
+                raise ValueError("Cannot build an index for an empty talent pool.")
+            matrix = self._matrix[:size]
+            n_lists = max(1, min(n_lists or int(np.sqrt(size)), size))
+
+            rng = np.random.default_rng(0)
+            centroids = np.array(matrix[rng.choice(size, n_lists, replace=False)])
+            for _ in range(iterations):
+                assignments = np.argmax(matrix @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, matrix)
+                # Partitions that lost all members keep their previous centroid
+                empty = ~np.bincount(assignments, minlength=n_lists).astype(bool)
+                sums[empty] = centroids[empty]
+                centroids = normalize_rows(sums)
+            self._centroids = centroids
+            self._assignments = np.argmax(matrix @ centroids.T, axis=1).astype(np.int32)
+            self._save_ivf()
+            logger.info(f"Built talent pool IVF index with {n_lists} partitions over {size} CVs.")
+            return n_lists
+
+    def _save_ivf(self) -> None:
+        tmp_path = self._ivf_path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self._centroids, assignments=self._assignments)
+        os.replace(tmp_path, self._ivf_path) # Atomic, so readers never see a half-written index
+        self._ivf_mtime = os.path.getmtime(self._ivf_path)
+
+    # --- Search ---
+
+    def search(self, query_embedding: List[float], top_k: int = 10, approximate: Optional[bool] = None, n_probes: int = POOL_IVF_PROBES) -> List[dict]:
+        """
+        Returns the top_k pooled CVs by cosine similarity to `query_embedding`, best first.
+        Each result is the stored record plus a 'score' in percent.
+
+        By default the approximate index is used only when it exists and the pool has at
+        least POOL_IVF_MIN_SIZE rows; otherwise a full vectorized scan is done.
+        """
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        with self._thread_lock:
+            self._refresh()
+            size = self._size()
+            if size == 0:
+                return []
+            if query.shape[0] != self._dim:
+                raise ValueError(f"Query dimension {query.shape[0]} does not match the pool's dimension {self._dim}.")
+            matrix = self._matrix[:size]
+
+            has_index = self._centroids is not None and self._assignments is not None and len(self._assignments) >= size
+            if approximate is None:
+                approximate = has_index and size >= POOL_IVF_MIN_SIZE
+
+            if approximate and has_index:
+                probes = top_k_indices(self._centroids @ query, n_probes)
+                rows = np.flatnonzero(np.isin(self._assignments[:size], probes))
+                scores = matrix[rows] @ query
+                best = rows[top_k_indices(scores, top_k)]
+                best_scores = matrix[best] @ query
+            else:
+                scores = matrix @ query
+                best = top_k_indices(scores, top_k)
+                best_scores = scores[best]
+
+            return [
+                {**self._records[i], "score": round(float(score) * 100, 2)}
+                for i, score in zip(best, best_scores)
+            ]
+
+
+# --- Shared Instance ---
+_pool: Optional[TalentPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_talent_pool() -> TalentPool:
+    """Returns the process-wide talent pool stored in POOL_DIR."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TalentPool(POOL_DIR)
+        return _pool
@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Optional, Tuple
+
+from fastapi import UploadFile
+
+from .config import UPLOAD_CHUNK_SIZE_KB
+
+logger = logging.getLogger(__name__) # Initialize a logger for this module
+
+
+class UploadTooLargeError(Exception):
+    """Raised while saving an upload once a file, or the whole request, goes over its byte limit."""
+
+    def __init__(self, filename: str, limit_bytes: int, per_request: bool = False):
+        self.filename = filename
+        self.limit_bytes = limit_bytes
+        self.per_request = per_request
+        scope = "the total upload size" if per_request else "the file size limit"
+        super().__init__(f"{filename} exceeds {scope} of {limit_bytes // (1024 * 1024)}MB.")
+
+
+class ByteBudget:
+    """Total bytes one request may upload, shared by all of its files."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def consume(self, size: int, filename: str) -> None:
+        self.used += size
+        if self.used > self.max_bytes:
+            raise UploadTooLargeError(filename, self.max_bytes, per_request=True)
+
+
+async def save_upload(
+    upload: UploadFile,
+    directory: str,
+    max_file_bytes: int,
+    budget: Optional[ByteBudget] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE_KB * 1024,
+) -> Tuple[str, str]:
+    """
+    Streams an upload into a new file in `directory` in fixed-size chunks, hashing it in
+    the same pass, and closes the upload. Returns the saved path and the SHA-256 of the content.
+
+    The size is counted while copying rather than taken from UploadFile.size (which can be
+    None), so an oversized file is cut off as soon as it crosses `max_file_bytes` or the
+    request's `budget`; the partial file is removed and UploadTooLargeError is raised.
+    """
+    # A generated name avoids collisions between uploads sharing a filename (and path tricks in it)
+    fd, filepath = tempfile.mkstemp(dir=directory, suffix=os.path.splitext(upload.filename or "")[1])
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_file_bytes:
+                    raise UploadTooLargeError(upload.filename, max_file_bytes)
+                if budget is not None:
+                    budget.consume(len(chunk), upload.filename)
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        os.remove(filepath)
+        raise
+    finally:
+        await upload.close() # Close the UploadFile object
+    return filepath, digest.hexdigest()
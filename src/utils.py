@@ -1,83 +1,79 @@
 import logging
-import pdfplumber
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import NamedTuple, Union
 import numpy as np
-import pandas as pd
-from .config import DATA_COLUMNS
+from .pdf_text import extract_pdf_text
+from .similarity import similarity_matrix
 
 logger = logging.getLogger(__name__) # Initialize a logger for this module
 
 def extract_text_from_pdf(pdf_stream) -> str:
     """
-    Extracts text from a PDF file stream.
+    Extracts text from a PDF file stream (or path) with the configured engine and budgets
+    (see src/pdf_text.py). Returns an empty string on failure.
     """
-    text = ""
-    try:
-        with pdfplumber.open(pdf_stream) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text
-    except Exception as e:
-        # Log the error with traceback
-        logger.error(f"Error extracting text from PDF stream: {e}", exc_info=True)
-        return "" # Return empty string on failure
+    return extract_pdf_text(pdf_stream).text
 
-def calculate_similarities(embeddings_list: list) -> list[float]:
+class SummaryRecord(NamedTuple):
+    """A summary whose name and text came back as separate fields (batched JSON replies)."""
+    name: str
+    summary: str
+
+    @property
+    def text(self) -> str:
+        """The name and summary as one document, in the single-CV layout (for embedding)."""
+        return f"{self.name}\n{self.summary}"
+
+# A summary is either a structured record or a raw single-CV reply / per-CV error string
+Summary = Union[str, SummaryRecord]
+
+def summary_text(summary: Summary) -> str:
+    """The text of a summary, whichever form it has; this is what gets embedded."""
+    return summary if isinstance(summary, str) else summary.text
+
+def parse_summaries(summaries: list[Summary]) -> tuple[list[str], list[str], list[str]]:
     """
-    Calculates cosine similarities between CV embeddings and the JD embedding.
+    Turns summaries into names, whitespace-cleaned summaries for CSV/JSON, and display
+    summaries (line breaks kept). Structured records are used as they are; only raw
+    single-CV replies (name heading on the first line, summary below) are parsed.
     """
-    if not embeddings_list or len(embeddings_list) < 2:
-        logger.warning("Not enough embeddings to calculate similarities. Need at least 2 (JD + 1 CV).")
-        return []
-    
-    # JD embedding is always the last one
-    jd_embedding = np.array(embeddings_list[-1]).reshape(1, -1)
-    cv_embeddings = [np.array(cv_emb) for cv_emb in embeddings_list[:-1]]
+    names = []
+    clean_summaries = []
+    # Display summaries keep their line breaks; they are turned into HTML (see summary_html)
+    # only for the rows actually served
+    display_summaries = []
+    for summary in summaries:
+        if isinstance(summary, SummaryRecord):
+            name, display_summary = summary.name, summary.summary
+            clean_summary = display_summary
+        else:
+            # The LLM output is expected to have the name on the first line, followed by summary text
+            parts = summary.split('\n', 1)
+            # Removing potential markdown characters from the name line for cleaner display
+            name = parts[0].replace('*', '').replace('#', '').strip()
+            # Handle cases where there's no summary text after the name; for display, keep the whole text
+            clean_summary = parts[1] if len(parts) > 1 else ""
+            display_summary = parts[1] if len(parts) > 1 else summary
+        names.append(name)
+        # Clean up whitespace in the summary part
+        clean_summaries.append(" ".join(clean_summary.split()).strip())
+        display_summaries.append(display_summary)
 
-    similarities = []
-    for cv_emb in cv_embeddings:
-        try:
-            score = cosine_similarity(cv_emb.reshape(1, -1), jd_embedding)[0][0]
-            similarities.append(round(score * 100, 2))
-        except Exception as e:
-            # This shouldn't typically happen with valid embeddings but good for robustness
-            logger.error(f"Error calculating cosine similarity for a CV embedding: {e}", exc_info=True)
-            similarities.append(0.0) # Append a 0 score for the problematic CV
+    return names, clean_summaries, display_summaries
 
-    return similarities
+def summary_html(display_summary: str) -> str:
+    """HTML form of a display summary: newline characters become <br /> tags."""
+    return display_summary.replace('\n', '<br />')
 
-def create_dataframe(names: list[str], filenames: list[str], summaries: list[str], similarities: list[float]) -> pd.DataFrame:
+def calculate_similarities(embeddings_list: list) -> list[float]:
     """
-    Creates a DataFrame with names, filenames, summaries, and similarity scores,
-    then sorts it by score.
+    Calculates cosine similarities between CV embeddings and the JD embedding.
+    The JD embedding is the last element of the list. For several JDs, use
+    similarity.similarity_matrix directly.
     """
-    # Ensure all lists have the same length to prevent DataFrame creation errors
-    min_len = min(len(names), len(filenames), len(summaries), len(similarities))
-    if not (len(names) == len(filenames) == len(summaries) == len(similarities)):
-        logger.warning(
-            f"Mismatched input list lengths for DataFrame creation. "
-            f"Truncating to shortest length ({min_len}). "
-            f"Names: {len(names)}, Filenames: {len(filenames)}, Summaries: {len(summaries)}, Similarities: {len(similarities)}"
-        )
-        names = names[:min_len]
-        filenames = filenames[:min_len]
-        summaries = summaries[:min_len]
-        similarities = similarities[:min_len]
-
+    if embeddings_list is None or len(embeddings_list) < 2:
+        logger.warning("Not enough embeddings to calculate similarities. Need at least 2 (JD + 1 CV).")
+        return []
 
-    df = pd.DataFrame({
-        DATA_COLUMNS["NAME"]: names,
-        DATA_COLUMNS["FILENAME"]: filenames,
-        DATA_COLUMNS["SUMMARY"]: summaries,
-        DATA_COLUMNS["SCORE"]: similarities
-    })
-    
-    # Sort by the score in descending order - Changed to avoid inplace=True for better chaining/immutability
-    df = df.sort_values(by=DATA_COLUMNS["SCORE"], ascending=False)
-    
-    # Format the score for better display
-    df[DATA_COLUMNS["SCORE"]] = df[DATA_COLUMNS["SCORE"]].apply(lambda x: f"{x:.1f}")
-    
-    return df
\ No newline at end of file
+    # JD embedding is always the last one; all CVs are scored with one matrix product
+    embeddings = np.asarray(embeddings_list, dtype=np.float32)
+    return similarity_matrix(embeddings[:-1], embeddings[-1:])[:, 0].tolist()
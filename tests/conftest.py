@@ -0,0 +1,50 @@
+"""Shared test setup: makes the repository root importable (`import app`, `import src...`)."""
+import os
+import sys
+import time
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Tests run offline: fake LLM/embedding providers and no disk cache (set before src.config is imported)
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("CACHE_ENABLED", "false")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+
+# --- Stand-in PDF extraction (src.* is imported lazily, after the environment above is set) ---
+
+def slow_extract(path: str):
+    """Stand-in for extract_pdf_text, run in the worker processes: sleeps for the seconds written in the file."""
+    from src.pdf_text import PdfText
+
+    seconds = float(open(path).read())
+    time.sleep(seconds)
+    return PdfText(f"text of {os.path.basename(path)}", "fake", 1, 1, False, seconds)
+
+
+def timed_pdfs(directory, seconds, prefix: str = "cv"):
+    """Writes one stand-in PDF per value in `seconds` (read by slow_extract); returns their paths."""
+    paths = []
+    for i, value in enumerate(seconds):
+        path = directory / f"{prefix}{i}.pdf"
+        path.write_text(str(value))
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def single_worker_pool(monkeypatch):
+    """An extraction pool with one worker that runs slow_extract."""
+    from src import extraction
+
+    monkeypatch.setattr(extraction, "extract_pdf_text", slow_extract)
+    monkeypatch.setattr(extraction, "PDF_EXTRACTION_WORKERS", 1)
+    extraction.shutdown_extraction_pool()
+    # Start the worker before anything is timed (spawning it takes a moment)
+    extraction._get_pool().submit(time.sleep, 0).result()
+    yield
+    extraction.shutdown_extraction_pool()
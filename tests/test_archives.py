@@ -0,0 +1,90 @@
+import os
+import zipfile
+
+import pytest
+
+from src.archives import ArchiveError, iter_pdf_members, list_pdf_members
+
+MB = 1024 * 1024
+
+
+def _zip(path, members, compression=zipfile.ZIP_DEFLATED) -> str:
+    with zipfile.ZipFile(path, "w", compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def _extract(archive_path, directory, **limits):
+    skipped = []
+    members = list(iter_pdf_members(archive_path, str(directory), skipped=skipped, **limits))
+    return members, skipped
+
+
+def test_lists_only_pdfs_and_skips_resource_forks(tmp_path):
+    archive = _zip(tmp_path / "cvs.zip", {
+        "a.pdf": b"%PDF a", "nested/B.PDF": b"%PDF b", "notes.txt": b"text",
+        "__MACOSX/._a.pdf": b"fork", "nested/._b.pdf": b"fork", "nested/": b"",
+    })
+    assert list_pdf_members(archive) == ["a.pdf", "nested/B.PDF"]
+
+
+def test_member_paths_cannot_escape_the_extraction_directory(tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    archive = _zip(tmp_path / "evil.zip", {"../../evil.pdf": b"%PDF evil", "/abs/path.pdf": b"%PDF abs"})
+    members, _ = _extract(archive, out)
+    assert [member.filename for member in members] == ["evil.pdf", "path.pdf"] # Display names only
+    for member in members:
+        assert os.path.dirname(member.path) == str(out)
+    assert sorted(os.listdir(tmp_path)) == ["evil.zip", "out"]
+
+
+def test_not_a_zip_is_rejected(tmp_path):
+    path = tmp_path / "fake.zip"
+    path.write_bytes(b"not a zip file")
+    with pytest.raises(ArchiveError):
+        list_pdf_members(str(path))
+
+
+def test_too_many_entries_is_rejected(tmp_path, monkeypatch):
+    from src import archives
+    monkeypatch.setattr(archives, "ARCHIVE_MAX_MEMBERS", 2)
+    archive = _zip(tmp_path / "many.zip", {f"{i}.pdf": b"%PDF" for i in range(3)})
+    with pytest.raises(ArchiveError, match="more than 2 entries"):
+        list_pdf_members(archive)
+
+
+def test_declared_sizes_trip_the_zip_bomb_guards(tmp_path):
+    archive = _zip(tmp_path / "bomb.zip", {"bomb.pdf": b"\0" * (2 * MB)})
+    with pytest.raises(ArchiveError, match="expands more than"):
+        list_pdf_members(archive, max_ratio=100)
+    with pytest.raises(ArchiveError, match="expands to more than"):
+        list_pdf_members(archive, max_total_bytes=MB, max_ratio=10 ** 6)
+
+
+def test_real_sizes_are_checked_while_decompressing(tmp_path):
+    # Headers can lie, so iter_pdf_members enforces the same guards on the bytes it reads
+    archive = _zip(tmp_path / "bomb.zip", {"bomb.pdf": b"\0" * (2 * MB)})
+    with pytest.raises(ArchiveError, match="expands more than"):
+        _extract(archive, tmp_path, max_ratio=100, max_member_bytes=10 * MB)
+    assert sorted(os.listdir(tmp_path)) == ["bomb.zip"] # The partial file is removed
+
+    archive = _zip(tmp_path / "big.zip", {"a.pdf": b"\0" * MB, "b.pdf": b"\1" * MB})
+    with pytest.raises(ArchiveError, match="expands to more than"):
+        _extract(archive, tmp_path, max_total_bytes=MB + 1, max_ratio=10 ** 6, max_member_bytes=10 * MB)
+
+
+def test_oversized_members_are_skipped_not_fatal(tmp_path):
+    archive = _zip(tmp_path / "cvs.zip", {"big.pdf": b"x" * 200, "small.pdf": b"%PDF small"})
+    members, skipped = _extract(archive, tmp_path, max_member_bytes=100)
+    assert [member.filename for member in members] == ["small.pdf"]
+    assert skipped == ["big.pdf"]
+
+
+def test_members_are_hashed_and_written_one_by_one(tmp_path):
+    archive = _zip(tmp_path / "cvs.zip", {"a.pdf": b"%PDF a", "b.pdf": b"%PDF a"}, zipfile.ZIP_STORED)
+    members, _ = _extract(archive, tmp_path)
+    assert members[0].content_hash == members[1].content_hash # Duplicates are detected by the caller
+    with open(members[0].path, "rb") as f:
+        assert f.read() == b"%PDF a"
@@ -0,0 +1,68 @@
+import sqlite3
+
+from src import cache as cache_module
+from src.cache import DiskCache
+
+
+def _stored_total(cache: DiskCache) -> int:
+    return cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+def test_running_total_tracks_inserts_and_replacements(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    cache.set("text:a", b"x" * 100)
+    cache.set("text:b", b"x" * 50)
+    cache.set("text:a", b"x" * 10) # Replacing an entry only counts its new size
+    assert cache.get("text:a") == b"x" * 10
+    assert cache.stats()["size_bytes"] == _stored_total(cache) == 60
+
+
+def test_eviction_removes_least_recently_used_down_to_the_target(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    for i in range(10):
+        cache.set(f"text:{i}", b"x" * 100)
+    cache.set("text:new", b"x" * 100) # Over the limit: evicts down to 90% of it
+    stats = cache.stats()
+    assert stats["size_bytes"] == _stored_total(cache) <= 900
+    assert cache.get("text:0") is None
+    assert cache.get("text:new") == b"x" * 100
+
+
+def test_oversized_values_are_not_cached(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+    cache.set("text:big", b"x" * 11)
+    assert cache.get("text:big") is None
+    assert cache.stats()["size_bytes"] == 0
+
+
+def test_hits_only_touch_stale_access_times(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    cache.set("text:a", b"value")
+    cache._conn.execute("UPDATE entries SET last_access = 1000")
+    monkeypatch.setattr(cache_module, "ACCESS_UPDATE_SECONDS", 10 ** 12) # Never stale
+    cache.get("text:a")
+    assert cache._conn.execute("SELECT last_access FROM entries").fetchone()[0] == 1000
+    monkeypatch.setattr(cache_module, "ACCESS_UPDATE_SECONDS", 0)
+    cache.get("text:a")
+    assert cache._conn.execute("SELECT last_access FROM entries").fetchone()[0] > 1000
+
+
+def test_stats_are_batched_until_flushed(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    cache.set("summary:a", b"value")
+    cache.get("summary:a")
+    cache.get("summary:missing")
+    # Not written yet: reads do not open a write transaction for every hit
+    assert cache._conn.execute("SELECT COUNT(*) FROM stats").fetchone()[0] == 0
+    stats = cache.stats() # Flushes pending counts
+    assert stats["process"]["summary"] == {"hits": 1, "misses": 1}
+    assert stats["shared"]["summary"] == {"hits": 1, "misses": 1}
+
+
+def test_total_is_initialized_from_an_existing_database(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "cache.sqlite3"))
+    conn.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+    conn.execute("INSERT INTO entries VALUES ('text:a', x'00', 42, 0)")
+    conn.commit()
+    conn.close()
+    assert DiskCache(str(tmp_path), max_bytes=1000).stats()["size_bytes"] == 42
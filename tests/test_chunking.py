@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from src.chunking import chunk_documents, chunk_text, pooled_similarity
+
+
+def test_short_and_empty_texts():
+    assert chunk_text("  short text  ", chunk_chars=100) == ["short text"]
+    assert chunk_text("   ", chunk_chars=100) == []
+
+
+def test_chunks_overlap_and_cut_between_words():
+    text = " ".join(f"word{i:03d}" for i in range(100)) # 799 characters
+    chunks = chunk_text(text, chunk_chars=100, overlap_chars=20)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    # Cuts fall between words; the overlap means the next chunk starts inside the previous one
+    assert all(len(chunk.split()[-1]) == 7 for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert previous.split()[-1] in current
+    assert chunks[-1].endswith("word099")
+
+
+def test_chunk_documents_counts_chunks_per_text():
+    chunks, counts = chunk_documents(["a" * 250, "", "short"], chunk_chars=100, overlap_chars=0)
+    assert counts.tolist() == [3, 0, 1]
+    assert len(chunks) == 4
+    assert chunks[-1] == "short"
+
+
+def test_pooling_reduces_each_documents_run_of_chunks():
+    jd = np.array([[1.0, 0.0]])
+    chunk_embeddings = np.array([
+        [1.0, 0.0], [0.0, 1.0], # Document 0: one matching chunk, one orthogonal
+        [0.0, 1.0], # Document 2 (document 1 has no chunks)
+        [1.0, 1.0], [-1.0, 0.0], [1.0, 0.0], # Document 3
+    ])
+    counts = np.array([2, 0, 1, 3])
+    assert pooled_similarity(chunk_embeddings, counts, jd, "max")[:, 0].tolist() == [100.0, 0.0, 0.0, 100.0]
+    mean = pooled_similarity(chunk_embeddings, counts, jd, "mean")[:, 0]
+    assert mean.tolist() == [50.0, 0.0, 0.0, pytest.approx(round(100 * (2 ** -0.5) / 3, 2))]
+
+
+def test_pooling_with_several_jds_and_no_chunks():
+    jds = np.array([[1.0, 0.0], [0.0, 1.0]])
+    scores = pooled_similarity(np.array([[1.0, 0.0], [0.0, 1.0]]), np.array([1, 1]), jds, "max")
+    assert scores.tolist() == [[100.0, 0.0], [0.0, 100.0]]
+    assert pooled_similarity(np.zeros((0, 2)), np.array([0, 0]), jds, "max").tolist() == [[0.0, 0.0], [0.0, 0.0]]
+
+
+def test_pooling_rejects_mismatched_inputs():
+    jd = np.array([[1.0, 0.0]])
+    with pytest.raises(ValueError):
+        pooled_similarity(np.ones((2, 2)), np.array([3]), jd, "max")
+    with pytest.raises(ValueError):
+        pooled_similarity(np.ones((1, 2)), np.array([1]), jd, "median")
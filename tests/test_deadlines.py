@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from conftest import timed_pdfs
+from src import jobs, pipeline, summarizer
+from src.deadlines import BudgetSpentError, RequestBudget, budget_var
+from src.jobs import FAILED, JobManager
+from src.providers import FakeSummaryProvider
+from src.rate_limit import AdaptiveRateLimiter
+
+
+def _limiter(requests_per_minute: float = 1) -> AdaptiveRateLimiter:
+    """A limiter whose single request per minute has already been used."""
+    limiter = AdaptiveRateLimiter(requests_per_minute, 0, max_concurrency=8, failure_threshold=3, reset_seconds=30)
+    with limiter.limit():
+        pass
+    return limiter
+
+
+def _hashes(count: int, prefix: str):
+    return [f"{prefix}{i}".ljust(64, "0") for i in range(count)]
+
+
+def test_limiter_stops_waiting_once_the_deadline_passes():
+    limiter = _limiter()
+    token = budget_var.set(RequestBudget(0.3))
+    started = time.monotonic()
+    try:
+        with pytest.raises(BudgetSpentError):
+            with limiter.limit():
+                pass
+    finally:
+        budget_var.reset(token)
+    # The next slot is a minute away; the wait ends at the deadline instead
+    assert time.monotonic() - started < 2
+
+
+def test_async_limiter_fails_fast_for_a_cancelled_budget():
+    limiter = _limiter()
+
+    async def main():
+        budget = RequestBudget()
+        budget.cancel()
+        budget_var.set(budget)
+        async with limiter.alimit():
+            pass
+
+    with pytest.raises(BudgetSpentError):
+        asyncio.run(asyncio.wait_for(main(), timeout=2))
+
+
+def test_deadline_during_extraction_ranks_the_cvs_extracted_in_time(tmp_path, single_worker_pool):
+    # One worker, 0.4s per file: the JD and cv0 start within the 0.6s budget, cv1 and cv2 do not
+    jd_paths = timed_pdfs(tmp_path, [0.4], prefix="jd")
+    cv_paths = timed_pdfs(tmp_path, [0.4] * 3)
+    cv_names = ["cv0.pdf", "cv1.pdf", "cv2.pdf"]
+
+    async def main():
+        budget_var.set(RequestBudget(0.6))
+        return await pipeline.rank_uploaded_cvs(
+            jd_paths, _hashes(1, "j"), ["JD"], cv_paths, _hashes(3, "c"), cv_names, 0, 10, ranking_mode="fast",
+        )
+
+    results = asyncio.run(main())
+    assert results.filenames == ["cv0.pdf"]
+    assert results.not_processed == ["cv1.pdf", "cv2.pdf"]
+    assert results.stats["cvs_uploaded"] == 3
+    assert results.stats["cvs_not_processed"] == 2
+
+
+def test_deadline_during_summarization_ranks_the_cvs_summarized_in_time(tmp_path, monkeypatch, single_worker_pool):
+    class SlowForSomeCVs(FakeSummaryProvider):
+        async def asummarize(self, cv_text):
+            if "slow" in cv_text:
+                await asyncio.sleep(30)
+            return await super().asummarize(cv_text)
+
+    monkeypatch.setattr(summarizer, "get_summary_provider", lambda: SlowForSomeCVs())
+    jd_paths = timed_pdfs(tmp_path, [0], prefix="jd")
+    cv_paths = timed_pdfs(tmp_path, [0, 0], prefix="fast") + timed_pdfs(tmp_path, [0], prefix="slow")
+    cv_names = ["fast0.pdf", "fast1.pdf", "slow0.pdf"]
+
+    async def main():
+        budget_var.set(RequestBudget(2))
+        return await pipeline.rank_uploaded_cvs(jd_paths, _hashes(1, "j"), ["JD"], cv_paths, _hashes(3, "c"), cv_names, 0, 10)
+
+    started = time.monotonic()
+    results = asyncio.run(main())
+    assert time.monotonic() - started < 10
+    assert sorted(results.filenames) == ["fast0.pdf", "fast1.pdf"]
+    assert results.not_processed == ["slow0.pdf"]
+    assert results.stats["cvs_not_processed"] == 1
+    assert results.scores.shape == (2, 1)
+
+
+def test_abandoned_job_is_cancelled_along_with_its_api_waits(monkeypatch):
+    monkeypatch.setattr(jobs, "_WATCH_INTERVAL_SECONDS", 0.05)
+    limiter = _limiter()
+    outcome = {}
+    thread_done = threading.Event()
+
+    def call_api():
+        # Runs in a worker thread, which cancelling the job's task cannot interrupt
+        try:
+            with limiter.limit():
+                outcome["result"] = "called"
+        except BudgetSpentError:
+            outcome["result"] = "stopped"
+        finally:
+            thread_done.set()
+
+    async def work(job):
+        job.touch() # A client was following the job, then went away
+        await asyncio.to_thread(call_api)
+
+    async def main():
+        manager = JobManager(max_concurrent=1, max_queued=1, result_ttl=60, abandon_after=0.2)
+        await manager.start()
+        job = manager.submit(work)
+        try:
+            while not job.finished:
+                await asyncio.sleep(0.02)
+        finally:
+            await manager.stop()
+        return job
+
+    job = asyncio.run(asyncio.wait_for(main(), timeout=10))
+    assert job.status == FAILED
+    assert "client disconnected" in job.error
+    assert job.budget.cancelled
+    # The thread waiting for an API slot gives up instead of sleeping for the minute
+    assert thread_done.wait(3)
+    assert outcome["result"] == "stopped"
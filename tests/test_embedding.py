@@ -0,0 +1,136 @@
+import threading
+import time
+from functools import partial
+
+import numpy as np
+import pytest
+from google.api_core.exceptions import ServiceUnavailable
+from tenacity import wait_none
+
+from src import gemini_embedding
+from src.gemini_embedding import batch_documents, embed_multiple_documents
+from src.providers import FakeEmbeddingProvider
+from src.singleflight import embedding_flight
+
+
+class RecordingProvider(FakeEmbeddingProvider):
+    """Fake embeddings that records each call; `fail(documents, attempt)` may return an error to raise."""
+
+    def __init__(self, fail=None):
+        super().__init__(dimensions=8)
+        self.fail = fail
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, documents):
+        with self._lock:
+            self.calls.append(list(documents))
+            attempt = sum(1 for call in self.calls if call == list(documents))
+        error = self.fail(documents, attempt) if self.fail else None
+        if error is not None:
+            raise error
+        return super().embed_documents(documents)
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = RecordingProvider()
+    monkeypatch.setattr(gemini_embedding, "get_embedding_provider", lambda: provider)
+    # Retries happen at once instead of after a random backoff
+    monkeypatch.setattr(gemini_embedding._embed_documents_with_retry.retry, "wait", wait_none())
+    return provider
+
+
+def test_batch_documents_splits_at_the_document_and_token_limits():
+    documents = [f"{i}" * 40 for i in range(5)] # 10 estimated tokens each
+    assert batch_documents(documents, max_docs=2, max_tokens=1000) == [documents[0:2], documents[2:4], documents[4:5]]
+    assert batch_documents(documents, max_docs=100, max_tokens=30) == [documents[0:3], documents[3:5]]
+    # A document over the token limit on its own still gets sent, in a batch to itself
+    big = "x" * 400
+    assert batch_documents([documents[0], big, documents[1]], max_docs=100, max_tokens=30) == [[documents[0]], [big], [documents[1]]]
+
+
+def test_identical_documents_are_embedded_once_into_a_float32_matrix(provider):
+    embeddings = embed_multiple_documents(["python developer", "registered nurse", "python developer"])
+    assert provider.calls == [["python developer", "registered nurse"]]
+    assert embeddings.shape == (3, 8)
+    assert embeddings.dtype == np.float32
+    assert embeddings.flags["C_CONTIGUOUS"]
+    np.testing.assert_array_equal(embeddings[0], embeddings[2])
+    np.testing.assert_array_equal(embeddings[1], np.asarray(provider._embed("registered nurse"), dtype=np.float32))
+
+
+def test_documents_are_sent_in_batches_at_the_size_limit(provider, monkeypatch):
+    monkeypatch.setattr(gemini_embedding, "batch_documents", partial(batch_documents, max_docs=2))
+    documents = [f"document {i}" for i in range(5)]
+    embeddings = embed_multiple_documents(documents)
+    assert sorted(len(call) for call in provider.calls) == [1, 2, 2]
+    assert sorted(document for call in provider.calls for document in call) == documents
+    assert embeddings.shape == (5, 8)
+
+
+def test_a_failing_batch_is_retried_without_resending_the_others(provider, monkeypatch):
+    monkeypatch.setattr(gemini_embedding, "batch_documents", partial(batch_documents, max_docs=1))
+    # The "flaky" batch fails once and succeeds when retried
+    provider.fail = lambda documents, attempt: ServiceUnavailable("down") if documents == ["flaky"] and attempt == 1 else None
+    embed_multiple_documents(["steady one", "flaky", "steady two"])
+    assert sorted(map(tuple, provider.calls)) == [("flaky",), ("flaky",), ("steady one",), ("steady two",)]
+
+
+def test_a_batch_that_keeps_failing_raises_after_the_others_are_done(provider, monkeypatch):
+    monkeypatch.setattr(gemini_embedding, "batch_documents", partial(batch_documents, max_docs=1))
+    provider.fail = lambda documents, attempt: ValueError("bad input") if documents == ["broken"] else None
+    with pytest.raises(ValueError, match="bad input"):
+        embed_multiple_documents(["steady one", "broken", "steady two"])
+    # Not retryable, so sent once; the other batches were each sent once as well
+    assert sorted(map(tuple, provider.calls)) == [("broken",), ("steady one",), ("steady two",)]
+    assert embedding_flight.in_flight() == 0
+
+
+def _embed_in_thread(documents):
+    """Starts embed_multiple_documents in a thread; returns the thread and a dict that gets its result or error."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = embed_multiple_documents(documents)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.2) # Long enough to join the call claimed by the test
+    return thread, outcome
+
+
+def test_a_caller_joins_the_identical_request_in_flight(provider):
+    key = gemini_embedding._embedding_cache_key("shared document")
+    future, leader = embedding_flight.claim(key)
+    assert leader
+    thread, outcome = _embed_in_thread(["shared document"])
+    vector = np.arange(8, dtype=np.float32)
+    embedding_flight.finish(key, future, vector)
+    thread.join(5)
+    np.testing.assert_array_equal(outcome["result"], vector[np.newaxis])
+    assert provider.calls == []
+
+
+def test_a_failed_request_in_flight_fails_its_waiters(provider):
+    key = gemini_embedding._embedding_cache_key("shared document")
+    future, _ = embedding_flight.claim(key)
+    thread, outcome = _embed_in_thread(["shared document"])
+    embedding_flight.finish(key, future, error=ServiceUnavailable("down"))
+    thread.join(5)
+    assert isinstance(outcome["error"], ServiceUnavailable)
+    assert provider.calls == []
+
+
+def test_a_request_released_when_its_budget_ran_out_is_embedded_by_its_waiter(provider):
+    key = gemini_embedding._embedding_cache_key("shared document")
+    future, _ = embedding_flight.claim(key)
+    thread, outcome = _embed_in_thread(["shared document"])
+    # As embed_multiple_documents does for a batch that failed with BudgetSpentError
+    embedding_flight.release(key, future)
+    thread.join(5)
+    assert outcome["result"].shape == (1, 8)
+    assert provider.calls == [["shared document"]]
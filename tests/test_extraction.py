@@ -0,0 +1,23 @@
+import asyncio
+
+from conftest import timed_pdfs
+from src import extraction
+
+
+def test_time_queued_for_a_worker_does_not_count_towards_the_timeout(tmp_path, single_worker_pool):
+    # Four 0.3s files on one worker take 1.2s in total, well over the per-file timeout
+    paths = timed_pdfs(tmp_path, [0.3] * 4)
+    texts = asyncio.run(extraction.extract_texts_from_pdfs(paths, timeout=1.0))
+    assert texts == [f"text of cv{i}.pdf" for i in range(4)]
+
+
+def test_a_stuck_worker_is_terminated_and_later_files_still_extract(tmp_path, single_worker_pool):
+    pool = extraction._get_pool()
+    workers = list(pool._processes.values())
+    paths = timed_pdfs(tmp_path, [60, 0.1])
+    texts = asyncio.run(extraction.extract_texts_from_pdfs(paths, timeout=1.0))
+    assert texts == ["", "text of cv1.pdf"]
+    assert extraction._get_pool() is not pool
+    for process in workers:
+        process.join(5)
+        assert not process.is_alive()
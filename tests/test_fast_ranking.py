@@ -0,0 +1,49 @@
+import asyncio
+
+import numpy as np
+
+from src import pipeline
+from src.result_store import RankedResults, ResultStore
+from src.summarizer import API_ERROR_MESSAGE
+
+
+def _fast_results(count: int = 3) -> RankedResults:
+    return RankedResults(
+        ["JD"], [""] * count, [f"cv{i}.pdf" for i in range(count)], [""] * count, [""] * count,
+        np.arange(count, 0, -1, dtype=float).reshape(count, 1),
+        unsummarized_texts={i: f"Candidate {i}\nRaw CV text {i}." for i in range(count)},
+    )
+
+
+def test_summaries_are_generated_only_for_the_requested_rows():
+    results = _fast_results()
+    assert asyncio.run(pipeline.summarize_rows(results, [0])) == {}
+    assert results.names[0] == "Candidate 0"
+    assert results.pending_summaries([0, 1, 2]) == [1, 2]
+
+
+def test_failed_summaries_are_shown_once_and_retried(monkeypatch):
+    results = _fast_results()
+
+    async def failing(cv_texts):
+        return [API_ERROR_MESSAGE] * len(cv_texts)
+
+    monkeypatch.setattr(pipeline, "summarize_cvs", failing)
+    placeholders = asyncio.run(pipeline.summarize_rows(results, [0, 1]))
+    assert set(placeholders) == {0, 1}
+    # Shown in this response only; nothing is stored and the rows are still pending
+    assert results.rows_at(0, [0], [1], placeholders)[0].html_summary == API_ERROR_MESSAGE
+    assert results.rows_at(0, [0], [1])[0].html_summary == ""
+    assert results.pending_summaries([0, 1]) == [0, 1]
+
+    monkeypatch.undo()
+    assert asyncio.run(pipeline.summarize_rows(results, [0, 1])) == {}
+    assert results.names[:2] == ["Candidate 0", "Candidate 1"]
+
+
+def test_store_size_follows_lazily_filled_summaries():
+    store = ResultStore(ttl_seconds=60, max_bytes=10 ** 6)
+    results = _fast_results()
+    store.put(results)
+    asyncio.run(pipeline.summarize_rows(results, [0, 1, 2]))
+    assert store.stats()["size_bytes"] == results.estimated_size()
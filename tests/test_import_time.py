@@ -0,0 +1,45 @@
+"""
+Cold-start check: fails if `import app` exceeds a time budget.
+
+Imports the application in fresh interpreters (so nothing is cached in-process) and
+compares the best time against the budget (IMPORT_TIME_BUDGET_SECONDS, default 1.5s).
+Heavy libraries (LangChain/Gemini clients, pandas, sklearn, WeasyPrint, pdfplumber,
+pypdfium2) must stay out of the import path for this to pass.
+"""
+import os
+import subprocess
+import sys
+
+from conftest import REPO_ROOT
+
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", 1.5))
+REPEATS = 3
+
+# Measured inside the child so interpreter start-up itself is not counted
+_CHILD_SCRIPT = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+
+# Modules that should not be loaded by `import app`
+HEAVY_MODULES = ["langchain_google_genai", "pandas", "sklearn", "weasyprint", "pdfplumber", "pypdfium2"]
+
+
+def _run_child(script: str) -> str:
+    env = dict(os.environ)
+    # A placeholder key keeps the output free of the missing-key warning; no API calls are made
+    env.setdefault("GOOGLE_API_KEY", "import-time-check")
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=REPO_ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    return result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ""
+
+
+def test_import_app_is_within_budget():
+    best = min(float(_run_child(_CHILD_SCRIPT)) for _ in range(REPEATS))
+    assert best <= IMPORT_TIME_BUDGET_SECONDS, (
+        f"`import app` took {best:.3f}s (best of {REPEATS}), over the {IMPORT_TIME_BUDGET_SECONDS:.3f}s budget"
+    )
+
+
+def test_import_app_does_not_load_heavy_modules():
+    script = f"import sys, app; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    assert _run_child(script).split() == []
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from src.jobs import DONE, FAILED, RUNNING, Job, JobManager, QueueFullError
+
+
+def _parse(message: str):
+    """(event name, data) of one Server-Sent Event; None for a heartbeat."""
+    if message.startswith(":"):
+        return None
+    name_line, data_line = message.strip().split("\n")
+    return name_line[len("event: "):], json.loads(data_line[len("data: "):])
+
+
+async def _until(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_a_full_queue_rejects_new_jobs():
+    async def main():
+        manager = JobManager(max_concurrent=1, max_queued=1, result_ttl=60)
+        await manager.start()
+        release = asyncio.Event()
+
+        async def work(job):
+            await release.wait()
+
+        try:
+            running = manager.submit(work)
+            await _until(lambda: running.status == RUNNING)
+            queued = manager.submit(work) # Waits for the only worker
+            with pytest.raises(QueueFullError):
+                manager.submit(work)
+            assert manager.stats()["queued"] == 1
+            assert manager.stats()["running"] == 1
+            release.set()
+            await _until(lambda: queued.finished)
+            assert (running.status, queued.status) == (DONE, DONE)
+        finally:
+            await manager.stop()
+
+    asyncio.run(main())
+
+
+def test_cleanup_runs_for_finished_failed_and_discarded_jobs():
+    cleaned = []
+
+    async def main():
+        manager = JobManager(max_concurrent=1, max_queued=5, result_ttl=60)
+        await manager.start()
+        release = asyncio.Event()
+
+        async def succeed(job):
+            return "result"
+
+        async def fail(job):
+            raise ValueError("boom")
+
+        async def block(job):
+            await release.wait()
+
+        done = manager.submit(succeed, cleanup=lambda: cleaned.append("done"))
+        failed = manager.submit(fail, cleanup=lambda: cleaned.append("failed"))
+        await _until(lambda: failed.finished)
+        blocked = manager.submit(block, cleanup=lambda: cleaned.append("blocked"))
+        await _until(lambda: blocked.status == RUNNING)
+        discarded = manager.submit(block, cleanup=lambda: cleaned.append("discarded"))
+        await manager.stop()
+        return done, failed, blocked, discarded
+
+    done, failed, blocked, discarded = asyncio.run(main())
+    assert done.result == "result" and done.status == DONE
+    assert failed.status == FAILED and failed.error == "An unexpected error occurred during processing."
+    assert blocked.status == FAILED
+    assert discarded.status == FAILED and discarded.error == "Server shutting down."
+    assert sorted(cleaned) == ["blocked", "discarded", "done", "failed"]
+
+
+def test_finished_jobs_are_forgotten_after_the_result_ttl():
+    async def main():
+        manager = JobManager(max_concurrent=1, max_queued=5, result_ttl=0.05)
+        await manager.start()
+
+        async def work(job):
+            return None
+
+        try:
+            first = manager.submit(work)
+            await _until(lambda: first.finished)
+            assert manager.get(first.id) is first
+            await asyncio.sleep(0.1)
+            second = manager.submit(work) # Submitting prunes expired jobs
+            assert manager.get(first.id) is None
+            assert manager.get(second.id) is second
+        finally:
+            await manager.stop()
+
+    asyncio.run(main())
+
+
+def test_event_stream_sends_changes_in_order():
+    async def main():
+        job = Job("job")
+        events = []
+
+        async def subscribe():
+            async for message in job.stream_events():
+                events.append(_parse(message))
+
+        subscriber = asyncio.create_task(subscribe())
+        await asyncio.sleep(0.01) # Let the subscriber send its snapshot
+        job._set_status(RUNNING)
+        for done in range(1, 4):
+            job.report("extracted", done, 3)
+            await asyncio.sleep(0.01) # A subscriber that keeps up sees every change
+        job.report("summarized", 3, 3)
+        job._set_status(DONE)
+        await asyncio.wait_for(subscriber, timeout=5)
+        return events
+
+    events = asyncio.run(main())
+    assert events[0] == ("status", {"job_id": "job", "status": "queued", "progress": {}, "error": None})
+    assert [event for event, _ in events[1:]] == ["running", "progress", "progress", "progress", "progress", "done"]
+    assert [(data["stage"], data["done"]) for event, data in events if event == "progress"] == [
+        ("extracted", 1), ("extracted", 2), ("extracted", 3), ("summarized", 3),
+    ]
+
+
+def test_only_the_latest_progress_per_stage_is_kept_and_replayed():
+    async def main():
+        job = Job("job")
+        job._set_status(RUNNING)
+        for done in range(1, 1001):
+            job.report("extracted", done, 1000)
+        job.report("summarized", 10, 1000)
+        job.report("extracted", 1000, 1000) # Moves to the end: the latest change comes last
+        job._set_status(DONE)
+        assert len(job._events) == 4
+        # A subscriber arriving after the job finished still gets the snapshot and the "done" event
+        return [_parse(message) async for message in job.stream_events()]
+
+    events = asyncio.run(main())
+    assert events[0][0] == "status"
+    assert events[0][1]["progress"] == {"extracted": {"done": 1000, "total": 1000}, "summarized": {"done": 10, "total": 1000}}
+    assert [(event, data.get("stage")) for event, data in events[1:]] == [
+        ("running", None), ("progress", "summarized"), ("progress", "extracted"), ("done", None),
+    ]
@@ -0,0 +1,94 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from conftest import REPO_ROOT
+from src import pdf_text
+from src.pdf_text import char_budget, extract_pdf_text, normalize_whitespace
+
+ONE_PAGE_CV = os.path.join(REPO_ROOT, "dataset", "cvs", "Benjamin_Salebaigi.pdf")
+TWO_PAGE_CV = os.path.join(REPO_ROOT, "dataset", "cvs", "Violetta_Nadbitova_CV-1.pdf")
+
+
+@contextlib.contextmanager
+def _broken_engine(source):
+    raise ValueError("cannot parse")
+    yield
+
+
+@contextlib.contextmanager
+def _blank_engine(source):
+    yield 1, lambda index: "   \n"
+
+
+@pytest.fixture
+def test_engines(monkeypatch):
+    monkeypatch.setitem(pdf_text.ENGINES, "broken", _broken_engine)
+    monkeypatch.setitem(pdf_text.ENGINES, "blank", _blank_engine)
+
+
+@pytest.mark.parametrize("engine", ["pdfium", "pdfplumber"])
+def test_each_engine_reads_the_sample_cvs(engine):
+    result = extract_pdf_text(TWO_PAGE_CV, engine=engine, fallback_engine="", max_pages=0, max_chars=0)
+    assert result.engine == engine
+    assert result.text.startswith("Violetta Nadbitova\n")
+    assert (result.pages_read, result.page_count, result.truncated) == (2, 2, False)
+    assert result.seconds >= 0
+
+
+@pytest.mark.parametrize("engine", ["broken", "blank", "no-such-engine"])
+def test_the_fallback_engine_is_used_when_the_first_fails_or_finds_too_little(engine, test_engines):
+    result = extract_pdf_text(ONE_PAGE_CV, engine=engine, fallback_engine="pdfplumber")
+    assert result.engine == "pdfplumber"
+    assert result.text.startswith("Benjamin Salebaigi\n")
+
+
+def test_the_fallback_reads_a_stream_from_the_start(test_engines):
+    with open(ONE_PAGE_CV, "rb") as f:
+        stream = io.BytesIO(f.read())
+    stream.seek(100) # Wherever an earlier reader left it
+    result = extract_pdf_text(stream, engine="blank", fallback_engine="pdfium")
+    assert result.engine == "pdfium"
+    assert result.text.startswith("Benjamin Salebaigi\n")
+
+
+def test_an_unreadable_file_gives_empty_text(tmp_path):
+    path = tmp_path / "not_a.pdf"
+    path.write_bytes(b"This is not a PDF.")
+    result = extract_pdf_text(str(path))
+    assert (result.text, result.engine, result.pages_read) == ("", "", 0)
+
+
+def test_the_page_budget_stops_reading_and_flags_truncation():
+    result = extract_pdf_text(TWO_PAGE_CV, engine="pdfium", fallback_engine="", max_pages=1, max_chars=0)
+    assert (result.pages_read, result.page_count, result.truncated) == (1, 2, True)
+    full = extract_pdf_text(TWO_PAGE_CV, engine="pdfium", fallback_engine="", max_pages=0, max_chars=0)
+    assert full.text.startswith(result.text) and len(result.text) < len(full.text)
+
+
+def test_the_character_budget_cuts_at_a_word_boundary():
+    full = extract_pdf_text(ONE_PAGE_CV, engine="pdfium", fallback_engine="", max_pages=0, max_chars=0)
+    result = extract_pdf_text(ONE_PAGE_CV, engine="pdfium", fallback_engine="", max_pages=0, max_chars=500)
+    assert result.truncated
+    assert 300 < len(result.text) <= 500
+    assert full.text.startswith(result.text)
+    assert full.text[len(result.text)] == " "
+
+
+def test_the_token_budget_limits_characters_like_the_character_budget():
+    assert char_budget(30000, 0) == 30000
+    assert char_budget(30000, 1000) == 4000 # 4 characters per token
+    assert char_budget(0, 100) == 400
+    assert char_budget(0, 0) == 0
+    result = extract_pdf_text(TWO_PAGE_CV, engine="pdfium", fallback_engine="", max_pages=0, max_chars=char_budget(0, 100))
+    assert result.truncated and len(result.text) <= 400
+    # The whole CV fits in the default budgets, so nothing is cut
+    assert not extract_pdf_text(ONE_PAGE_CV).truncated
+
+
+def test_normalize_whitespace():
+    text = "  Jane \t Doe\r\n\r\n\r\n\r\nPython\x00  developer  \x0c\n  \nFastAPI\n\n"
+    assert normalize_whitespace(text) == "Jane Doe\n\nPython developer\n\nFastAPI"
+    assert normalize_whitespace("\n\n  \n") == ""
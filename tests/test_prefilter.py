@@ -0,0 +1,38 @@
+from src.prefilter import bm25_scores, lexical_prefilter
+
+CVS = [
+    "Python developer building Django and FastAPI web services",
+    "Registered nurse with intensive care experience",
+    "Data scientist using Python, pandas and machine learning",
+    "Chef specialising in French pastry",
+    "",
+]
+JD_PYTHON = "Looking for a Python developer to build FastAPI services"
+JD_NURSE = "Hospital seeks an intensive care nurse"
+
+
+def test_bm25_ranks_matching_cvs_first():
+    scores = bm25_scores(CVS, [JD_PYTHON, JD_NURSE])
+    assert scores.shape == (5, 2)
+    assert scores[:, 0].argmax() == 0
+    assert scores[:, 1].argmax() == 1
+    assert scores[4].tolist() == [0.0, 0.0] # Empty CVs score nothing
+
+
+def test_prefilter_keeps_the_top_k_for_each_jd():
+    assert lexical_prefilter(CVS, [JD_PYTHON], top_k=2) == [0, 2]
+    # The union over JDs, in ascending order
+    assert lexical_prefilter(CVS, [JD_NURSE, JD_PYTHON], top_k=1) == [0, 1]
+
+
+def test_prefilter_keeps_everything_when_top_k_covers_the_batch():
+    assert lexical_prefilter(CVS, [JD_PYTHON], top_k=0) == [0, 1, 2, 3, 4]
+    assert lexical_prefilter(CVS, [JD_PYTHON], top_k=10) == [0, 1, 2, 3, 4]
+
+
+def test_min_relative_score_drops_weak_matches_within_the_top_k():
+    assert lexical_prefilter(CVS, [JD_PYTHON], top_k=4, min_relative_score=0.99) == [0]
+
+
+def test_a_batch_of_empty_cvs_scores_zero():
+    assert bm25_scores(["", " "], [JD_PYTHON]).tolist() == [[0.0], [0.0]]
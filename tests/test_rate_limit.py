@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+
+from src import rate_limit
+from src.rate_limit import CLOSED, HALF_OPEN, OPEN, AdaptiveRateLimiter, CircuitOpenError
+
+
+def _limiter(**overrides) -> AdaptiveRateLimiter:
+    options = dict(requests_per_minute=0, tokens_per_minute=0, max_concurrency=8, failure_threshold=3, reset_seconds=30)
+    options.update(overrides)
+    return AdaptiveRateLimiter(**options)
+
+
+def _call(limiter: AdaptiveRateLimiter, error: Exception = None) -> None:
+    """One call through the limiter, failing with `error` if given."""
+    try:
+        with limiter.limit():
+            if error is not None:
+                raise error
+    except (ResourceExhausted, ServiceUnavailable):
+        pass
+
+
+def test_rate_limit_halves_the_concurrency_limit(monkeypatch):
+    limiter = _limiter()
+    _call(limiter, ResourceExhausted("429"))
+    assert limiter.stats()["concurrency_limit"] == 4
+    # A second 429 within the cooldown is the same congestion signal
+    _call(limiter, ResourceExhausted("429"))
+    assert limiter.stats()["concurrency_limit"] == 4
+    monkeypatch.setattr(rate_limit, "_DECREASE_COOLDOWN_SECONDS", 0)
+    for _ in range(5):
+        _call(limiter, ResourceExhausted("429"))
+    assert limiter.stats()["concurrency_limit"] == 1 # Never below one slot
+    assert limiter.stats()["circuit_state"] == CLOSED # Throttling is not an outage
+
+
+def test_successes_grow_the_limit_additively_up_to_the_maximum():
+    limiter = _limiter(max_concurrency=4)
+    _call(limiter, ResourceExhausted("429"))
+    assert limiter.stats()["concurrency_limit"] == 2
+    for _ in range(2):
+        _call(limiter)
+    assert limiter.stats()["concurrency_limit"] == 2 # About +1 per `limit` successes
+    for _ in range(2):
+        _call(limiter)
+    assert limiter.stats()["concurrency_limit"] == 3
+    for _ in range(50):
+        _call(limiter)
+    assert limiter.stats()["concurrency_limit"] == 4
+
+
+def test_circuit_opens_after_consecutive_failures_and_fails_fast():
+    limiter = _limiter(failure_threshold=3)
+    for _ in range(2):
+        _call(limiter, ServiceUnavailable("503"))
+    _call(limiter) # A success resets the count
+    for _ in range(3):
+        _call(limiter, ServiceUnavailable("503"))
+    assert limiter.stats()["circuit_state"] == OPEN
+    with pytest.raises(CircuitOpenError):
+        with limiter.limit():
+            pass
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_half_open_allows_one_trial_call_that_closes_or_reopens_the_circuit():
+    limiter = _limiter(failure_threshold=1, reset_seconds=0)
+    _call(limiter, ServiceUnavailable("503"))
+    assert limiter.stats()["circuit_state"] == HALF_OPEN # Reset period already elapsed
+    with limiter.limit():
+        # Only the trial call goes through while it is in flight
+        with pytest.raises(CircuitOpenError):
+            with limiter.limit():
+                pass
+    assert limiter.stats()["circuit_state"] == CLOSED
+
+    _call(limiter, ServiceUnavailable("503"))
+    _call(limiter, ServiceUnavailable("503")) # The failed trial re-opens the circuit
+    assert limiter._state == OPEN
+
+
+def test_async_calls_wait_for_a_free_slot():
+    limiter = _limiter(max_concurrency=1)
+    running = peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with limiter.alimit():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(3)))
+
+    asyncio.run(main())
+    assert peak == 1
+    assert limiter.stats()["in_flight"] == 0
+    assert limiter.stats()["calls"] == 3
+
+
+def test_request_budget_makes_callers_wait():
+    limiter = _limiter(requests_per_minute=60) # One request per second once the bucket is empty
+    limiter._requests.available = 0
+    wait, _ = limiter._try_acquire(1)
+    assert 0 < wait <= 1
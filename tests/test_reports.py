@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from src import reports
+from src.cache import DiskCache
+from src.result_store import RankedRow
+
+ROWS = [RankedRow(1, "id1", "Jane Doe", "jane.pdf", "Python developer.", "Python developer.", 91.5)]
+
+
+def _weasyprint_available() -> bool:
+    try:
+        import weasyprint # noqa: F401 (needs the Pango system libraries)
+    except (ImportError, OSError):
+        return False
+    return True
+
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=10 ** 6)
+    monkeypatch.setattr(reports, "get_cache", lambda: cache)
+    return cache
+
+
+def test_cached_reports_are_served_without_rendering(disk_cache):
+    disk_cache.set(reports._report_cache_key(ROWS), b"%PDF cached")
+    assert asyncio.run(reports.render_pdf_report_async(ROWS)) == b"%PDF cached"
+    assert reports._executor is None # The process pool was never started
+
+
+def test_report_cache_key_depends_on_the_rows():
+    other = [ROWS[0]._replace(score=50.0)]
+    assert reports._report_cache_key(ROWS) == reports._report_cache_key(list(ROWS))
+    assert reports._report_cache_key(ROWS) != reports._report_cache_key(other)
+
+
+@pytest.mark.skipif(not _weasyprint_available(), reason="WeasyPrint system libraries are not installed")
+def test_reports_are_rendered_in_the_process_pool_and_cached(disk_cache):
+    try:
+        pdf_bytes = asyncio.run(reports.render_pdf_report_async(ROWS))
+    finally:
+        reports.shutdown_report_pool()
+    assert pdf_bytes.startswith(b"%PDF")
+    assert disk_cache.get(reports._report_cache_key(ROWS)) == pdf_bytes
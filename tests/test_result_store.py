@@ -0,0 +1,111 @@
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from src.result_store import RankedResults, ResultStore, result_store
+
+# Scores against one JD; rows 1 and 3 tie
+SCORES = [40.0, 90.0, 10.0, 90.0, 70.0]
+FILENAMES = ["e.pdf", "b.pdf", "a.pdf", "d.pdf", "C.pdf"]
+
+
+def _results(scores=SCORES, filenames=FILENAMES, **kwargs) -> RankedResults:
+    count = len(scores)
+    return RankedResults(
+        ["JD"], [f"Name {i}" for i in range(count)], list(filenames),
+        [f"Summary {i}" for i in range(count)], [f"Line {i}\nmore" for i in range(count)],
+        np.array(scores).reshape(count, 1), **kwargs,
+    )
+
+
+def test_select_filters_and_orders_best_first_keeping_upload_order_for_ties():
+    results = _results()
+    assert results.select(0, 0, 10).tolist() == [1, 3, 4, 0, 2]
+    assert results.select(0, 50, 10).tolist() == [1, 3, 4]
+    assert results.select(0, 0, 2).tolist() == [1, 3]
+    assert results.select(0, 100, 10).tolist() == []
+
+
+def test_pages_by_score_continue_each_other():
+    results = _results()
+    first, first_ranks, total = results.page(0, 0, 10, offset=0, limit=2)
+    second, second_ranks, _ = results.page(0, 0, 10, offset=2, limit=2)
+    last, last_ranks, _ = results.page(0, 0, 10, offset=4, limit=2)
+    assert total == 5
+    assert first.tolist() + second.tolist() + last.tolist() == results.select(0, 0, 10).tolist()
+    assert first_ranks.tolist() + second_ranks.tolist() + last_ranks.tolist() == [1, 2, 3, 4, 5]
+
+
+def test_page_offsets_past_the_end_are_empty():
+    results = _results()
+    for sort in ("score", "score_asc", "filename"):
+        indices, ranks, total = results.page(0, 0, 10, sort=sort, offset=99, limit=5)
+        assert (indices.tolist(), ranks.tolist(), total) == ([], [], 5)
+    # max_results caps the total, so an offset inside the CVs can still be past the end
+    indices, _, total = results.page(0, 0, 3, offset=3, limit=5)
+    assert (indices.tolist(), total) == ([], 3)
+
+
+def test_page_with_nothing_selected_or_negative_inputs():
+    results = _results()
+    assert results.page(0, 100, 10)[2] == 0
+    indices, ranks, total = results.page(0, 0, 10, offset=-5, limit=-1)
+    assert (indices.tolist(), ranks.tolist(), total) == ([], [], 5)
+
+
+def test_page_sorted_ascending_and_by_filename_keeps_score_ranks():
+    results = _results()
+    indices, ranks, _ = results.page(0, 0, 10, sort="score_asc", offset=0, limit=2)
+    assert (indices.tolist(), ranks.tolist()) == ([2, 0], [5, 4])
+    indices, ranks, _ = results.page(0, 0, 10, sort="filename", offset=1, limit=3)
+    assert [FILENAMES[i] for i in indices] == ["b.pdf", "C.pdf", "d.pdf"] # Case-insensitive
+    assert ranks.tolist() == [1, 3, 2]
+    # Sorting only applies within the filtered selection
+    indices, _, total = results.page(0, 50, 2, sort="filename")
+    assert (indices.tolist(), total) == ([1, 3], 2)
+
+
+def test_unknown_sort_is_rejected():
+    with pytest.raises(ValueError):
+        _results().page(0, 0, 10, sort="name")
+
+
+def test_rows_build_html_summaries_for_the_page_only():
+    rows = _results(cv_ids=[f"id{i}" for i in range(5)]).rows_at(0, [4], [3])
+    assert rows[0].cv_id == "id4" and rows[0].rank == 3 and rows[0].score == 70.0
+    assert rows[0].html_summary == "Line 4<br />more"
+
+
+def test_store_evicts_least_recently_used_results_and_expires_old_ones():
+    store = ResultStore(ttl_seconds=60, max_bytes=_results().estimated_size() * 2)
+    first, second = store.put(_results()), store.put(_results())
+    store.get(first) # Now the most recently used
+    store.put(_results())
+    assert store.get(second) is None
+    assert store.get(first) is not None
+
+    expiring = ResultStore(ttl_seconds=0, max_bytes=10 ** 6)
+    result_id = expiring.put(_results())
+    time.sleep(0.01)
+    assert expiring.get(result_id) is None
+    assert expiring.stats()["size_bytes"] == 0
+
+
+def test_rows_api_reports_next_offset_until_the_last_page():
+    result_id = result_store.put(_results(min_score=0, max_results=5))
+    with TestClient(app_module.app) as client:
+        first = client.get(f"/results/{result_id}/rows", params={"limit": 2}).json()
+        assert (first["total"], first["next_offset"], len(first["rows"])) == (5, 2, 2)
+        last = client.get(f"/results/{result_id}/rows", params={"offset": 4, "limit": 2}).json()
+        assert (last["next_offset"], len(last["rows"])) == (None, 1)
+        exact = client.get(f"/results/{result_id}/rows", params={"offset": 3, "limit": 2}).json()
+        assert exact["next_offset"] is None # A page ending exactly at the total is the last one
+        past = client.get(f"/results/{result_id}/rows", params={"offset": 50}).json()
+        assert (past["next_offset"], past["rows"]) == (None, [])
+        assert client.get(f"/results/{result_id}/rows", params={"offset": -1}).status_code == 400
+        assert client.get(f"/results/{result_id}/rows", params={"sort": "bogus"}).status_code == 400
+        assert client.get(f"/results/{result_id}/rows", params={"jd": 1}).status_code == 404
+        assert client.get("/results/unknown/rows").status_code == 404
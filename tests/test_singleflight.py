@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.singleflight import SingleFlight
+
+
+def test_concurrent_async_calls_share_one_result():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("key", work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert calls == 1
+    assert flight.in_flight() == 0
+
+
+def test_errors_are_passed_to_every_waiter():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_cancelled_leader_hands_the_call_to_a_waiter():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("key", work))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.ado("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await waiter
+
+    assert asyncio.run(main()) == 2 # The waiter repeated the call instead of failing
+    assert flight.in_flight() == 0
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("key", work))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.ado("key", work))
+        await asyncio.sleep(0.005)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_threads_join_the_call_in_flight():
+    flight = SingleFlight("test")
+    started, proceed = threading.Event(), threading.Event()
+    calls = 0
+    results = []
+
+    def work():
+        nonlocal calls
+        calls += 1
+        started.set()
+        proceed.wait(5)
+        return "result"
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", work)))
+    leader.start()
+    started.wait(5)
+    joiner = threading.Thread(target=lambda: results.append(flight.do("key", work)))
+    joiner.start()
+    time.sleep(0.05) # Let the joiner reach the in-flight call
+    proceed.set()
+    leader.join(5)
+    joiner.join(5)
+    assert results == ["result", "result"]
+    assert calls == 1
+    assert flight.in_flight() == 0
+
+
+def test_released_claim_lets_the_next_caller_lead():
+    flight = SingleFlight("test")
+    future, leader = flight.claim("key")
+    assert leader
+    assert flight.claim("key", count=False) == (future, False)
+    flight.release("key", future)
+    assert flight.do("key", lambda: "fresh") == "fresh"
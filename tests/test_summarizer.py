@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import pytest
+
+from src.summarizer import API_ERROR_MESSAGE, is_failed_summary, parse_batch_reply, summarize_cvs
+from src.utils import SummaryRecord, parse_summaries, summary_text
+
+
+def test_parse_batch_reply_returns_structured_records():
+    reply = json.dumps([
+        {"id": "1", "name": "Ada  *Lovelace*\nPhD", "summary": " First paragraph.\n\nSecond. "},
+        {"id": "2", "name": "", "summary": "No name given."},
+        {"id": "9", "name": "Not asked for", "summary": "Ignored."},
+    ])
+    assert parse_batch_reply(reply, ["1", "2"]) == {"1": SummaryRecord("Ada *Lovelace* PhD", "First paragraph.\n\nSecond.")}
+
+
+def test_parse_batch_reply_accepts_fenced_json_and_rejects_non_arrays():
+    assert parse_batch_reply('```json\n[{"id": "1", "name": "A", "summary": "B"}]\n```', ["1"]) == {"1": SummaryRecord("A", "B")}
+    with pytest.raises(ValueError):
+        parse_batch_reply('{"id": "1"}', ["1"])
+    with pytest.raises(ValueError):
+        parse_batch_reply("not json", ["1"])
+
+
+def test_parse_summaries_uses_records_as_they_are_and_parses_raw_replies():
+    names, clean, display = parse_summaries([
+        SummaryRecord("Jane *Star* Doe", "Line one.\nLine two."),
+        "**John Smith**\nSummary  text\nhere.",
+        API_ERROR_MESSAGE,
+    ])
+    assert names == ["Jane *Star* Doe", "John Smith", API_ERROR_MESSAGE.replace("*", "")]
+    assert clean == ["Line one. Line two.", "Summary text here.", ""]
+    assert display == ["Line one.\nLine two.", "Summary  text\nhere.", API_ERROR_MESSAGE]
+    assert summary_text(SummaryRecord("Jane", "Text")) == "Jane\nText"
+
+
+def test_batched_summaries_come_back_as_records():
+    cv_texts = [f"Candidate {i}\nPython developer with {i} years of experience." for i in range(3)]
+    summaries = asyncio.run(summarize_cvs(cv_texts, batch=True))
+    assert all(isinstance(summary, SummaryRecord) for summary in summaries)
+    assert [summary.name for summary in summaries] == ["Candidate 0", "Candidate 1", "Candidate 2"]
+    assert not any(is_failed_summary(summary) for summary in summaries)
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.talent_pool import TalentPool
+
+
+def _records(names):
+    return [{"name": name, "filename": f"{name}.pdf", "summary": f"Summary of {name}", "content_hash": f"hash-{name}"} for name in names]
+
+
+def _vectors(count: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def test_add_skips_content_already_pooled(tmp_path):
+    pool = TalentPool(str(tmp_path))
+    vectors = _vectors(4)
+    assert pool.add(_records(["a", "b", "c"]), vectors[:3]) == 3
+    # "b" is pooled already and "d" appears twice in the same call
+    assert pool.add(_records(["b", "d", "d"]), vectors[[1, 3, 3]]) == 1
+    assert pool.size == 4
+    assert pool.contains("hash-d") and not pool.contains("hash-e")
+    assert pool.add([], []) == 0
+    with pytest.raises(ValueError):
+        pool.add(_records(["e"]), _vectors(1, dim=8))
+
+
+def test_a_reopened_pool_reads_its_rows_from_disk(tmp_path):
+    vectors = _vectors(5)
+    pool = TalentPool(str(tmp_path))
+    pool.add(_records(["a", "b", "c", "d", "e"]), vectors)
+
+    reopened = TalentPool(str(tmp_path)) # As after a restart
+    assert reopened.size == 5
+    assert reopened.contains("hash-c")
+    best = reopened.search(vectors[2], top_k=1)[0]
+    assert best["name"] == "c" and best["score"] == pytest.approx(100, abs=0.01)
+    assert reopened.search(vectors[2], top_k=5) == pool.search(vectors[2], top_k=5)
+
+
+def test_rows_left_half_written_by_a_crash_are_dropped(tmp_path):
+    vectors = _vectors(4)
+    TalentPool(str(tmp_path)).add(_records(["a", "b"]), vectors[:2])
+    # A crash after writing one more embedding, and part of its record, but not the rest
+    with open(tmp_path / "embeddings.f32", "ab") as f:
+        f.write((vectors[2] / np.linalg.norm(vectors[2])).tobytes())
+    with open(tmp_path / "records.jsonl", "a") as f:
+        f.write('{"name": "lost", "filen')
+
+    pool = TalentPool(str(tmp_path))
+    assert pool.size == 2 # Only rows with both halves count
+    assert pool.add(_records(["c", "d"]), vectors[2:4]) == 2
+    assert os.path.getsize(tmp_path / "embeddings.f32") == 4 * 16 * 4
+    reopened = TalentPool(str(tmp_path))
+    assert reopened.size == 4
+    # Every row still lines up with its own record
+    for i, name in enumerate(["a", "b", "c", "d"]):
+        assert reopened.search(vectors[i], top_k=1)[0]["name"] == name
+
+
+def test_ivf_search_matches_exact_search_when_every_partition_is_probed(tmp_path):
+    vectors = _vectors(300, seed=1)
+    pool = TalentPool(str(tmp_path))
+    pool.add(_records([f"cv{i}" for i in range(250)]), vectors[:250])
+    assert pool.build_index(n_lists=8) == 8
+    # Rows added after the build are assigned to their nearest partition
+    pool.add(_records([f"cv{i}" for i in range(250, 300)]), vectors[250:])
+
+    for query in _vectors(5, seed=2):
+        exact = pool.search(query, top_k=10, approximate=False)
+        approximate = pool.search(query, top_k=10, approximate=True, n_probes=8)
+        assert [row["name"] for row in approximate] == [row["name"] for row in exact]
+        assert [row["score"] for row in approximate] == pytest.approx([row["score"] for row in exact])
+    # A reopened pool loads the saved index too
+    reopened = TalentPool(str(tmp_path))
+    assert reopened.search(vectors[0], top_k=3, approximate=True, n_probes=8) == pool.search(vectors[0], top_k=3, approximate=False)
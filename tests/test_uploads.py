@@ -0,0 +1,57 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+
+from src.uploads import ByteBudget, UploadTooLargeError, save_upload
+
+
+def _save(tmp_path, data: bytes, filename: str = "cv.pdf", max_file_bytes: int = 1000, budget=None, chunk_size: int = 16):
+    upload = UploadFile(io.BytesIO(data), filename=filename)
+    return asyncio.run(save_upload(upload, str(tmp_path), max_file_bytes, budget, chunk_size=chunk_size))
+
+
+def test_byte_budget_allows_exactly_its_limit():
+    budget = ByteBudget(100)
+    budget.consume(60, "a.pdf")
+    budget.consume(40, "b.pdf")
+    assert budget.used == 100
+    with pytest.raises(UploadTooLargeError) as error:
+        budget.consume(1, "c.pdf")
+    assert error.value.per_request
+    assert error.value.filename == "c.pdf"
+
+
+def test_save_upload_writes_and_hashes_the_content(tmp_path):
+    data = b"%PDF-1.4 " * 20
+    path, content_hash = _save(tmp_path, data)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert content_hash == hashlib.sha256(data).hexdigest()
+
+
+def test_oversized_file_is_cut_off_and_removed(tmp_path):
+    with pytest.raises(UploadTooLargeError) as error:
+        _save(tmp_path, b"x" * 101, max_file_bytes=100)
+    assert not error.value.per_request
+    assert os.listdir(tmp_path) == []
+
+
+def test_request_budget_is_shared_across_files(tmp_path):
+    budget = ByteBudget(150)
+    _save(tmp_path, b"x" * 100, budget=budget)
+    with pytest.raises(UploadTooLargeError) as error:
+        _save(tmp_path, b"y" * 100, filename="second.pdf", budget=budget)
+    assert error.value.per_request
+    assert len(os.listdir(tmp_path)) == 1 # Only the first file remains
+
+
+def test_filename_cannot_escape_the_upload_directory(tmp_path):
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    path, _ = _save(upload_dir, b"data", filename="../../etc/passwd.pdf")
+    assert os.path.dirname(path) == str(upload_dir)
+    assert os.listdir(tmp_path) == ["uploads"]